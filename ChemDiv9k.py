@@ -1,8 +1,9 @@
 import pandas as pd
+from masterlists import MASTER_LISTS
 
 # Read the Excel file
 input_file = r"D:\0000-UHN\03-DataAndCodes\Data\ASMS\EASMS-7March\MasterLists\Chemdiv+Chiral6k_15k.xlsx"  # Change to your actual file name
-df = pd.read_excel(input_file)
+df = MASTER_LISTS.read(input_file)  # Parquet copy of the workbook after the first run
 
 # Select the first 9007 rows
 df_selected = df.iloc[:9007]
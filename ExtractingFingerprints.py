@@ -1,31 +1,80 @@
 import os
+import glob
+import json
+import shutil
 import pandas as pd
 import numpy as np
-from rdkit import Chem
-from rdkit.Chem import Descriptors
+import pyarrow as pa
+import pyarrow.parquet as pq
 from fingerprints import HitGenMACCS, HitGenECFP4, HitGenECFP6, HitGenFCFP4, HitGenFCFP6, HitGenRDK, HitGenAvalon, HitGenTopTor, HitGenAtomPair
+from fingerprint_extraction import featurize, fingerprint_to_string, fingerprint_to_arrays
+from fingerprint_storage import fingerprint_column_to_arrow
 
-def compute_molecular_properties(smiles):
-    mol = Chem.MolFromSmiles(smiles)
-    if mol:
-        mw = Descriptors.MolWt(mol)
-        alogp = Descriptors.MolLogP(mol)
+def add_fingerprint_columns(df, fingerprints, n_jobs=1, cache=None, fp_format="string", row_offset=0, num_threads=1):
+    """
+    Appends one column per fingerprint to a DataFrame with a 'smiles' column.
+
+    Args:
+        df (pd.DataFrame): Input rows.
+        fingerprints (dict): Fingerprint name -> fingerprint object.
+        n_jobs (int): Number of worker processes used for fingerprinting.
+        cache (FingerprintCache or None): Persistent fingerprint cache.
+        fp_format (str): "string" (comma-joined, CSV friendly) or "array" (one NumPy array per row, None if failed).
+        row_offset (int): Position of the first row in the input file, used in the warning for failed SMILES.
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use per process.
+
+    Returns:
+        pd.DataFrame: The input rows followed by the fingerprint columns.
+    """
+    # Generate fingerprint columns (sharded across n_jobs worker processes when n_jobs > 1)
+    fp_arrays, _, valid = featurize(
+        df['smiles'], fingerprints, compute_properties=False, n_jobs=n_jobs, cache=cache, num_threads=num_threads
+    )
+    if not valid.all():
+        failed_rows = (row_offset + np.flatnonzero(~valid)).tolist()
+        print(f"Warning: {(~valid).sum()} SMILES could not be parsed (rows {failed_rows}).")
+
+    # Create a DataFrame from fingerprint data
+    if fp_format == "string":
+        fingerprint_df = pd.DataFrame(
+            {
+                fp_name: [fingerprint_to_string(row, row_valid) for row, row_valid in zip(fp_array, valid)]
+                for fp_name, fp_array in fp_arrays.items()
+            },
+            index=df.index
+        )
     else:
-        mw = np.nan
-        alogp = np.nan
-    return mw, alogp
-
-def generate_fingerprints(smiles, fps_dict):
-    fp_data = {}
-    for fp_name, fp_class in fps_dict.items():
-        try:
-            fp_array = fp_class.generate_fps(smis=[smiles]).flatten()
-            fp_data[fp_name] = ','.join(map(str, fp_array))
-        except Exception:
-            fp_data[fp_name] = ','.join(['nan'] * fp_class._dimension)
-    return fp_data
-
-def process_file(input_file, output_file, fingerprints, nrows=None):
+        fingerprint_df = pd.DataFrame(
+            {fp_name: fingerprint_to_arrays(fp_array, valid) for fp_name, fp_array in fp_arrays.items()},
+            index=df.index
+        )
+
+    # Concatenate fingerprint data with the main DataFrame
+    return pd.concat([df, fingerprint_df], axis=1)
+
+def process_file(input_file, output_file, fingerprints, nrows=None, n_jobs=1, cache=None, chunksize=None, num_threads=1):
+    """
+    Adds fingerprint columns to a CSV file with a 'smiles' column.
+
+    Args:
+        input_file (str): Input CSV file.
+        output_file (str): Output file. Written as CSV, or as Parquet (typed fingerprint columns) in streaming mode
+            when it ends with '.parquet'.
+        fingerprints (dict): Fingerprint name -> fingerprint object.
+        nrows (int or None): Number of rows to read (None reads the whole file).
+        n_jobs (int): Number of worker processes used for fingerprinting.
+        cache (FingerprintCache or None): Persistent fingerprint cache.
+        chunksize (int or None): If given, stream the input in chunks of this many rows so memory stays bounded,
+            see process_file_streaming.
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use per process.
+    """
+    if chunksize is not None:
+        process_file_streaming(
+            input_file, output_file, fingerprints, chunksize, nrows=nrows, n_jobs=n_jobs, cache=cache,
+            num_threads=num_threads
+        )
+        return
+
     # Read the file
     df = pd.read_csv(input_file, nrows=nrows)
 
@@ -34,23 +83,146 @@ def process_file(input_file, output_file, fingerprints, nrows=None):
         lambda smi: pd.Series(compute_molecular_properties(smi))
     )'''
 
-    # Generate fingerprint columns
-    fingerprint_data = []
-    for smiles in df['smiles']:
-        fps = generate_fingerprints(smiles, fingerprints)
-        fingerprint_data.append(fps)
-
-    # Create a DataFrame from fingerprint data
-    fingerprint_df = pd.DataFrame(fingerprint_data)
-
-    # Concatenate fingerprint data with the main DataFrame
-    df = pd.concat([df, fingerprint_df], axis=1)
+    df = add_fingerprint_columns(df, fingerprints, n_jobs=n_jobs, cache=cache, num_threads=num_threads)
 
     # Save the new DataFrame to a CSV file
     df.to_csv(output_file, index=False)
 
     print(f"The updated file with fingerprints has been saved as '{output_file}'")
 
+def _checkpoint_path(output_file):
+    return output_file + ".checkpoint.json"
+
+def _parts_dir(output_file):
+    return output_file + ".parts"
+
+def _write_checkpoint(output_file, checkpoint):
+    # write-then-rename, so a crash never leaves a half written checkpoint behind
+    tmp_path = _checkpoint_path(output_file) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, _checkpoint_path(output_file))
+
+def _load_checkpoint(output_file, job):
+    """
+    Returns the checkpoint of an interrupted run of the same job, or None to start from scratch.
+    """
+    path = _checkpoint_path(output_file)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("job") != job:
+        print(f"Warning: Checkpoint '{path}' belongs to a different job (input file or settings changed). Starting over.")
+        return None
+    return checkpoint
+
+def _merge_parquet_parts(parts, output_file):
+    """
+    Concatenates the per-chunk Parquet part files into one file, one row group per chunk.
+    """
+    schema = pa.unify_schemas([pq.read_schema(part) for part in parts], promote_options="permissive")
+    with pq.ParquetWriter(output_file, schema) as writer:
+        for part in parts:
+            writer.write_table(pq.read_table(part).cast(schema))
+
+def process_file_streaming(input_file, output_file, fingerprints, chunksize, nrows=None, n_jobs=1, cache=None,
+                           num_threads=1):
+    """
+    Streaming version of process_file: the input is read and fingerprinted chunksize rows at a time, so memory
+    stays bounded by one chunk, and every chunk is written out before the next one is read.
+
+    CSV output is appended block by block. Parquet output (output_file ending with '.parquet') is written as one
+    part file per chunk and merged into a single file with one row group per chunk at the end.
+
+    Progress is checkpointed to '<output_file>.checkpoint.json' after each chunk. Running the same job again after
+    an interruption resumes from the last completed chunk (anything written after it is discarded); the checkpoint
+    is removed once the output is complete.
+
+    Args:
+        input_file (str): Input CSV file with a 'smiles' column.
+        output_file (str): Output CSV or Parquet file.
+        fingerprints (dict): Fingerprint name -> fingerprint object.
+        chunksize (int): Number of rows per chunk.
+        nrows (int or None): Number of rows to read (None reads the whole file).
+        n_jobs (int): Number of worker processes used for fingerprinting each chunk.
+        cache (FingerprintCache or None): Persistent fingerprint cache.
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use per process.
+    """
+    to_parquet = output_file.lower().endswith(".parquet")
+    input_stat = os.stat(input_file)
+    job = {
+        "input_file": os.path.abspath(input_file),
+        "input_size": input_stat.st_size,
+        "input_mtime": input_stat.st_mtime,
+        "fingerprints": {fp_name: fp_class.to_dict() for fp_name, fp_class in fingerprints.items()},
+        "chunksize": chunksize,
+        "nrows": nrows,
+        "format": "parquet" if to_parquet else "csv",
+    }
+
+    checkpoint = _load_checkpoint(output_file, job)
+    if checkpoint is None:
+        checkpoint = {"job": job, "rows_done": 0, "chunks_done": 0, "output_bytes": 0}
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        shutil.rmtree(_parts_dir(output_file), ignore_errors=True)
+    else:
+        print(f"Resuming '{output_file}' after {checkpoint['rows_done']} rows")
+
+    parts_dir = _parts_dir(output_file)
+    if to_parquet:
+        os.makedirs(parts_dir, exist_ok=True)
+        # part files of a chunk that was not checkpointed are incomplete
+        for part in sorted(glob.glob(os.path.join(parts_dir, "part-*.parquet")))[checkpoint["chunks_done"]:]:
+            os.remove(part)
+    elif os.path.exists(output_file):
+        # drop a block that was only partly written when the job was interrupted
+        with open(output_file, "r+b") as f:
+            f.truncate(checkpoint["output_bytes"])
+
+    rows_done = checkpoint["rows_done"]
+    remaining = None if nrows is None else max(nrows - rows_done, 0)
+    if remaining != 0:
+        reader = pd.read_csv(
+            input_file, chunksize=chunksize, nrows=remaining, skiprows=range(1, rows_done + 1)
+        )
+        for chunk in reader:
+            chunk = chunk.reset_index(drop=True)
+            chunk = add_fingerprint_columns(
+                chunk, fingerprints, n_jobs=n_jobs, cache=cache, fp_format="array" if to_parquet else "string",
+                row_offset=checkpoint["rows_done"], num_threads=num_threads
+            )
+
+            if to_parquet:
+                fp_columns = list(fingerprints)
+                table = pa.Table.from_pandas(chunk.drop(columns=fp_columns), preserve_index=False)
+                for fp_name in fp_columns:
+                    # typed from the fingerprint class, so a chunk where no SMILES parses is written as all null
+                    fp_column = fingerprint_column_to_arrow(
+                        chunk[fp_name], fingerprints[fp_name]._dimension, fingerprints[fp_name].fp_dtype()
+                    )
+                    table = table.append_column(fp_name, fp_column)
+                part = os.path.join(parts_dir, f"part-{checkpoint['chunks_done']:06d}.parquet")
+                pq.write_table(table, part)
+            else:
+                chunk.to_csv(output_file, mode="a", index=False, header=checkpoint["rows_done"] == 0)
+                checkpoint["output_bytes"] = os.path.getsize(output_file)
+
+            checkpoint["rows_done"] += len(chunk)
+            checkpoint["chunks_done"] += 1
+            _write_checkpoint(output_file, checkpoint)
+            print(f"{checkpoint['rows_done']} rows done")
+
+    if to_parquet:
+        parts = sorted(glob.glob(os.path.join(parts_dir, "part-*.parquet")))
+        if parts:
+            _merge_parquet_parts(parts, output_file)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    os.remove(_checkpoint_path(output_file))
+
+    print(f"The updated file with fingerprints has been saved as '{output_file}'")
+
 def main():
     # Define fingerprint classes
     # You can also extract the binary versions (look at the fingerprints.py )
@@ -67,9 +239,11 @@ def main():
     }
 
     nrows = None
+    n_jobs = 1  # raise to the number of cores for library-scale files
+    chunksize = None  # e.g. 20000 to stream library-scale files chunk by chunk (resumable after an interruption)
     input_file = r"D:\0000-UHN\03-DataAndCodes\AIRCHECK-workflow\SimpleML\Bootcamp\Data\21Feb\ASMS_hits_clustered.csv"
     output_file = r"D:\0000-UHN\03-DataAndCodes\AIRCHECK-workflow\SimpleML\Bootcamp\Data\21Feb\ASMS_hits_clustered_with_fingerprints.csv"
-    process_file(input_file, output_file, fingerprint_classes, nrows=nrows)
+    process_file(input_file, output_file, fingerprint_classes, nrows=nrows, n_jobs=n_jobs, chunksize=chunksize)
 
     '''input_file = "James_hits.csv"
     output_file = "James_hits_fingerprints.csv" 
@@ -86,7 +260,7 @@ def main():
     # Example usage
     input_file = "ASMS_460K.csv"
     output_file = "ASMS_460K_with_ECFP6.csv"
-    process_file(input_file, output_file, fingerprint_classes, nrows=nrows)
+    process_file(input_file, output_file, fingerprint_classes, nrows=nrows, n_jobs=32, chunksize=20000)
     '''
 
 
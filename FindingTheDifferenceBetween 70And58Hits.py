@@ -6,7 +6,7 @@ Created on Mon Mar  3 11:16:42 2025
 """
 
 import pandas as pd
-from rdkit import Chem
+from canonicalization import CANONICALIZER
 
 # File paths
 csv_file = r"D:\0000-UHN\03-DataAndCodes\AIRCHECK-workflow\SimpleML\Bootcamp\ExtractFingerPrints_Bootcamp\58Hits.csv"
@@ -23,16 +23,9 @@ smiles_col = "SMILES (Compounds)"
 if smiles_col not in csv_df.columns or smiles_col not in excel_df.columns:
     raise ValueError(f"Column '{smiles_col}' not found in one of the files.")
 
-# Function to convert SMILES to canonical form
-def canonicalize_smiles(smiles):
-    try:
-        return Chem.MolToSmiles(Chem.MolFromSmiles(smiles), canonical=True)
-    except:
-        return None
-
-# Convert SMILES to canonical form
-csv_df[smiles_col] = csv_df[smiles_col].dropna().apply(canonicalize_smiles)
-excel_df[smiles_col] = excel_df[smiles_col].dropna().apply(canonicalize_smiles)
+# Convert SMILES to canonical form (each unique SMILES is parsed once)
+csv_df[smiles_col] = CANONICALIZER.canonicalize_many(csv_df[smiles_col])
+excel_df[smiles_col] = CANONICALIZER.canonicalize_many(excel_df[smiles_col])
 
 # Extract unique SMILES from both files
 csv_smiles_set = set(csv_df[smiles_col].dropna().unique())
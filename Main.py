@@ -9,115 +9,413 @@ test
 
 
 import os
+import contextlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
-from separate_protein_files import split_protein_data
-from add_scores import compute_and_add_scores
+from separate_protein_files import split_protein_data, split_protein_frames, save_separated_frames
+from add_scores import compute_and_add_scores, add_scores_to_frames
 from anomaly_selection import filter_anomalous_data
 from isomer_handling import handle_isomers
 from produce_ml_labels import generate_ml_labels
 from add_negatives import add_negative_samples_from_masterlist
-from fingerprint_extraction import extract_fingerprints
+from masterlists import MASTER_LISTS
+from canonicalization import CANONICALIZER
+from fingerprint_extraction import extract_fingerprints, featurize_unique, subset_precomputed
+from fingerprint_storage import write_parquet, fingerprints_to_strings
+from fingerprints import FingerprintCache
 from column_selection import select_final_columns
+from dataset_output import dataset_root, write_target, finalize_dataset, export_csv
 
-def process_csv_files(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns):
-    """Processes all CSV files through data curation steps."""
-
-    # Step 1: Separate protein-related data and store in subfolders
-    for file_name in os.listdir(data_path):
-        if file_name.endswith(".csv"):
-            file_path = os.path.join(data_path, file_name)
-            print(f"Processing: {file_name}")
-
-            # Create a subfolder for the separated files
-            subfolder = os.path.join(separated_files_dir, os.path.splitext(file_name)[0])
-            os.makedirs(subfolder, exist_ok=True)
-
-            # Step 1: Split protein files
-            separated_files = split_protein_data(file_path, subfolder)
-            
-            # Step 2: Compute and Add Scores to all separated files together
-            print("\nComputing and Adding Scores to All Separated Files...\n")
-            compute_and_add_scores(separated_files)  # Process scores in a batch  
-
-
-            # Step 3-8: Process each separated file after computing scores
-            for sep_file in separated_files:
-                sep_file_name = os.path.basename(sep_file)
-                base_name = os.path.splitext(sep_file_name)[0]
-                print(f"  Processing separated file: {sep_file_name}")
-        
-                # Load separated file
-                df = pd.read_csv(sep_file)
-        
-                # Step 3: Identify and filter out anomalies
-                df = filter_anomalous_data(df,sep_file_name)
-        
-                # Step 4: Handle isomer-specific corrections
-                df = handle_isomers(df,sep_file_name)
-        
-                # Step 5: Add additional negative samples from master list
-                df = add_negative_samples_from_masterlist(df, file_name, masterlist_path,MasterList_Information)
-                
-                # Step 6: Generate ML labels
-                df = generate_ml_labels(df)
-        
-                # Save curated CSV file (MLReady)
-                output_file1_csv = os.path.join(output_dir1, f"MLReady_{base_name}.csv")
-                df.to_csv(output_file1_csv, index=False)
-
-                output_file1_parquet = os.path.join(output_dir1, f"MLReady_{base_name}.parquet")
-                df.to_parquet(output_file1_parquet, index=False)
-                
-                print(f"  Saved intermediate file: {output_file1_csv}")
-        
-                # Step 7: Extract chemical fingerprints
-                df = extract_fingerprints(df) 
-        
-        
-                # Step 8: 
-                # RenameColumns
-                df = df.rename(columns={"TARGET_VALUE": "TARGET_INTENSITY_VALUE"})
-                df = df.rename(columns={"MEAN_NONTARGET_VALUES": "NONTARGET_INTENSITY_VALUE"})
-                
-                # Creates a new column LABEL with 1 if BINARY_LABEL is "Y", and 0 if it's "N":
-                df["LABEL"] = (df["BINARY_LABEL"] == "Y").astype(int)
-                
-                # Step 9: Select final columns
-                df = select_final_columns(df, DesiredColumns)                
-       
-                # Save as CSV
-                output_file2_csv = os.path.join(output_dir2, f"MLReadyPlusFPs_{base_name}.csv")
-                df.to_csv(output_file2_csv, index=False)
-                
-                # Save as Parquet
-                output_file2_parquet = os.path.join(output_dir2, f"MLReadyPlusFPs_{base_name}.parquet")
-                df.to_parquet(output_file2_parquet, index=False)
-                
-                print(f"Saved CSV: {output_file2_csv}")
-                print(f"Saved Parquet: {output_file2_parquet}")
-                #-----------------------
-                df = select_final_columns(df, DesiredColumns2)                
-       
-                # Save as CSV
-                output_file3_csv = os.path.join(output_dir3, f"MLReadyPlusFPs_{base_name}.csv")
-                df.to_csv(output_file3_csv, index=False)
-                
-                # Save as Parquet
-                output_file3_parquet = os.path.join(output_dir3, f"MLReadyPlusFPs_{base_name}.parquet")
-                df.to_parquet(output_file3_parquet, index=False)
-                print(f"Saved CSV: {output_file3_csv}")
-                print(f"Saved Parquet: {output_file3_parquet}")
-                
-
-
-def main(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns):
+# Peak memory (bytes) of processing a raw file, per row of its CSV. The fingerprints dominate: about 31 KB of dense
+# arrays per unique SMILES (default_fingerprint_classes) plus their comma-joined strings for the CSV files, so the
+# cost follows the number of rows rather than the file size. Measured at 112-131 KB per row on raw files of
+# 2,000-8,000 rows with a distinct SMILES in every row (the worst case), with short or long protein sequences.
+RAW_FILE_ROW_MEMORY = 128 * 1024
+
+def curate_target(base_name, df, file_name, masterlist_path, MasterList_Information, output_dir1, dedup_key=None, output_format="files", canonical_matching=False):
+    """Steps 3-6 for one separated file: saves the MLReady files and returns the curated DataFrame.
+
+    dedup_key is passed on to filter_anomalous_data (None deduplicates on full rows).
+    With canonical_matching=True, anomalies are grouped and negatives matched against the target on canonical SMILES.
+    With output_format="dataset", the target is written to the MLReady dataset instead of its CSV and Parquet files.
+    """
+    sep_file_name = f"{base_name}.csv"
+    print(f"  Processing separated file: {sep_file_name}")
+
+    # Step 3: Identify and filter out anomalies
+    df = filter_anomalous_data(df,sep_file_name, dedup_key=dedup_key, canonical=canonical_matching)
+
+    # Step 4: Handle isomer-specific corrections
+    df = handle_isomers(df,sep_file_name)
+
+    # Step 5: Add additional negative samples from master list
+    df = add_negative_samples_from_masterlist(df, file_name, masterlist_path,MasterList_Information, canonical=canonical_matching)
+    
+    # Step 6: Generate ML labels
+    df = generate_ml_labels(df)
+
+    if output_format == "dataset":
+        output_path = write_target(df, dataset_root(output_dir1), base_name)
+        print(f"  Saved intermediate target: {output_path}")
+        return df
+
+    # Save curated CSV file (MLReady)
+    output_file1_csv = os.path.join(output_dir1, f"MLReady_{base_name}.csv")
+    df.to_csv(output_file1_csv, index=False)
+
+    output_file1_parquet = os.path.join(output_dir1, f"MLReady_{base_name}.parquet")
+    df.to_parquet(output_file1_parquet, index=False)
+    
+    print(f"  Saved intermediate file: {output_file1_csv}")
+    return df
+
+def finish_target(base_name, df, precomputed, output_dir2, output_dir3, DesiredColumns, DesiredColumns2, fp_csv=True, output_format="files"):
+    """Steps 7-9 for one curated frame, joining its fingerprints from featurize_unique output.
+
+    With output_format="dataset", the target is written once, to the MLReady_Plus_FPs dataset; the
+    MLReady_Plus_FPs_2 columns are a projection of it (dataset_output.read_dataset(..., columns=DesiredColumns2)).
+    """
+    df = extract_fingerprints(df, fp_format="array", precomputed=precomputed)
+
+
+    # Step 8: 
+    # RenameColumns
+    df = df.rename(columns={"TARGET_VALUE": "TARGET_INTENSITY_VALUE"})
+    df = df.rename(columns={"MEAN_NONTARGET_VALUES": "NONTARGET_INTENSITY_VALUE"})
+    
+    # Creates a new column LABEL with 1 if BINARY_LABEL is "Y", and 0 if it's "N":
+    df["LABEL"] = (df["BINARY_LABEL"] == "Y").astype(int)
+    
+    # Step 9: Select final columns
+    df = select_final_columns(df, DesiredColumns)                
+
+    if output_format == "dataset":
+        output_path = write_target(df, dataset_root(output_dir2), base_name)
+        print(f"Saved Parquet: {output_path}")
+        return
+
+    # Save as CSV (optional, fingerprints as comma-joined strings)
+    if fp_csv:
+        output_file2_csv = os.path.join(output_dir2, f"MLReadyPlusFPs_{base_name}.csv")
+        fingerprints_to_strings(df).to_csv(output_file2_csv, index=False)
+        print(f"Saved CSV: {output_file2_csv}")
+    
+    # Save as Parquet
+    output_file2_parquet = os.path.join(output_dir2, f"MLReadyPlusFPs_{base_name}.parquet")
+    write_parquet(df, output_file2_parquet)
+    
+    print(f"Saved Parquet: {output_file2_parquet}")
+    #-----------------------
+    df = select_final_columns(df, DesiredColumns2)                
+
+    # Save as CSV (optional, fingerprints as comma-joined strings)
+    if fp_csv:
+        output_file3_csv = os.path.join(output_dir3, f"MLReadyPlusFPs_{base_name}.csv")
+        fingerprints_to_strings(df).to_csv(output_file3_csv, index=False)
+        print(f"Saved CSV: {output_file3_csv}")
+    
+    # Save as Parquet
+    output_file3_parquet = os.path.join(output_dir3, f"MLReadyPlusFPs_{base_name}.parquet")
+    write_parquet(df, output_file3_parquet)
+    print(f"Saved Parquet: {output_file3_parquet}")
+
+def _run_logged(log_path, log_mode, function, *args, **kwargs):
+    """Runs function(*args, **kwargs) with stdout/stderr redirected to log_path; exceptions are logged and re-raised."""
+    with open(log_path, log_mode) as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            traceback.print_exc()
+            raise
+
+def run_per_target(pool, function, tasks, log_dir, log_mode="a"):
+    """Runs one function call per target in a process pool.
+
+    The output of each target goes to <log_dir>/<base_name>.log. A target that raises is reported and skipped,
+    the other targets are not affected.
+
+    Args:
+        pool (ProcessPoolExecutor): Worker pool.
+        function: Picklable (module-level) function.
+        tasks (list): (base_name, args) pairs; function(*args) is called for each.
+        log_dir (str): Folder of the per-target logs.
+        log_mode (str): "w" to start new logs, "a" to append to them.
+
+    Returns:
+        list: (base_name, result) of the targets that succeeded, in task order.
+    """
+    futures = []
+    for base_name, args in tasks:
+        log_path = os.path.join(log_dir, f"{base_name}.log")
+        futures.append((base_name, log_path, pool.submit(_run_logged, log_path, log_mode, function, *args)))
+
+    results = []
+    for base_name, log_path, future in futures:
+        try:
+            results.append((base_name, future.result()))
+        except Exception as e:
+            print(f"Warning: {base_name} failed ({type(e).__name__}: {e}). Skipping it, see {log_path}")
+    return results
+
+def finish_with_fingerprints(curated_frames, output_dir2, output_dir3, DesiredColumns, DesiredColumns2, fp_csv=True, fp_cache=None, pool=None, log_dir=None, n_jobs=1, output_format="files"):
+    """Steps 7-9 for a group of curated frames.
+
+    The unique SMILES of all frames are featurized once, then the fingerprints are joined back onto each target.
+
+    Args:
+        curated_frames (list): (base_name, df) pairs produced by steps 3-6.
+        pool (ProcessPoolExecutor or None): If given, the targets are finished in the pool (see run_per_target),
+            with their logs in log_dir.
+        n_jobs (int): Number of worker processes used for featurization. The SMILES are featurized in pool when
+            one is given, so no second pool is started.
+    """
+
+    # Step 7: Extract chemical fingerprints once for every unique SMILES of the group
+    precomputed = featurize_unique([df["SMILES"] for _, df in curated_frames], n_jobs=n_jobs, cache=fp_cache, executor=pool)
+
+    if pool is None:
+        for base_name, df in curated_frames:
+            finish_target(base_name, df, precomputed, output_dir2, output_dir3, DesiredColumns, DesiredColumns2, fp_csv, output_format)
+        return
+
+    # Each worker only receives the features of its own target's SMILES
+    run_per_target(pool, finish_target, [
+        (base_name, (base_name, df, subset_precomputed(precomputed, df["SMILES"]), output_dir2, output_dir3, DesiredColumns, DesiredColumns2, fp_csv, output_format))
+        for base_name, df in curated_frames
+    ], log_dir)
+
+def load_separated_files(separated_files):
+    """Yields (base_name, df) for each separated CSV file, reading one file at a time."""
+    for sep_file in separated_files:
+        yield os.path.splitext(os.path.basename(sep_file))[0], pd.read_csv(sep_file)
+
+def estimate_raw_file_memory(file_path):
+    """Rough peak memory (bytes) of processing one raw file: RAW_FILE_ROW_MEMORY times its number of data rows."""
+    rows = 0
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            rows += block.count(b"\n")
+    return max(rows - 1, 0) * RAW_FILE_ROW_MEMORY
+
+def process_raw_file(file_name, data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns, DesiredColumns2, fp_csv=True, fp_cache=None, fingerprint_scope="raw_file", separated_format="csv", pool=None, log_dir=None, curation_workers=1, dedup_key=None, output_format="files", canonical_matching=False):
+    """Steps 1-6 for one raw CSV file, and steps 7-9 with fingerprint_scope="raw_file".
+
+    Returns:
+        list: Curated (base_name, df) pairs still waiting for steps 7-9 (empty with fingerprint_scope="raw_file").
+    """
+    file_path = os.path.join(data_path, file_name)
+    print(f"Processing: {file_name}")
+
+    # Create a subfolder for the separated files
+    subfolder = os.path.join(separated_files_dir, os.path.splitext(file_name)[0])
+    if separated_format is not None:
+        os.makedirs(subfolder, exist_ok=True)
+
+    if separated_format == "csv":
+        # Step 1: Split protein files
+        separated_files = split_protein_data(file_path, subfolder)
+
+        # Step 2: Compute and Add Scores to all separated files together
+        print("\nComputing and Adding Scores to All Separated Files...\n")
+        compute_and_add_scores(separated_files, statistics_path=os.path.join(subfolder, "ScoreStatistics.parquet"))
+        separated_frames = load_separated_files(separated_files)
+    else:
+        # Step 1-2: Split protein data and add scores in memory
+        separated_frames = split_protein_frames(file_path)
+        print("\nComputing and Adding Scores to All Separated Frames...\n")
+        if separated_format == "parquet":
+            add_scores_to_frames(separated_frames, statistics_path=os.path.join(subfolder, "ScoreStatistics.parquet"))
+            save_separated_frames(separated_frames, subfolder)
+        else:
+            add_scores_to_frames(separated_frames)
+        separated_frames = separated_frames.items()
+
+    # Step 3-6: Process each separated file after computing scores
+    if pool is None:
+        curated_frames = [
+            (base_name, curate_target(base_name, df, file_name, masterlist_path, MasterList_Information, output_dir1, dedup_key, output_format, canonical_matching))
+            for base_name, df in separated_frames
+        ]
+    else:
+        curated_frames = run_per_target(pool, curate_target, [
+            (base_name, (base_name, df, file_name, masterlist_path, MasterList_Information, output_dir1, dedup_key, output_format, canonical_matching))
+            for base_name, df in separated_frames
+        ], log_dir, log_mode="w")
+
+    # Step 7-9: Fingerprints for all targets of this raw file at once
+    if fingerprint_scope == "raw_file":
+        if curated_frames:
+            finish_with_fingerprints(curated_frames, output_dir2, output_dir3, DesiredColumns, DesiredColumns2, fp_csv=fp_csv, fp_cache=fp_cache, pool=pool, log_dir=log_dir, n_jobs=curation_workers, output_format=output_format)
+        return []
+    return curated_frames
+
+def _init_pipeline_worker(masterlist_path, MasterList_Information, canonical_store_path, canonical_matching):
+    """Pool initializer: loads the master lists and attaches the canonical store in each worker process.
+
+    Forked workers inherit both from the parent process, but spawned ones (the default on Windows) start empty.
+    """
+    if canonical_store_path:
+        CANONICALIZER.open_store(canonical_store_path)
+    MASTER_LISTS.preload(masterlist_path, MasterList_Information, canonical=canonical_matching)
+
+def _process_raw_file_job(fp_cache_path, *args, **kwargs):
+    """process_raw_file in a worker process, with its own fingerprint cache connection (and no pool of its own)."""
+    fp_cache = FingerprintCache(fp_cache_path) if fp_cache_path else None
+    try:
+        return process_raw_file(*args, fp_cache=fp_cache, **kwargs)
+    finally:
+        if fp_cache is not None:
+            fp_cache.close()
+
+def run_raw_files(raw_files, data_path, raw_file_workers, memory_budget_gb, log_dir, job_args, worker_args=None):
+    """Processes raw files concurrently in a process pool, within a memory budget.
+
+    A raw file is started when a worker is free and the estimated memory (estimate_raw_file_memory) of the raw
+    files in progress plus its own stays within memory_budget_gb; raw files are started in order, and one that
+    exceeds the budget on its own runs alone. Every raw file is processed in a single worker process (raw file
+    workers do not start pools of their own), so the estimate covers all the processes a raw file uses. Each raw
+    file's output goes to <log_dir>/<raw file>.log, and a raw file that fails is reported and skipped without
+    stopping the others.
+
+    Args:
+        raw_files (list): Raw CSV file names, in processing order.
+        raw_file_workers (int): Maximum number of raw files processed at the same time.
+        memory_budget_gb (float or None): Memory budget in GB, None for no limit.
+        job_args (tuple): (args, kwargs) passed on to _process_raw_file_job after the file name.
+        worker_args (tuple or None): Arguments of _init_pipeline_worker, run in each worker process.
+
+    Returns:
+        list: Curated (base_name, df) pairs returned by process_raw_file, in raw file order.
+    """
+    budget = None if memory_budget_gb is None else memory_budget_gb * 1024 ** 3
+    args, kwargs = job_args
+    pending = [(file_name, estimate_raw_file_memory(os.path.join(data_path, file_name))) for file_name in raw_files]
+    running = {}
+    results = {}
+    in_flight = 0
+
+    setup = {} if worker_args is None else dict(initializer=_init_pipeline_worker, initargs=worker_args)
+    with ProcessPoolExecutor(max_workers=raw_file_workers, **setup) as raw_file_pool:
+        while pending or running:
+            while pending and len(running) < raw_file_workers and (
+                not running or budget is None or in_flight + pending[0][1] <= budget
+            ):
+                file_name, estimate = pending.pop(0)
+                log_path = os.path.join(log_dir, f"{os.path.splitext(file_name)[0]}.log")
+                future = raw_file_pool.submit(_run_logged, log_path, "w", _process_raw_file_job, args[0], file_name, *args[1:], **kwargs)
+                running[future] = (file_name, estimate, log_path)
+                in_flight += estimate
+                print(f"Started: {file_name} (estimated {estimate / 1024 ** 3:.2f} GB, log {log_path})")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_name, estimate, log_path = running.pop(future)
+                in_flight -= estimate
+                try:
+                    results[file_name] = future.result()
+                    print(f"Finished: {file_name}")
+                except Exception as e:
+                    print(f"Warning: {file_name} failed ({type(e).__name__}: {e}). Skipping it, see {log_path}")
+
+    return [pair for file_name in raw_files for pair in results.get(file_name, [])]
+
+def process_csv_files(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns, DesiredColumns2, fp_csv=True, fp_cache_path=None, fingerprint_scope="raw_file", separated_format="csv", curation_workers=1, raw_file_workers=1, memory_budget_gb=None, dedup_key=None, canonical_store_path=None, output_format="files", canonical_matching=False):
+    """Processes all CSV files through data curation steps (see the Readme for the options).
+
+    Args:
+        DesiredColumns (list): Columns of the MLReady and MLReady_Plus_FPs files.
+        DesiredColumns2 (list): Columns of the MLReady_Plus_FPs_2 files.
+        fp_csv (bool): Also write the fingerprint files as CSV (comma-joined fingerprint strings).
+        fp_cache_path (str or None): Persistent FingerprintCache file, None to compute every fingerprint.
+        fingerprint_scope (str): Featurize the unique SMILES once per "raw_file" or once per "run".
+        separated_format (str or None): "csv", "parquet" or None (separated files kept in memory only).
+        curation_workers (int): Number of processes curating targets in parallel (steps 3-9).
+        raw_file_workers (int): Number of raw files processed in parallel. Only one of curation_workers and
+            raw_file_workers can be greater than 1, so the run never uses more worker processes than that value.
+        memory_budget_gb (float or None): Estimated memory allowed for the raw files in progress
+            (raw_file_workers > 1).
+        dedup_key (list or None): Columns on which filter_anomalous_data drops duplicates (None: full rows).
+        canonical_store_path (str or None): SQLite store of canonical SMILES kept across runs.
+        output_format (str): "files" (per-target files) or "dataset" (Hive-partitioned Parquet datasets).
+        canonical_matching (bool): Group anomalies and match negatives on canonical SMILES instead of SMILES strings.
+    """
+    if fingerprint_scope not in ("raw_file", "run"):
+        raise ValueError(f"fingerprint_scope must be 'raw_file' or 'run', got '{fingerprint_scope}'")
+    if separated_format not in ("csv", "parquet", None):
+        raise ValueError(f"separated_format must be 'csv', 'parquet' or None, got '{separated_format}'")
+    if output_format not in ("files", "dataset"):
+        raise ValueError(f"output_format must be 'files' or 'dataset', got '{output_format}'")
+    if curation_workers > 1 and raw_file_workers > 1:
+        raise ValueError(
+            f"curation_workers ({curation_workers}) and raw_file_workers ({raw_file_workers}) cannot both be greater than 1: "
+            "each raw file worker would start its own curation pool"
+        )
+
+    raw_files = [file_name for file_name in os.listdir(data_path) if file_name.endswith(".csv")]
+    log_dir = None
+    if curation_workers > 1 or raw_file_workers > 1:
+        log_dir = os.path.join(separated_files_dir, "CurationLogs")
+        os.makedirs(log_dir, exist_ok=True)
+
+    if canonical_store_path:
+        CANONICALIZER.open_store(canonical_store_path)
+
+    # Parse the master lists once (or read their Parquet copies) before any worker process starts, so that workers
+    # set up by _init_pipeline_worker find them in memory (forked) or as Parquet copies (spawned)
+    MASTER_LISTS.preload(masterlist_path, MasterList_Information, canonical=canonical_matching)
+
+    worker_args = (masterlist_path, MasterList_Information, canonical_store_path, canonical_matching)
+    settings = dict(fp_csv=fp_csv, fingerprint_scope=fingerprint_scope, separated_format=separated_format, dedup_key=dedup_key, output_format=output_format, canonical_matching=canonical_matching)
+    paths = (data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns, DesiredColumns2)
+
+    # Step 1-6 (and 7-9 per raw file): raw files processed concurrently
+    if raw_file_workers > 1:
+        curated_frames = run_raw_files(raw_files, data_path, raw_file_workers, memory_budget_gb, log_dir, (
+            (fp_cache_path,) + paths, settings
+        ), worker_args)
+        fp_cache = FingerprintCache(fp_cache_path) if fp_cache_path and curated_frames else None
+        pool = None
+
+    # Step 1-6 (and 7-9 per raw file): one raw file after the other
+    else:
+        fp_cache = FingerprintCache(fp_cache_path) if fp_cache_path else None
+        pool = ProcessPoolExecutor(
+            max_workers=curation_workers, initializer=_init_pipeline_worker, initargs=worker_args
+        ) if curation_workers > 1 else None
+        curated_frames = []
+        for file_name in raw_files:
+            curated_frames += process_raw_file(file_name, *paths, fp_cache=fp_cache, pool=pool, log_dir=log_dir, curation_workers=curation_workers, **settings)
+
+    # Step 7-9: Fingerprints for all targets of the run at once
+    if curated_frames:
+        finish_with_fingerprints(curated_frames, output_dir2, output_dir3, DesiredColumns, DesiredColumns2, fp_csv=fp_csv, fp_cache=fp_cache, pool=pool, log_dir=log_dir, n_jobs=curation_workers, output_format=output_format)
+
+    # Shared schema for each dataset, and the CSV files as a post-step
+    if output_format == "dataset":
+        finalize_dataset(dataset_root(output_dir1))
+        finalize_dataset(dataset_root(output_dir2))
+        if fp_csv:
+            export_csv(dataset_root(output_dir1), output_dir1, "MLReady_")
+            export_csv(dataset_root(output_dir2), output_dir2, "MLReadyPlusFPs_")
+            export_csv(dataset_root(output_dir2), output_dir3, "MLReadyPlusFPs_", columns=DesiredColumns2)
+
+    if fp_cache is not None:
+        fp_cache.close()
+    if canonical_store_path:
+        CANONICALIZER.open_store(None)
+    if pool is not None:
+        pool.shutdown()
+
+
+def main(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns, DesiredColumns2, fp_csv=True, fp_cache_path=None, fingerprint_scope="raw_file", separated_format="csv", curation_workers=1, raw_file_workers=1, memory_budget_gb=None, dedup_key=None, canonical_store_path=None, output_format="files", canonical_matching=False):
     """Main function to execute the full data curation pipeline."""
     os.makedirs(separated_files_dir, exist_ok=True)
     os.makedirs(output_dir1, exist_ok=True)
     os.makedirs(output_dir2, exist_ok=True)
     os.makedirs(output_dir3, exist_ok=True)
 
-    process_csv_files(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns)
+    process_csv_files(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns, DesiredColumns2, fp_csv=fp_csv, fp_cache_path=fp_cache_path, fingerprint_scope=fingerprint_scope, separated_format=separated_format, curation_workers=curation_workers, raw_file_workers=raw_file_workers, memory_budget_gb=memory_budget_gb, dedup_key=dedup_key, canonical_store_path=canonical_store_path, output_format=output_format, canonical_matching=canonical_matching)
 
 if __name__ == "__main__":
     # Define paths (Modify as needed)
@@ -130,6 +428,17 @@ if __name__ == "__main__":
     output_dir1 = os.path.join(path, "MLReady") 
     output_dir2 = os.path.join(path, "MLReady_Plus_FPs")
     output_dir3 = os.path.join(path, "MLReady_Plus_FPs_2")
+    fp_csv = True  # set to False to write the fingerprint files as Parquet only (typed fingerprint columns)
+    fp_cache_path = os.path.join(path, "FingerprintCache.sqlite")  # set to None to disable the fingerprint cache
+    fingerprint_scope = "raw_file"  # "run" computes fingerprints once for the unique SMILES of all raw files
+    separated_format = "csv"  # "parquet" or None keep the separated files in memory (saved as Parquet, or not at all)
+    curation_workers = 1  # number of processes curating targets in parallel (steps 3-9)
+    raw_file_workers = 1  # number of raw files processed in parallel (only one of curation_workers and raw_file_workers can be > 1)
+    memory_budget_gb = None  # estimated memory allowed for the raw files in progress (None for no limit)
+    dedup_key = None  # e.g. anomaly_selection.DEDUP_KEY to deduplicate on compound and replicates instead of full rows
+    canonical_store_path = os.path.join(path, "CanonicalSmiles.sqlite")  # set to None to keep canonical SMILES in memory only
+    output_format = "files"  # "dataset" writes Hive-partitioned Parquet datasets (<output dir>/Dataset) instead of per-target files
+    canonical_matching = False  # True groups anomalies and matches negatives on canonical SMILES, so differently written SMILES of one compound match
 
     DesiredColumns = ['ASMS_BATCH_NUM',
      'COMPOUND_ID',
@@ -199,4 +508,4 @@ if __name__ == "__main__":
      'TOPTOR',
      'ATOMPAIR']
 
-    main(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns)
+    main(data_path, masterlist_path, separated_files_dir, output_dir1, output_dir2, output_dir3, MasterList_Information, DesiredColumns, DesiredColumns2, fp_csv=fp_csv, fp_cache_path=fp_cache_path, fingerprint_scope=fingerprint_scope, separated_format=separated_format, curation_workers=curation_workers, raw_file_workers=raw_file_workers, memory_budget_gb=memory_budget_gb, dedup_key=dedup_key, canonical_store_path=canonical_store_path, output_format=output_format, canonical_matching=canonical_matching)
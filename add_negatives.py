@@ -1,8 +1,10 @@
 import os
 import pandas as pd
 import numpy as np
+from masterlists import MASTER_LISTS
+from canonicalization import canonical_keys
 
-def add_negative_samples_from_masterlist(df, file_name, masterlist_path, MasterList_Information):
+def add_negative_samples_from_masterlist(df, file_name, masterlist_path, MasterList_Information, registry=None, canonical=False):
     """
     Adds negative samples from the master list that are not present in the input DataFrame.
     Copies specific additional columns from the master list.
@@ -12,13 +14,18 @@ def add_negative_samples_from_masterlist(df, file_name, masterlist_path, MasterL
         file_name (str): The name of the processed file to match with the master list.
         masterlist_path (str): The directory containing master list files.
         MasterList_Information (str): The path to the Excel file mapping file names to master lists.
+        registry (MasterListRegistry or None): Registry the workbooks are read from (None: the shared MASTER_LISTS).
+        canonical (bool): Compare canonical SMILES instead of the SMILES strings, so that a library compound the
+            target already holds under another spelling (e.g. 'OCC' for 'CCO') is not added as a negative.
 
     Returns:
         pd.DataFrame: Updated DataFrame with added negative samples.
     """
 
+    registry = MASTER_LISTS if registry is None else registry
+
     # Load the master list mapping file
-    masterlist_info = pd.read_excel(MasterList_Information)
+    masterlist_info = registry.read(MasterList_Information)
 
     # Ensure the necessary columns exist
     if not {"FileName", "MaterListName"}.issubset(masterlist_info.columns):
@@ -42,15 +49,21 @@ def add_negative_samples_from_masterlist(df, file_name, masterlist_path, MasterL
         return df
 
     # Load the master list file
-    master_df = pd.read_excel(masterlist_file)
+    master_df = registry.read(masterlist_file)
 
     # Ensure 'SMILES' column exists in the master list
     if "SMILES" not in master_df.columns:
         raise ValueError(f"Master list file {masterlist_name} must contain a 'SMILES' column")
 
     # Identify SMILES that are NOT present in df
-    existing_smiles = set(df["SMILES"].dropna())
-    new_entries = master_df[~master_df["SMILES"].isin(existing_smiles)].copy()
+    if canonical:
+        # compare canonical SMILES, so spelling differences still match
+        existing_keys = set(canonical_keys(df["SMILES"].dropna().unique()))
+        master_keys = registry.canonical_index(masterlist_file)
+        new_entries = master_df[~master_keys.isin(existing_keys).to_numpy()].copy()
+    else:
+        existing_smiles = set(df["SMILES"].dropna())
+        new_entries = master_df[~master_df["SMILES"].isin(existing_smiles)].copy()
 
     if new_entries.empty:
         print(f"No new negative samples found for {file_name}.")
@@ -2,12 +2,228 @@ import os
 import pandas as pd
 import numpy as np
 import scipy.stats as stats
+from scipy import special
+from score_statistics import REPLICATE_COLUMNS, TargetStatistics, replicate_values
 
-def compute_and_add_scores(file_paths):
+# Statistics of the other targets each score column depends on (besides the target's own rows)
+SCORE_DEPENDENCIES = {
+    "SELECTIVE_VALUE": ["target_value_max"],
+    "NTC_VALUE": ["target_value_min"],
+    "ENRICHMENT": ["target_value_min"],
+    "SELECTIVE_ENRICHMENT": ["target_value_max"],
+    "EASMS_ENRICHMENT": ["rows", "row_mean_sum", "row_mean_count"],
+    "MEAN_NONTARGET_VALUES": ["rows", "row_mean_sum", "row_mean_count"],
+    "PVALUE": ["value_count", "value_sum", "value_sumsq", "value_max", "value_min"],
+}
+
+def _row_sums_like_numpy(values):
+    """
+    Sums each row of a 2-d array, adding the values in the same order as np.sum does on a 1-d array
+    (pairwise summation), so the sums are bit-identical to summing every row on its own.
+    """
+    n = values.shape[1]
+    if n < 8:
+        sums = np.zeros(len(values))
+        for j in range(n):
+            sums += values[:, j]
+        return sums
+    if n <= 128:
+        partial = values[:, :8].copy()
+        stop = n - n % 8
+        for i in range(8, stop, 8):
+            partial += values[:, i:i + 8]
+        sums = ((partial[:, 0] + partial[:, 1]) + (partial[:, 2] + partial[:, 3])) + \
+               ((partial[:, 4] + partial[:, 5]) + (partial[:, 6] + partial[:, 7]))
+        for i in range(stop, n):
+            sums += values[:, i]
+        return sums
+    half = n // 2
+    half -= half % 8
+    return _row_sums_like_numpy(values[:, :half]) + _row_sums_like_numpy(values[:, half:])
+
+def grouped_sums(codes, values, n_groups):
+    """
+    Sum of the values of each group, equal to calling np.sum on the values of every group (in row order) but
+    computed for all groups at once.
+
+    Args:
+        codes (np.ndarray): Group of each value (0..n_groups-1), -1 for values that belong to no group.
+        values (np.ndarray): Float values.
+        n_groups (int): Number of groups.
+
+    Returns:
+        np.ndarray: Sum of each group, 0 for empty groups.
+    """
+    in_group = codes >= 0
+    codes = codes[in_group]
+    values = values[in_group]
+
+    order = np.argsort(codes, kind="stable")
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    sums = np.zeros(n_groups)
+    # groups of the same size are summed together, as one row each of a 2-d array
+    for size in np.unique(sizes[sizes > 0]):
+        groups = np.flatnonzero(sizes == size)
+        positions = order[starts[groups][:, None] + np.arange(size)]
+        sums[groups] = _row_sums_like_numpy(values[positions])
+    return sums
+
+def group_nanmean(codes, values, n_groups):
+    """
+    Mean of the non-NaN values of each group, equal to calling pd.Series.mean() on the values of every group
+    (in row order) but computed for all groups at once.
+
+    Args:
+        codes (np.ndarray): Group of each value (0..n_groups-1), -1 for values that belong to no group.
+        values (np.ndarray): Float values.
+        n_groups (int): Number of groups.
+
+    Returns:
+        np.ndarray: Mean of each group, NaN for groups without any non-NaN value.
+    """
+    in_group = codes >= 0
+    # like pandas, NaN values are summed as 0 and left out of the count
+    counts = np.bincount(codes[in_group], weights=~np.isnan(values[in_group]), minlength=n_groups)
+    sums = grouped_sums(codes, np.where(np.isnan(values), 0.0, values), n_groups)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def _grouped_mean_var(codes, values, n_groups):
+    """
+    Count, mean and variance (ddof=0) of the non-NaN values of each group, computed as np.mean/np.var would.
+    """
+    observed = ~np.isnan(values)
+    codes = np.where(observed, codes, -1)
+    counts = np.bincount(codes[codes >= 0], minlength=n_groups)
+    in_group = codes >= 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = grouped_sums(codes, values, n_groups) / counts
+        deviations = np.full(len(values), np.nan)
+        deviations[in_group] = values[in_group] - means[codes[in_group]]
+        variances = grouped_sums(codes, deviations * deviations, n_groups) / counts
+    return counts, means, variances
+
+def welch_pvalues(interest_values, interest_groups, other_values, other_codes, n_groups):
+    """
+    Two-sided Welch t-test p-values for many compounds at once, matching welch_pvalue_reference row by row.
+
+    Each target row is tested with its replicate intensities against all replicate intensities of the same
+    compound in the other files. The edge rules of the per-compound path are kept: no target value or fewer
+    than 3 other values gives NaN (None), a (near) constant sample (std < 1e-8) gives 1.0.
+
+    Args:
+        interest_values (np.ndarray): (N, k) replicate intensities of the target rows, NaN where missing.
+        interest_groups (np.ndarray): Compound group of each target row, -1 if the compound is unknown.
+        other_values (np.ndarray): Replicate intensities from the other files, NaN where missing.
+        other_codes (np.ndarray): Compound group of each of the other values.
+        n_groups (int): Number of compound groups.
+
+    Returns:
+        np.ndarray: P-value of each target row, NaN where no test is possible.
+    """
+    group_n2, group_m2, group_var2 = _grouped_mean_var(other_codes, other_values, n_groups)
+    # group -1 (unknown compound) picks the empty group appended at the end
+    n2 = np.append(group_n2, 0)[interest_groups]
+    m2 = np.append(group_m2, np.nan)[interest_groups]
+    var2 = np.append(group_var2, np.nan)[interest_groups]
+    return welch_pvalues_from_moments(*row_moments(interest_values), n2, m2, var2)
+
+def row_moments(values):
+    """
+    Count, mean and variance (ddof=0) of the non-NaN values of every row of a 2-d array.
+    """
+    n_rows, n_columns = values.shape
+    return _grouped_mean_var(np.repeat(np.arange(n_rows), n_columns), values.ravel(), n_rows)
+
+def welch_pvalues_from_moments(n1, m1, var1, n2, m2, var2):
+    """
+    Two-sided Welch t-test p-values from the count, mean and variance (ddof=0) of both samples of every test.
+    Fewer than 1 (first sample) or 3 (second sample) values gives NaN, a std < 1e-8 in either sample gives 1.0.
+
+    Returns:
+        np.ndarray: P-value of every test, NaN where no test is possible.
+    """
+    pvalues = np.full(len(n1), np.nan)
+    testable = (n1 > 0) & (n2 >= 3)
+    constant = testable & ((np.sqrt(var1) < 1e-8) | (np.sqrt(var2) < 1e-8))
+    pvalues[constant] = 1.0
+
+    test = testable & ~constant
+    n1, m1, var1, n2, m2, var2 = (x[test].astype(float) for x in (n1, m1, var1, n2, m2, var2))
+    # the remaining steps follow scipy.stats.ttest_ind(equal_var=False)
+    vn1 = var1 * (n1 / (n1 - 1)) / n1
+    vn2 = var2 * (n2 / (n2 - 1)) / n2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df = (vn1 + vn2)**2 / (vn1**2 / (n1 - 1) + vn2**2 / (n2 - 1))
+        df = np.where(np.isnan(df), 1., df)
+        t = (m1 - m2) / np.sqrt(vn1 + vn2)
+    pvalues[test] = 2 * special.stdtr(df, -np.abs(t))
+    return pvalues
+
+def welch_pvalue_reference(protein_interest, protein_other_values):
+    """
+    P-value of one compound with scipy.stats.ttest_ind, as computed before PVALUE was batched.
+
+    Args:
+        protein_interest (np.ndarray): Replicate intensities of the compound for the target (NaN dropped).
+        protein_other_values (np.ndarray): Its replicate intensities in the other files (NaN dropped).
+
+    Returns:
+        float or None: The p-value, 1.0 for (near) constant samples, None if a sample is too small.
+    """
+    if len(protein_interest) == 0 or len(protein_other_values) < 3:
+        return None
+
+    if np.std(protein_interest) < 1e-8 or np.std(protein_other_values) < 1e-8:
+        return 1.0
+
+    _, p_value = stats.ttest_ind(protein_interest, protein_other_values, equal_var=False)
+    return p_value
+
+def compute_pvalues(df, merged_other):
+    """
+    PVALUE of every row of a target DataFrame against the same compounds in the other files.
+
+    Args:
+        df (pd.DataFrame): Target rows with COMPOUND_ID and replicate columns.
+        merged_other (pd.DataFrame): Rows of all other files.
+
+    Returns:
+        np.ndarray: P-value of each row of df, NaN where no test is possible.
+    """
+    other_codes, other_compounds = pd.factorize(merged_other["COMPOUND_ID"])
+    # values in row order, replicates of a row next to each other, like DataFrame.stack()
+    other_values = replicate_values(merged_other).ravel()
+    other_value_codes = np.repeat(other_codes, len(REPLICATE_COLUMNS))
+    interest_groups = pd.Index(other_compounds).get_indexer(df["COMPOUND_ID"])
+    return welch_pvalues(
+        replicate_values(df), interest_groups, other_values, other_value_codes, len(other_compounds)
+    )
+
+def target_name(key):
+    """
+    Name of a target in the score statistics: the base name of its separated file, without .csv/.parquet.
+    """
+    name = os.path.basename(key)
+    for extension in (".csv", ".parquet"):
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+def compute_and_add_scores(file_paths, method="statistics", statistics_path=None):
     """
     Computes TARGET_VALUE, ENRICHMENT, SELECTIVE_ENRICHMENT, EASMS_ENRICHMENT,
     MEAN_NONTARGET_VALUES, and PVALUE for a list of CSV files.
     Each file is processed individually, using all other files to compute comparison values.
+
+    Args:
+        file_paths (list): Per-target CSV files, updated in place.
+        method (str): See add_scores_to_frames.
+        statistics_path (str, optional): If given, the TargetStatistics of the files are saved there as a Parquet
+            store, for later incremental updates with update_scores_in_files.
     """
     if not file_paths:
         print("No files provided for score computation.")
@@ -16,18 +232,46 @@ def compute_and_add_scores(file_paths):
     # Load all CSV files
     dataframes = {f: pd.read_csv(f) for f in file_paths}
 
-    # Ensure necessary columns exist
-    required_columns = {"COMPOUND_ID", "POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"}
-    for filename, df in dataframes.items():
-        if not required_columns.issubset(df.columns):
-            raise ValueError(f"Missing required columns in {filename}: {required_columns - set(df.columns)}")
+    add_scores_to_frames(dataframes, method=method, statistics_path=statistics_path)
 
-    # Compute TARGET_VALUE for each df
-    for df in dataframes.values():
-        df["TARGET_VALUE"] = pd.to_numeric(
-            df[["POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]]
-            .mean(axis=1, skipna=True), errors="coerce"
-        )
+    _save_scored_files(dataframes)
+
+def add_scores_to_frames(dataframes, method="statistics", statistics_path=None):
+    """
+    Adds TARGET_VALUE, ENRICHMENT, SELECTIVE_ENRICHMENT, EASMS_ENRICHMENT,
+    MEAN_NONTARGET_VALUES, and PVALUE to a set of per-target DataFrames, in place.
+    Each DataFrame is scored against all the others, as compute_and_add_scores does for files.
+
+    Args:
+        dataframes (dict): Target key (file path or name) -> DataFrame with COMPOUND_ID and the replicate columns.
+        method (str): "statistics" derives the comparison values from a compound x target TargetStatistics built
+            once for all files (sums, counts and extremes of all targets minus the current one).
+            "merged" concatenates the other files for every file and aggregates them again; it is O(F^2) in the
+            number of files but sums every compound's values in row order, as pandas/scipy do per compound.
+            Both agree up to floating point rounding.
+        statistics_path (str, optional): If given, the TargetStatistics of the frames are saved there as a Parquet
+            store, keyed by target_name of the dict keys.
+
+    Returns:
+        dict: The same DataFrames, with the score columns added.
+    """
+    if method not in ("statistics", "merged"):
+        raise ValueError(f"method must be 'statistics' or 'merged', got '{method}'")
+
+    _add_target_values(dataframes)
+
+    target_statistics = None
+    if method == "statistics" or statistics_path is not None:
+        target_statistics = TargetStatistics.from_frames({target_name(f): df for f, df in dataframes.items()})
+        if statistics_path is not None:
+            target_statistics.save(statistics_path)
+
+    if method == "statistics":
+        for current_file, df in dataframes.items():
+            print(f"\n Processing: {os.path.basename(current_file)}")
+            other = target_statistics.leave_one_out(target_name(current_file), df["COMPOUND_ID"])
+            _add_scores_from_statistics(df, other)
+        return dataframes
 
     # Step 2: Process each file individually
     for current_file, df in dataframes.items():
@@ -55,56 +299,206 @@ def compute_and_add_scores(file_paths):
         df["SELECTIVE_ENRICHMENT"] = df["TARGET_VALUE"] / df["SELECTIVE_VALUE"]
 
         # EASMS_ENRICHMENT and MEAN_NONTARGET_VALUES
-        def compute_easms_enrichment(row):
-            cid = row["COMPOUND_ID"]
-            other = merged_other[merged_other["COMPOUND_ID"] == cid]
-            if other.empty:
-                return pd.Series([None, None])
-            other_mean = other[["POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]]\
-                .apply(pd.to_numeric, errors="coerce")\
-                .mean(axis=1, skipna=True).mean()
-            if pd.isna(other_mean) or other_mean == 0:
-                return pd.Series([None, other_mean])
-            enrichment = row["TARGET_VALUE"] / other_mean
-            return pd.Series([enrichment, other_mean])
-
-        df[["EASMS_ENRICHMENT", "MEAN_NONTARGET_VALUES"]] = df.apply(compute_easms_enrichment, axis=1)
-
-        # PVALUE computation (robust)
-        def calculate_p_value(row):
-            try:
-                compound_id = row["COMPOUND_ID"]
-                if pd.isna(compound_id):
-                    return None
-
-                # Current compound's replicates
-                protein_interest = pd.to_numeric(
-                    row[["POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]],
-                    errors="coerce"
-                ).dropna().values.astype(float)
-
-                # Replicates from other files for same compound
-                other = merged_other[merged_other["COMPOUND_ID"] == compound_id]
-                protein_other_values = pd.to_numeric(
-                    other[["POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]]
-                    .stack(), errors="coerce"
-                ).dropna().values.astype(float)
-
-                if len(protein_interest) == 0 or len(protein_other_values) < 3:
-                    return None
-
-                if np.std(protein_interest) < 1e-8 or np.std(protein_other_values) < 1e-8:
-                    return 1.0
-
-                _, p_value = stats.ttest_ind(protein_interest, protein_other_values, equal_var=False)
-                return p_value
-
-            except Exception as e:
-                print(f" Error calculating p-value for {row.get('COMPOUND_ID', 'UNKNOWN')}: {e}")
-                return None
-
-        df["PVALUE"] = df.apply(calculate_p_value, axis=1)
+        # MEAN_NONTARGET_VALUES is the mean over the compound's rows in the other files of each row's replicate mean.
+        # Both are empty for compounds absent from the other files; EASMS_ENRICHMENT also when that mean is NaN or 0.
+        other_row_means = merged_other[REPLICATE_COLUMNS]\
+            .apply(pd.to_numeric, errors="coerce")\
+            .mean(axis=1, skipna=True)\
+            .to_numpy(dtype=float)
+        other_codes, other_compounds = pd.factorize(merged_other["COMPOUND_ID"])
+        other_means = group_nanmean(other_codes, other_row_means, len(other_compounds))
+
+        compound_groups = pd.Index(other_compounds).get_indexer(df["COMPOUND_ID"])
+        found = compound_groups >= 0
+        mean_nontarget = np.full(len(df), np.nan)
+        mean_nontarget[found] = other_means[compound_groups[found]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            easms_enrichment = df["TARGET_VALUE"].to_numpy(dtype=float) / mean_nontarget
+        easms_enrichment[np.isnan(mean_nontarget) | (mean_nontarget == 0)] = np.nan
+
+        df["EASMS_ENRICHMENT"] = easms_enrichment
+        df["MEAN_NONTARGET_VALUES"] = mean_nontarget
+
+        # PVALUE: Welch t-test of the compound's replicates against its replicates in the other files
+        df["PVALUE"] = compute_pvalues(df, merged_other)
+
+    return dataframes
+
+def _add_target_values(dataframes):
+    # Ensure necessary columns exist
+    required_columns = {"COMPOUND_ID", "POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"}
+    for filename, df in dataframes.items():
+        if not required_columns.issubset(df.columns):
+            raise ValueError(f"Missing required columns in {filename}: {required_columns - set(df.columns)}")
+
+    # Compute TARGET_VALUE for each df
+    for df in dataframes.values():
+        df["TARGET_VALUE"] = pd.to_numeric(
+            df[["POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]]
+            .mean(axis=1, skipna=True), errors="coerce"
+        )
+
+def _scores_from_statistics(target_values, values, other):
+    """
+    Score columns of target rows, from their TARGET_VALUE, replicates and TargetStatistics.leave_one_out.
+
+    Returns:
+        dict: Column name -> array, in the column order of compute_and_add_scores.
+    """
+    scores = {}
+    # SELECTIVE_VALUE & NTC_VALUE
+    scores["SELECTIVE_VALUE"] = other["selective_value"]
+    scores["NTC_VALUE"] = other["ntc_value"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # ENRICHMENT calculations
+        scores["ENRICHMENT"] = target_values / scores["NTC_VALUE"]
+        scores["SELECTIVE_ENRICHMENT"] = target_values / scores["SELECTIVE_VALUE"]
+
+        # EASMS_ENRICHMENT and MEAN_NONTARGET_VALUES, empty for compounds absent from the other files
+        mean_nontarget = np.where(other["rows"] > 0, other["mean_nontarget"], np.nan)
+        easms_enrichment = target_values / mean_nontarget
+    easms_enrichment[np.isnan(mean_nontarget) | (mean_nontarget == 0)] = np.nan
+    scores["EASMS_ENRICHMENT"] = easms_enrichment
+    scores["MEAN_NONTARGET_VALUES"] = mean_nontarget
+
+    # PVALUE: Welch t-test of the compound's replicates against its replicates in the other files
+    scores["PVALUE"] = welch_pvalues_from_moments(
+        *row_moments(values), other["value_count"], other["value_mean"], other["value_var"]
+    )
+    return scores
+
+def _add_scores_from_statistics(df, other):
+    """
+    Adds the score columns to one target's DataFrame, from the TargetStatistics.leave_one_out of its compounds.
+    """
+    scores = _scores_from_statistics(df["TARGET_VALUE"].to_numpy(dtype=float), replicate_values(df), other)
+    for column, values in scores.items():
+        df[column] = values
+
+def _apply_target_changes(target_statistics, changed_frames, removed_targets=()):
+    """
+    Updates the statistics for new/corrected and removed targets.
+
+    Returns:
+        dict: Statistic name -> boolean mask of the compounds whose statistic changed in any target.
+    """
+    _add_target_values(changed_frames)
+    changes = [target_statistics.remove(target_name(key)) for key in removed_targets]
+    changes += [target_statistics.update(target_name(key), df) for key, df in changed_frames.items()]
+
+    n_compounds = len(target_statistics.compounds)
+    changed = {name: np.zeros(n_compounds, dtype=bool) for name in target_statistics.stats}
+    for change in changes:
+        for name, mask in change.items():
+            changed[name][:len(mask)] |= mask
+    return changed
+
+def _rescore_changed_rows(df, key, target_statistics, changed):
+    """
+    Recomputes, in an already scored DataFrame, the score columns whose statistics changed for its compounds.
+
+    Returns:
+        bool: True if any row was recomputed.
+    """
+    codes = target_statistics.compounds.get_indexer(pd.Index(df["COMPOUND_ID"]))
+    known = codes >= 0
+    column_rows = {}
+    for column, dependencies in SCORE_DEPENDENCIES.items():
+        compounds = np.logical_or.reduce([changed[name] for name in dependencies])
+        column_rows[column] = known & compounds[np.where(known, codes, 0)]
+    rows = np.logical_or.reduce(list(column_rows.values()))
+    if not rows.any():
+        return False
+
+    other = target_statistics.leave_one_out(target_name(key), df["COMPOUND_ID"][rows])
+    scores = _scores_from_statistics(
+        df["TARGET_VALUE"].to_numpy(dtype=float)[rows], replicate_values(df)[rows], other
+    )
+    for column, values in scores.items():
+        updated = df[column].to_numpy(dtype=float, copy=True)
+        updated[column_rows[column]] = values[column_rows[column][rows]]
+        df[column] = updated
+    return True
+
+def update_scores(dataframes, target_statistics, changed_targets=(), removed_targets=()):
+    """
+    Updates the scores of a set of per-target DataFrames after targets were added, corrected or removed,
+    without rescoring the targets whose leave-one-out statistics did not change.
+
+    Args:
+        dataframes (dict): Target key -> DataFrame. The changed targets are (re)scored completely; the others must
+            already be scored and only the score columns depending on changed statistics are recomputed, for the
+            rows of the compounds concerned. Targets without such compounds may be left out of the dict.
+        target_statistics (TargetStatistics): Statistics of the targets before the change (e.g. from
+            TargetStatistics.load); updated in place.
+        changed_targets (iterable): Keys of new or corrected targets.
+        removed_targets (iterable): Keys of targets that no longer exist.
+
+    Returns:
+        list: Keys of the DataFrames that were modified.
+    """
+    changed_targets = list(changed_targets)
+    changed = _apply_target_changes(
+        target_statistics, {key: dataframes[key] for key in changed_targets}, removed_targets
+    )
+
+    updated = []
+    for key, df in dataframes.items():
+        if key in changed_targets:
+            print(f"\n Processing: {os.path.basename(key)}")
+            _add_scores_from_statistics(df, target_statistics.leave_one_out(target_name(key), df["COMPOUND_ID"]))
+            updated.append(key)
+        elif _rescore_changed_rows(df, key, target_statistics, changed):
+            print(f"\n Updated scores: {os.path.basename(key)}")
+            updated.append(key)
+    return updated
+
+def update_scores_in_files(file_paths, changed_files, statistics_path):
+    """
+    Incremental compute_and_add_scores for a batch whose files were scored with a statistics store.
+
+    Only the changed files and the files sharing compounds with them are read; only the files whose scores changed
+    are rewritten. Targets of the store without a file in file_paths are removed from it. Without a store at
+    statistics_path, all files are scored with compute_and_add_scores and the store is created.
+
+    Args:
+        file_paths (list): All current per-target CSV files of the batch.
+        changed_files (list): The new or corrected files among them.
+        statistics_path (str): Path of the TargetStatistics Parquet store.
+
+    Returns:
+        list: Paths of the rewritten files.
+    """
+    if not os.path.exists(statistics_path):
+        compute_and_add_scores(file_paths, statistics_path=statistics_path)
+        return list(file_paths)
+
+    target_statistics = TargetStatistics.load(statistics_path)
+    paths = {target_name(f): f for f in file_paths}
+    changed_frames = {f: pd.read_csv(f) for f in changed_files}
+    removed_targets = [target for target in target_statistics.targets if target not in paths]
+
+    # Only files sharing a compound with a changed or removed target (before or after the change) can be affected
+    touched = target_statistics.compounds.isin(
+        pd.concat([df["COMPOUND_ID"] for df in changed_frames.values()] + [pd.Series(dtype=object)])
+    )
+    for target in removed_targets + [target_name(f) for f in changed_frames]:
+        if target in target_statistics.targets:
+            touched |= target_statistics.stats["rows"][:, target_statistics.targets.index(target)] > 0
+    present = (target_statistics.stats["rows"][touched] > 0).any(axis=0)
+    dataframes = dict(changed_frames)
+    for target, found in zip(target_statistics.targets, present):
+        if found and target in paths and paths[target] not in dataframes:
+            dataframes[paths[target]] = pd.read_csv(paths[target])
+
+    updated = update_scores(dataframes, target_statistics, changed_frames, removed_targets)
+
+    _save_scored_files({file_path: dataframes[file_path] for file_path in updated})
+    target_statistics.save(statistics_path)
+    return updated
 
+def _save_scored_files(dataframes):
     # Step 3: Save the updated files
     for file_path, df in dataframes.items():
         df.to_csv(file_path, index=False)
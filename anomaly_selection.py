@@ -1,11 +1,68 @@
 import os
+import numpy as np
 import pandas as pd
 import warnings
+from canonicalization import canonical_keys
 
 # Suppress FutureWarnings for pandas operations
 # warnings.simplefilter(action='ignore', category=FutureWarning)
 
-def filter_anomalous_data(df, sep_file_name):
+# Suggested dedup key: a measurement is identified by its compound and replicate intensities
+DEDUP_KEY = ["COMPOUND_ID", "SMILES", "POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]
+
+def drop_duplicate_keys(df, dedup_key):
+    """
+    Drops rows whose dedup key columns repeat an earlier row, like df.drop_duplicates(subset=dedup_key).
+
+    Each key column is factorized to integer codes (so equal values, NaN included, get equal codes exactly as in
+    drop_duplicates), and the codes of a row are hashed to one uint64 (pd.util.hash_pandas_object), so only the
+    hashes are compared. Rows found duplicate by hash are checked against the codes of their first occurrence; if
+    any hash turns out to be shared by different keys, the exact df.drop_duplicates(subset=dedup_key) is used.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame.
+        dedup_key (list): Columns identifying a row.
+
+    Returns:
+        pd.DataFrame: The first row of each key, in the original order.
+    """
+    missing = set(dedup_key) - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing dedup key columns: {missing}")
+
+    codes = pd.DataFrame({col: pd.factorize(df[col])[0] for col in dedup_key})
+    hashes = pd.util.hash_pandas_object(codes, index=False).to_numpy()
+    # factorize numbers the hashes in order of appearance: a row is the first of its hash if its code is new
+    hash_codes = pd.factorize(hashes)[0]
+    duplicate = hash_codes <= np.maximum.accumulate(np.concatenate([[-1], hash_codes[:-1]]))
+    first = np.flatnonzero(~duplicate)
+
+    # Confirm that the rows dropped by hash have the same key as the row kept
+    codes = codes.to_numpy()
+    if not np.array_equal(codes[duplicate], codes[first[hash_codes[duplicate]]]):
+        return df.drop_duplicates(subset=dedup_key)
+    return df[~duplicate]
+
+def check_dedup_key(df, dedup_key):
+    """
+    Checks that deduplicating on dedup_key drops the same rows as the full-row df.drop_duplicates().
+
+    Args:
+        df (pd.DataFrame): Data to check the key on (e.g. a separated file).
+        dedup_key (list): Columns identifying a row.
+
+    Returns:
+        bool: True if both keep exactly the same rows.
+    """
+    full_row = df.drop_duplicates().index
+    by_key = drop_duplicate_keys(df, dedup_key).index
+    if full_row.equals(by_key):
+        return True
+    print(f"Warning: dedup key {dedup_key} keeps {len(by_key)} rows, full-row deduplication keeps {len(full_row)}; "
+          f"{len(full_row.difference(by_key))} rows repeat a key but differ in other columns.")
+    return False
+
+def filter_anomalous_data(df, sep_file_name, dedup_key=None, canonical=False):
     """
     Filters duplicate rows and processes SMILES with different ENRICHMENT values:
     - If all rows for a SMILES have ENRICHMENT < 1, keeps only the row with the smallest ENRICHMENT.
@@ -17,6 +74,10 @@ def filter_anomalous_data(df, sep_file_name):
     Args:
         df (pd.DataFrame): The input DataFrame.
         sep_file_name (str): The name of the separated CSV file being processed.
+        dedup_key (list or None): Columns identifying duplicate rows (e.g. DEDUP_KEY), deduplicated with
+            drop_duplicate_keys. None compares full rows. Use check_dedup_key to confirm a key on the data first.
+        canonical (bool): Group rows on their canonical SMILES (canonicalization.canonical_keys), so the same
+            compound spelled differently is one group. False (the default) groups on the SMILES strings.
 
     Returns:
         pd.DataFrame: Cleaned DataFrame with anomalies handled.
@@ -27,15 +88,18 @@ def filter_anomalous_data(df, sep_file_name):
     if not required_columns.issubset(df.columns):
         raise ValueError(f"Missing required columns: {required_columns - set(df.columns)}")
 
-    # Step 1: Remove fully duplicate rows
-    df_cleaned = df.drop_duplicates()
+    # Step 1: Remove fully duplicate rows (or rows with a duplicate key)
+    df_cleaned = df.drop_duplicates() if dedup_key is None else drop_duplicate_keys(df, dedup_key)
 
     # Step 2: Identify SMILES that have multiple ENRICHMENT values
-    enrichment_groups = df_cleaned.groupby("SMILES")["ENRICHMENT"].nunique()
+    smiles = df_cleaned["SMILES"]
+    if canonical:
+        smiles = pd.Series(canonical_keys(smiles), index=df_cleaned.index, dtype=object, name="SMILES")
+    enrichment_groups = df_cleaned.groupby(smiles)["ENRICHMENT"].nunique()
     conflicting_smiles = enrichment_groups[enrichment_groups > 1].index.tolist()
 
     # Prepare log dataframe with all conflicting SMILES before filtering
-    conflict_log_df = df_cleaned[df_cleaned["SMILES"].isin(conflicting_smiles)].copy()
+    conflict_log_df = df_cleaned[smiles.isin(conflicting_smiles)].copy()
 
     # Prepare DataFrames for keeping and removing rows
     rows_to_keep_df = pd.DataFrame(columns=df_cleaned.columns)
@@ -75,26 +139,30 @@ def filter_anomalous_data(df, sep_file_name):
                 
             '''
                 
-    for smiles in conflicting_smiles:
-        subset = df_cleaned[df_cleaned["SMILES"] == smiles]  # Get all rows for this SMILES
-
-        if subset["EASMS_ENRICHMENT"].max() <= 1:  
-            # All values are < 1 → Keep the row with the lowest ENRICHMENT
-            best_row = subset.loc[[subset["EASMS_ENRICHMENT"].idxmin()]]
-            if not best_row.empty:
-                rows_to_keep_df = pd.concat([rows_to_keep_df, best_row], ignore_index=True)
-        elif subset["EASMS_ENRICHMENT"].min() > 1:  
-            # All values are > 5 → Keep the row with the highest ENRICHMENT
-            best_row = subset.loc[[subset["EASMS_ENRICHMENT"].idxmax()]]
-            if not best_row.empty:
-                rows_to_keep_df = pd.concat([rows_to_keep_df, best_row], ignore_index=True)
+    # One grouped pass over the conflicting SMILES (in SMILES order, as the groups are listed):
+    # - all EASMS_ENRICHMENT <= 1 → keep the row with the lowest EASMS_ENRICHMENT
+    # - all EASMS_ENRICHMENT > 1 → keep the row with the highest EASMS_ENRICHMENT
+    # - mixed (or no EASMS_ENRICHMENT at all) → remove the entire subset
+    in_conflict = smiles.isin(conflicting_smiles)
+    conflicting, conflicting_keys = df_cleaned[in_conflict], smiles[in_conflict]
+    group_range = conflicting.groupby(conflicting_keys)["EASMS_ENRICHMENT"].agg(["min", "max"])
+    keep_min = group_range.index[group_range["max"] <= 1]
+    keep_max = group_range.index[group_range["min"] > 1]
+
+    best_rows = pd.concat([
+        conflicting[conflicting_keys.isin(keep_min)].groupby(conflicting_keys)["EASMS_ENRICHMENT"].idxmin(),
+        conflicting[conflicting_keys.isin(keep_max)].groupby(conflicting_keys)["EASMS_ENRICHMENT"].idxmax(),
+    ])
+    if len(best_rows):
+        best_rows = best_rows.reindex(group_range.index[group_range.index.isin(best_rows.index)])
+        rows_to_keep_df = pd.concat([rows_to_keep_df, df_cleaned.loc[best_rows.tolist()]], ignore_index=True)
 
     # Add HAD_DUPLICATE_INTENSITY column
-    df_cleaned.loc[~df_cleaned["SMILES"].isin(conflicting_smiles), "HAD_DUPLICATE_INTENSITY"] = "N"
+    df_cleaned.loc[~in_conflict, "HAD_DUPLICATE_INTENSITY"] = "N"
     rows_to_keep_df["HAD_DUPLICATE_INTENSITY"] = "Y"
 
     # Step 3: Merge back with non-conflicting SMILES
-    final_df = pd.concat([df_cleaned[~df_cleaned["SMILES"].isin(conflicting_smiles)], rows_to_keep_df], ignore_index=True)
+    final_df = pd.concat([df_cleaned[~in_conflict], rows_to_keep_df], ignore_index=True)
 
 
     return final_df
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Shared SMILES canonicalization.
+
+SmilesCanonicalizer maps SMILES to their RDKit canonical SMILES through a bounded in-process LRU, optionally backed by
+a persistent SQLite store, so each unique SMILES is parsed once per deployment instead of once per pipeline stage.
+CANONICALIZER is the instance shared by the stages of a process (negatives, anomaly grouping, fingerprint cache).
+"""
+
+import math
+import os
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from rdkit import rdBase
+
+from utils import canonical_smiles
+
+
+def _canonicalize_chunk(smiles_chunk):
+    """
+    Canonicalizes one shard of SMILES inside a pool worker.
+    """
+    return [canonical_smiles(smi) for smi in smiles_chunk]
+
+
+class SmilesCanonicalizer:
+    """
+    Memoized SMILES -> canonical SMILES mapping.
+
+    Args:
+        max_size (int): Number of SMILES kept in the in-process LRU.
+        store_path (str or None): SQLite file persisting the mapping across runs, created if it does not exist.
+            The store is emptied when the RDKit version changes, as canonical SMILES can change with it.
+
+    Notes:
+        SMILES RDKit cannot parse map to None (and are memoized as such); values that are not strings map to None.
+        A process forked from the owner of a store reopens it on first use, so pool workers can share one store.
+    """
+
+    _BATCH_SIZE = 500  # stays below SQLite's default limit on bound parameters
+
+    def __init__(self, max_size=500_000, store_path=None):
+        self.max_size = max_size
+        self._lru = OrderedDict()
+        self._store_path = None
+        self._conn = None
+        self._conn_pid = None
+        if store_path is not None:
+            self.open_store(store_path)
+
+    def open_store(self, store_path):
+        """
+        Attaches (or, with None, detaches) the persistent store.
+        """
+        self.close()
+        self._store_path = store_path
+        if store_path is not None:
+            self._connect()
+
+    def close(self):
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self._store_path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS smiles_alias (smiles TEXT PRIMARY KEY, canonical TEXT)")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'rdkit_version'").fetchone()
+            if row is None or row[0] != rdBase.rdkitVersion:
+                conn.execute("DELETE FROM smiles_alias")
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rdkit_version', ?)", (rdBase.rdkitVersion,))
+        self._conn = conn
+        self._conn_pid = os.getpid()
+
+    def _store(self):
+        """
+        Returns the connection to the store of this process, or None without a store.
+        """
+        if self._store_path is None:
+            return None
+        if self._conn_pid != os.getpid():
+            # a connection inherited through fork must not be used
+            self._conn = None
+            self._connect()
+        return self._conn
+
+    def cached(self, smiles):
+        """
+        Returns the in-process canonical SMILES of the given SMILES, without parsing or querying the store.
+
+        Returns:
+            dict: SMILES -> canonical SMILES (or None) for the SMILES found in the LRU.
+        """
+        found = {}
+        for smi in smiles:
+            if smi in self._lru:
+                self._lru.move_to_end(smi)
+                found[smi] = self._lru[smi]
+        return found
+
+    def remember(self, canonical):
+        """
+        Adds SMILES canonicalized elsewhere (dict SMILES -> canonical SMILES or None) to the LRU.
+        """
+        for smi, key in canonical.items():
+            self._lru[smi] = key
+            self._lru.move_to_end(smi)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def canonicalize(self, smi):
+        """
+        Returns the canonical SMILES of one SMILES, or None if it cannot be parsed.
+        """
+        return self.canonicalize_many([smi])[0]
+
+    def canonicalize_many(self, smiles, n_jobs=1, chunk_size=None):
+        """
+        Canonicalizes a batch, parsing only the unique SMILES found neither in the LRU nor in the store.
+
+        Args:
+            smiles (iterable): The input SMILES.
+            n_jobs (int): Number of worker processes the SMILES to parse are sharded across.
+            chunk_size (int or None): Number of SMILES per shard when n_jobs > 1. Defaults to about four shards per
+                worker.
+
+        Returns:
+            list: Canonical SMILES per input, None if it cannot be parsed or is not a string.
+        """
+        smiles = list(smiles)
+        unique_smis = list(dict.fromkeys(smi for smi in smiles if isinstance(smi, str)))
+        known = self.cached(unique_smis)
+        missing = [smi for smi in unique_smis if smi not in known]
+
+        conn = self._store() if missing else None
+        if conn is not None:
+            stored = {}
+            for start in range(0, len(missing), self._BATCH_SIZE):
+                batch = missing[start:start + self._BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                stored.update(conn.execute(
+                    f"SELECT smiles, canonical FROM smiles_alias WHERE smiles IN ({placeholders})", batch
+                ).fetchall())
+            known.update(stored)
+            missing = [smi for smi in missing if smi not in stored]
+
+        if missing:
+            if n_jobs > 1 and len(missing) > 1:
+                if chunk_size is None:
+                    # a few chunks per worker keeps the pool busy when some shards are slower than others
+                    chunk_size = max(1, math.ceil(len(missing) / (n_jobs * 4)))
+                chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    computed = [key for chunk in executor.map(_canonicalize_chunk, chunks) for key in chunk]
+            else:
+                computed = _canonicalize_chunk(missing)
+            new_aliases = dict(zip(missing, computed))
+            known.update(new_aliases)
+            if conn is not None:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO smiles_alias (smiles, canonical) VALUES (?, ?)", new_aliases.items()
+                    )
+
+        self.remember(known)
+        return [known.get(smi) if isinstance(smi, str) else None for smi in smiles]
+
+
+# Canonicalizer shared by the pipeline steps of a process
+CANONICALIZER = SmilesCanonicalizer()
+
+
+def canonical_keys(smiles, n_jobs=1):
+    """
+    Returns a grouping key per SMILES that does not depend on how the SMILES is spelled.
+
+    Args:
+        smiles (iterable): SMILES strings; other values (NaN, None) are missing.
+        n_jobs (int): Number of worker processes used for SMILES not canonicalized before.
+
+    Returns:
+        list: RDKit canonical SMILES per input, the SMILES itself if RDKit cannot parse it, None if missing.
+    """
+    smiles = list(smiles)
+    canonical = CANONICALIZER.canonicalize_many(smiles, n_jobs=n_jobs)
+    return [key if key is not None or not isinstance(smi, str) else smi for smi, key in zip(smiles, canonical)]
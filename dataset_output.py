@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Hive-partitioned Parquet datasets of the curated targets.
+
+With output_format="dataset" (Main.main), every curated target is written once per output folder, as one file of a
+dataset partitioned by raw batch and target:
+
+    <output_dir>/Dataset/AsmBatchNumber=<batch>/TARGET_ID=<target>/<base_name>.parquet
+
+Following the Hive convention, the partition columns are stored in the directory names, not in the files; the
+original column order is kept in the file metadata. Fingerprint columns are typed fixed-size list columns, as in
+fingerprint_storage.write_parquet. finalize_dataset gives all files one shared schema once every target is written.
+
+Read a dataset (or some of its partitions) with read_dataset, e.g.
+    read_dataset(root, columns=["SMILES", "LABEL", "ECFP4"], filters=[("TARGET_ID", "in", ["T0", "T1"])])
+and write the per-target CSV files of the file-based layout with export_csv.
+"""
+
+import json
+import os
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from fingerprint_storage import arrow_to_dataframe, dataframe_to_arrow, fingerprints_to_strings
+
+DATASET_DIR = "Dataset"
+PARTITION_COLUMNS = ["AsmBatchNumber", "TARGET_ID"]
+_COLUMNS_KEY = b"dataset_columns"
+_PARTITION_DTYPES_KEY = b"dataset_partition_dtypes"
+
+# Partition values are read as strings (not inferred, e.g. batch "1" as int32) and cast back to the dtype the column
+# had when it was written
+_PARTITIONING = ds.partitioning(pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]), flavor="hive")
+
+# Integer columns with missing values (e.g. object columns of ints and NaN after adding negatives) are read back as
+# pandas nullable integers, so they are written as in the file-based layout ("1", not "1.0")
+_NULLABLE_INTEGERS = {
+    pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype(),
+    pa.uint8(): pd.UInt8Dtype(), pa.uint16(): pd.UInt16Dtype(), pa.uint32(): pd.UInt32Dtype(),
+    pa.uint64(): pd.UInt64Dtype(),
+}
+
+
+def dataset_root(output_dir):
+    """
+    Returns the folder of the dataset written to an output folder.
+    """
+    return os.path.join(output_dir, DATASET_DIR)
+
+
+def partition_values(base_name):
+    """
+    Returns the partition values of a target from its base name ("<TARGET_ID>_AsmBatchNumber<ASMS_BATCH_NUM>").
+
+    Returns:
+        dict: Partition column -> value, in PARTITION_COLUMNS order.
+    """
+    target_id, separator, batch = base_name.rpartition("_AsmBatchNumber")
+    if not separator:
+        raise ValueError(f"Cannot read the batch and target from '{base_name}'")
+    return {"AsmBatchNumber": batch, "TARGET_ID": target_id}
+
+
+def write_target(df, root, base_name):
+    """
+    Writes (or replaces) the file of one target in a dataset.
+
+    Args:
+        df (pd.DataFrame): The target's rows; fingerprint columns may hold per-row arrays (fp_format="array").
+        root (str): Folder of the dataset.
+        base_name (str): Base name of the target, giving its partition (see partition_values) and file name.
+
+    Returns:
+        str: Path of the written file.
+    """
+    values = partition_values(base_name)
+    folder = os.path.join(root, *(f"{column}={quote(str(value), safe='')}" for column, value in values.items()))
+    os.makedirs(folder, exist_ok=True)
+
+    table = dataframe_to_arrow(df.drop(columns=[col for col in PARTITION_COLUMNS if col in df.columns]))
+    metadata = dict(table.schema.metadata or {})
+    metadata[_COLUMNS_KEY] = json.dumps([str(col) for col in df.columns]).encode()
+    partition_dtypes = {col: str(df[col].dtype) for col in values if col in df.columns}
+    metadata[_PARTITION_DTYPES_KEY] = json.dumps(partition_dtypes).encode()
+    path = os.path.join(folder, f"{base_name}.parquet")
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+    return path
+
+
+def dataset_files(root):
+    """
+    Lists the files of a dataset.
+
+    Returns:
+        list: (base_name, partition values, path) of every target file, sorted by path.
+    """
+    files = []
+    for folder, subfolders, names in os.walk(root):
+        subfolders[:] = sorted(name for name in subfolders if not name.startswith(("_", ".")))
+        for name in sorted(names):
+            if name.endswith(".parquet") and not name.startswith(("_", ".")):
+                relative = os.path.relpath(folder, root).split(os.sep)
+                values = dict(part.split("=", 1) for part in relative if "=" in part)
+                files.append((name[:-len(".parquet")], {col: unquote(value) for col, value in values.items()},
+                              os.path.join(folder, name)))
+    return files
+
+
+def finalize_dataset(root):
+    """
+    Gives all files of a dataset one shared schema and saves it as <root>/_common_metadata.
+
+    Targets are written independently (possibly by different processes), so a column can be typed differently in
+    some files, e.g. all-missing (null) in one target and text in another. The file schemas are unified (nulls and
+    integers are promoted as needed) and the files that differ are rewritten with the shared schema.
+
+    Returns:
+        pa.Schema or None: The shared schema, None if the dataset is empty.
+    """
+    files = [path for _, _, path in dataset_files(root)]
+    if not files:
+        return None
+    schemas = {path: pq.read_schema(path) for path in files}
+    try:
+        schema = pa.unify_schemas(list(schemas.values()), promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"Warning: The files of {root} do not have compatible schemas ({e}). Leaving them unchanged.")
+        return None
+
+    field_names = schema.names
+    for path, file_schema in schemas.items():
+        if file_schema.equals(schema, check_metadata=False) and file_schema.names == field_names:
+            continue
+        table = pq.read_table(path)
+        # missing columns become all-null, and the column order is the shared one
+        columns = [
+            table.column(field.name).cast(field.type) if field.name in table.column_names
+            else pa.nulls(len(table), field.type)
+            for field in schema
+        ]
+        table = pa.Table.from_arrays(columns, schema=schema.with_metadata(file_schema.metadata))
+        pq.write_table(table, path)
+    pq.write_metadata(schema, os.path.join(root, "_common_metadata"))
+    return schema
+
+
+def _restore_columns(df, partitions, columns, dtypes):
+    """
+    Adds the partition columns that were data columns back to a frame read from a single file, in their original
+    order and dtype.
+    """
+    for col, value in partitions.items():
+        if col in columns and col not in df.columns:
+            df[col] = pd.Series([value] * len(df), index=df.index).astype(dtypes.get(col, object))
+    return df[[col for col in columns if col in df.columns]]
+
+
+def _stored_metadata(schema, key, default):
+    return json.loads((schema.metadata or {}).get(key, default))
+
+
+def read_dataset(root, columns=None, filters=None):
+    """
+    Reads a dataset, or some of its partitions and columns, as one DataFrame.
+
+    Args:
+        root (str): Folder of the dataset.
+        columns (list or None): Columns to read (partition columns included); None reads all of them.
+        filters (list or None): Row filters in the pyarrow/pandas format, e.g. [("TARGET_ID", "=", "T0")];
+            filters on partition columns skip the other partitions without reading them.
+
+    Returns:
+        pd.DataFrame: The rows of the matching targets. Partition columns that were data columns have their original
+            dtype (the others are strings); fingerprint columns hold one NumPy array per row in their stored dtype
+            (None for failed molecules); integer columns with missing values are pandas nullable integers.
+    """
+    table = pq.read_table(root, columns=columns, filters=filters, partitioning=_PARTITIONING)
+    df = arrow_to_dataframe(table, types_mapper=_NULLABLE_INTEGERS.get)
+    files = dataset_files(root)
+    if files:
+        schema = pq.read_schema(files[0][2])
+        for col, dtype in _stored_metadata(schema, _PARTITION_DTYPES_KEY, b"{}").items():
+            if col in df.columns:
+                df[col] = df[col].astype(dtype)
+        if columns is None:
+            stored = _stored_metadata(schema, _COLUMNS_KEY, b"[]")
+            df = df[[col for col in stored if col in df.columns] + [col for col in df.columns if col not in stored]]
+    return df
+
+
+def export_csv(root, output_dir, prefix, columns=None):
+    """
+    Writes one CSV file per target of a dataset (<output_dir>/<prefix><base_name>.csv), as in the file-based layout.
+
+    Args:
+        root (str): Folder of the dataset.
+        output_dir (str): Folder of the CSV files.
+        prefix (str): File name prefix (e.g. "MLReadyPlusFPs_").
+        columns (list or None): Columns to export, in this order (missing ones are skipped); None exports all
+            columns in their original order.
+
+    Returns:
+        list: Paths of the written CSV files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for base_name, partitions, path in dataset_files(root):
+        table = pq.read_table(path)
+        stored = _stored_metadata(table.schema, _COLUMNS_KEY, b"[]") or table.column_names
+        dtypes = _stored_metadata(table.schema, _PARTITION_DTYPES_KEY, b"{}")
+        df = arrow_to_dataframe(table, types_mapper=_NULLABLE_INTEGERS.get)
+        df = _restore_columns(df, partitions, stored, dtypes)
+        if columns is not None:
+            df = df[[col for col in columns if col in df.columns]]
+        output_path = os.path.join(output_dir, f"{prefix}{base_name}.csv")
+        fingerprints_to_strings(df).to_csv(output_path, index=False)
+        written.append(output_path)
+    print(f"Exported {len(written)} CSV files from {root} to {output_dir}")
+    return written
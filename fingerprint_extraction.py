@@ -5,17 +5,25 @@ Created on Sun Mar  2 17:29:20 2025
 @author: shagh
 """
 
+import math
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-from rdkit import Chem
+from scipy import sparse as sp
 from rdkit.Chem import Descriptors
 from fingerprints import HitGenMACCS, HitGenECFP4, HitGenECFP6, HitGenFCFP4, HitGenFCFP6, HitGenRDK, HitGenAvalon, HitGenTopTor, HitGenAtomPair
+from fingerprints import multi_radius_morgan_pairs
+from utils import to_mol
+
+# Settings under which MW/ALOGP are stored in a FingerprintCache
+MOLECULAR_PROPERTIES_SETTINGS = {"name": "MolWt,MolLogP"}
 
 def compute_molecular_properties(smiles):
     """
-    Computes molecular properties (MW, ALOGP) for a given SMILES.
+    Computes molecular properties (MW, ALOGP) for a given SMILES or RDKit Mol.
     """
-    mol = Chem.MolFromSmiles(smiles)
+    mol = to_mol(smiles)
     if mol:
         mw = Descriptors.MolWt(mol)
         alogp = Descriptors.MolLogP(mol)
@@ -24,43 +32,320 @@ def compute_molecular_properties(smiles):
         alogp = np.nan
     return mw, alogp
 
-def generate_fingerprints(smiles, fps_dict):
+def fingerprint_to_string(fp_array, valid=True):
     """
-    Generates fingerprints for a given SMILES string.
+    Converts a single fingerprint row into the comma-joined string stored in the output files.
+    Failed molecules (valid=False) are written as a run of 'nan' values.
+    """
+    if not valid:
+        return ','.join(['nan'] * len(fp_array))
+    return ','.join(map(str, fp_array.tolist()))
 
-    Args:
-        smiles (str): The input SMILES.
-        fps_dict (dict): Dictionary of fingerprint classes.
+def fingerprint_to_arrays(fp_array, valid):
+    """
+    Converts an (N, d) fingerprint array into a list of per-row arrays, with None for failed molecules.
+    """
+    return [row if row_valid else None for row, row_valid in zip(fp_array, valid)]
+
+def _generate_fps_for_mols(fp_class, mols, backend="native", sparse=False, num_threads=1):
+    """
+    Runs one fingerprint class over a list of already parsed (valid) Mols.
 
     Returns:
-        dict: Dictionary with fingerprint names as keys and fingerprint data as values.
+        tuple: (fps, ok) where fps is an (N, d) array (a CSR matrix if sparse) of dtype fp_class.fp_dtype() and ok
+            marks the Mols the fingerprint function succeeded on. Only if the whole batch raises are the Mols retried
+            one at a time, so a single bad Mol only invalidates its own row.
+    """
+    try:
+        fps, _ = fp_class.generate_fps(
+            smis=mols, backend=backend, num_threads=num_threads, return_valid=True, sparse=sparse
+        )
+        return fps, np.ones(len(mols), dtype=bool)
+    except Exception:
+        ok = np.zeros(len(mols), dtype=bool)
+        rows = []
+        for i, mol in enumerate(mols):
+            try:
+                rows.append(fp_class.generate_fps(smis=[mol], backend=backend, return_valid=True, sparse=sparse)[0])
+                ok[i] = True
+            except Exception:
+                if sparse:
+                    rows.append(sp.csr_matrix((1, fp_class._dimension), dtype=fp_class.fp_dtype()))
+                else:
+                    rows.append(np.zeros((1, fp_class._dimension), dtype=fp_class.fp_dtype()))
+        fps = sp.vstack(rows, format="csr") if sparse else np.vstack(rows)
+        return fps, ok
+
+def _scatter_sparse_rows(fps, rows, n_rows):
+    """
+    Places row j of a CSR matrix at position rows[j] (sorted) of a CSR matrix with n_rows rows; the others are empty.
+    """
+    row_nnz = np.zeros(n_rows, dtype=np.int64)
+    row_nnz[rows] = np.diff(fps.indptr)
+    indptr = np.concatenate([[0], np.cumsum(row_nnz)])
+    return sp.csr_matrix((fps.data, fps.indices, indptr), shape=(n_rows, fps.shape[1]))
+
+def _clear_sparse_rows(fps, keep):
+    """
+    Empties the rows of a CSR matrix where keep is False, without densifying it.
+    """
+    row_nnz = np.diff(fps.indptr)
+    kept = np.repeat(keep, row_nnz)
+    indptr = np.concatenate([[0], np.cumsum(np.where(keep, row_nnz, 0))])
+    return sp.csr_matrix((fps.data[kept], fps.indices[kept], indptr), shape=fps.shape)
+
+# Fingerprint objects owned by a pool worker, built once per worker by _worker_fingerprints
+_worker_fps_dict = None
+
+def _worker_fingerprints(fp_types):
+    """
+    Builds the fingerprint objects once per worker process.
+    Only the classes are sent to the workers, as the RDKit functions held by the objects cannot be pickled.
+    They are built on the first shard rather than in a pool initializer, so any pool (e.g. the curation pool in
+    Main.py) can featurize.
+    """
+    global _worker_fps_dict
+    if _worker_fps_dict is None or {
+        fp_name: type(fp_class) for fp_name, fp_class in _worker_fps_dict.items()
+    } != fp_types:
+        _worker_fps_dict = {fp_name: fp_type() for fp_name, fp_type in fp_types.items()}
+    return _worker_fps_dict
+
+def _featurize_chunk(smiles_chunk, fp_types, compute_properties, backend, sparse, num_threads):
+    """
+    Featurizes one shard of SMILES inside a pool worker.
+    """
+    return featurize(
+        smiles_chunk, _worker_fingerprints(fp_types), compute_properties=compute_properties, backend=backend,
+        fail_mode="mask", sparse=sparse, num_threads=num_threads
+    )
+
+def _featurize_parallel(smiles, fps_dict, compute_properties, n_jobs, chunk_size, backend, sparse=False,
+                        num_threads=1, executor=None):
+    """
+    Shards the SMILES across a pool of worker processes and reassembles the chunks in row order.
+    Uses executor if given, otherwise a pool of n_jobs processes that lives for this call.
+    """
+    if chunk_size is None:
+        # a few chunks per worker keeps the pool busy when some shards are slower than others
+        chunk_size = max(1, math.ceil(len(smiles) / (n_jobs * 4)))
+    chunks = [smiles[start:start + chunk_size] for start in range(0, len(smiles), chunk_size)]
+    fp_types = {fp_name: type(fp_class) for fp_name, fp_class in fps_dict.items()}
+
+    def run(pool):
+        return list(pool.map(
+            _featurize_chunk, chunks, [fp_types] * len(chunks), [compute_properties] * len(chunks),
+            [backend] * len(chunks), [sparse] * len(chunks), [num_threads] * len(chunks)
+        ))
+
+    if executor is not None:
+        results = run(executor)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as own_executor:
+            results = run(own_executor)
+
+    stack = (lambda blocks: sp.vstack(blocks, format="csr")) if sparse else np.concatenate
+    fp_arrays = {fp_name: stack([chunk_fps[fp_name] for chunk_fps, _, _ in results]) for fp_name in fps_dict}
+    molecular_props_df = pd.concat([chunk_props for _, chunk_props, _ in results], ignore_index=True)
+    valid = np.concatenate([chunk_valid for _, _, chunk_valid in results])
+    return fp_arrays, molecular_props_df, valid
+
+def _featurize_cached(smiles, fps_dict, compute_properties, n_jobs, chunk_size, backend, cache, num_threads=1,
+                      executor=None):
+    """
+    Looks every SMILES up in a FingerprintCache and featurizes only the misses.
+
+    Fingerprints are keyed by canonical SMILES and computed once per missing compound. MW/ALOGP are sums taken in
+    atom order, so they are keyed by the raw SMILES to reproduce the uncached values exactly.
     """
-    fp_data = {}
+    smiles = list(smiles)
+    canonical, parsed_mols = cache.canonicalize(smiles)
+    valid = np.array([key is not None for key in canonical], dtype=bool)
+    valid_rows = np.flatnonzero(valid)
+    valid_keys = [canonical[i] for i in valid_rows]
+    invalid_rows = []
+
+    # Fingerprints
+    fp_settings = {fp_name: cache.fp_settings_key(fp_class) for fp_name, fp_class in fps_dict.items()}
+    fp_missing = np.zeros(len(valid_rows), dtype=bool)
+    fp_arrays = {}
     for fp_name, fp_class in fps_dict.items():
-        try:
-            fp_array = fp_class.generate_fps(smis=[smiles]).flatten()
-            fp_data[fp_name] = ','.join(map(str, fp_array))
-        except Exception:
-            fp_data[fp_name] = ','.join(['nan'] * fp_class._dimension)  # Handle errors gracefully
-    return fp_data
+        values, found = cache.get_many(fp_settings[fp_name], valid_keys, fp_class.fp_dtype(), fp_class._dimension)
+        fp_array = np.zeros((len(smiles), fp_class._dimension), dtype=fp_class.fp_dtype())
+        fp_array[valid_rows[found]] = values[found]
+        fp_arrays[fp_name] = fp_array
+        fp_missing |= ~found
+
+    if fp_missing.any():
+        # compute each missing compound once, reusing the Mols parsed while canonicalizing
+        first_rows = {}
+        for i in valid_rows[fp_missing]:
+            first_rows.setdefault(canonical[i], i)
+        miss_keys = list(first_rows)
+        miss_arrays, _, miss_valid = featurize(
+            [parsed_mols.get(i, smiles[i]) for i in first_rows.values()], fps_dict, compute_properties=False,
+            n_jobs=n_jobs, chunk_size=chunk_size, backend=backend, fail_mode="mask", num_threads=num_threads,
+            executor=executor
+        )
+        key_to_miss = {key: j for j, key in enumerate(miss_keys)}
+        target_rows = valid_rows[fp_missing]
+        source_rows = np.array([key_to_miss[canonical[i]] for i in target_rows], dtype=np.intp)
+        stored_keys = [key for key, key_valid in zip(miss_keys, miss_valid) if key_valid]
+        for fp_name in fps_dict:
+            miss_array = miss_arrays[fp_name]
+            fp_arrays[fp_name][target_rows] = miss_array[source_rows]
+            cache.put_many(fp_settings[fp_name], stored_keys, miss_array[miss_valid])
+        # Mols a fingerprint function failed on are not cached and count as failed
+        invalid_rows = target_rows[~miss_valid[source_rows]]
+
+    # Molecular properties
+    molecular_props_df = pd.DataFrame()
+    if compute_properties:
+        props_settings = cache.fp_settings_key(MOLECULAR_PROPERTIES_SETTINGS)
+        valid_smiles = [smiles[i] for i in valid_rows]
+        props = np.full((len(smiles), 2), np.nan)
+        values, found = cache.get_many(props_settings, valid_smiles, np.float64, 2)
+        props[valid_rows[found]] = values[found]
+        if not found.all():
+            miss_props = {}
+            for i in valid_rows[~found]:
+                if smiles[i] not in miss_props:
+                    miss_props[smiles[i]] = compute_molecular_properties(parsed_mols.get(i, smiles[i]))
+                props[i] = miss_props[smiles[i]]
+            cache.put_many(props_settings, list(miss_props), np.array(list(miss_props.values()), dtype=np.float64))
+        molecular_props_df = pd.DataFrame(props, columns=["MW", "ALOGP"])
+
+    valid[invalid_rows] = False
+    for fp_array in fp_arrays.values():
+        fp_array[invalid_rows] = 0
+    return fp_arrays, molecular_props_df, valid
 
-def extract_fingerprints(df):
+def featurize(smiles, fps_dict, compute_properties=True, n_jobs=1, chunk_size=None, backend="native", cache=None,
+              fail_mode="mask", sparse=False, num_threads=1, executor=None):
     """
-    Extracts molecular fingerprints and molecular properties for a given DataFrame.
+    Parses every SMILES once and reuses the resulting Mol for all fingerprints and for MW/ALOGP.
 
     Args:
-        df (pd.DataFrame): Input DataFrame containing a "SMILES" column.
+        smiles (iterable): The input SMILES (RDKit Mol objects are also accepted).
+        fps_dict (dict): Dictionary of fingerprint classes.
+        compute_properties (bool): Whether to compute MW and ALOGP.
+        n_jobs (int): Number of worker processes. With n_jobs > 1 the SMILES are sharded across a process pool;
+            the output is identical to the serial path.
+        chunk_size (int or None): Number of SMILES per shard when n_jobs > 1. Defaults to about four shards per worker.
+        backend (str): Fingerprint backend passed to BaseFPFunc.generate_fps ("native" or "legacy").
+            Both produce identical values; "native" fills compact NumPy arrays through RDKit's batch generators and
+            computes radius 2/radius 3 Morgan pairs from a single enumeration where that is faster (FCFP4/FCFP6 and
+            the binary ECFP/FCFP pairs, see fingerprints.multi_radius_morgan_pairs).
+        cache (FingerprintCache or None): Persistent fingerprint cache. When given, only the cache misses are computed
+            (each canonical compound once) and written back to the cache.
+        fail_mode (str): How failed molecules are represented in fp_arrays.
+            "mask" keeps each fingerprint in its compact integer dtype (BaseFPFunc.fp_dtype()) with all-zero rows
+            for failed molecules; use the returned validity mask to tell them apart.
+            "nan" returns float arrays where failed molecules are rows of NaN.
+        sparse (bool): Return each fingerprint as a scipy.sparse CSR matrix (compact integer dtype, empty rows for
+            failed molecules) built from the nonzero elements, without materializing dense rows. Requires
+            fail_mode="mask" and cannot be combined with a cache, which stores dense rows.
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use in each process ("native"
+            backend). With n_jobs > 1, every worker process uses this many threads.
+        executor (ProcessPoolExecutor or None): Existing pool to shard the SMILES across instead of starting
+            n_jobs new processes (n_jobs then only sets the default chunk_size).
 
     Returns:
-        pd.DataFrame: Updated DataFrame with fingerprint features and molecular properties.
+        tuple: (fp_arrays, molecular_props_df, valid)
+            fp_arrays (dict): Fingerprint name -> array of shape (N, d).
+            molecular_props_df (pd.DataFrame): MW and ALOGP for each row (empty if compute_properties is False).
+            valid (np.ndarray): Boolean mask, False for SMILES that could not be parsed (or, rarely, that a
+                fingerprint function failed on).
+
+    Notes:
+        Invalid SMILES are filtered out once per batch, before any fingerprint is computed, so the fingerprint
+        functions only ever see valid Mols.
     """
+    if fail_mode not in ("mask", "nan"):
+        raise ValueError(f"fail_mode must be 'mask' or 'nan', got '{fail_mode}'")
+    if sparse and (fail_mode != "mask" or cache is not None):
+        raise ValueError("sparse output requires fail_mode='mask' and no cache")
 
-    # Ensure the 'SMILES' column exists
-    if "SMILES" not in df.columns:
-        raise ValueError("Input DataFrame must contain a 'SMILES' column")
+    if cache is not None:
+        fp_arrays, molecular_props_df, valid = _featurize_cached(
+            smiles, fps_dict, compute_properties, n_jobs, chunk_size, backend, cache, num_threads, executor
+        )
+    elif (n_jobs > 1 or executor is not None) and len(smiles) > 0:
+        fp_arrays, molecular_props_df, valid = _featurize_parallel(
+            list(smiles), fps_dict, compute_properties, n_jobs, chunk_size, backend, sparse, num_threads, executor
+        )
+    else:
+        fp_arrays, molecular_props_df, valid = _featurize_serial(
+            smiles, fps_dict, compute_properties, backend, sparse, num_threads
+        )
 
-    # Define fingerprint classes
-    fingerprint_classes = {
+    if fail_mode == "nan":
+        for fp_name, fp_array in fp_arrays.items():
+            fp_array = fp_array.astype(float)
+            fp_array[~valid] = np.nan
+            fp_arrays[fp_name] = fp_array
+    return fp_arrays, molecular_props_df, valid
+
+def _featurize_serial(smiles, fps_dict, compute_properties, backend, sparse=False, num_threads=1):
+    """
+    Featurizes a batch in the current process, see featurize (fail_mode="mask").
+    """
+    mols = [to_mol(smi) for smi in smiles]
+    valid = np.array([mol is not None for mol in mols], dtype=bool)
+    valid_rows = np.flatnonzero(valid)
+    valid_mols = [mols[i] for i in valid_rows]
+
+    def place_rows(fps, fp_class):
+        if sparse:
+            return _scatter_sparse_rows(fps, valid_rows, len(mols))
+        fp_array = np.zeros((len(mols), fp_class._dimension), dtype=fp_class.fp_dtype())
+        fp_array[valid_rows] = fps
+        return fp_array
+
+    fp_arrays = {}
+    if backend == "native" and valid_mols:
+        for radius2_name, radius3_name, morgan in multi_radius_morgan_pairs(fps_dict):
+            try:
+                radius2_fps, radius3_fps = morgan.generate_fps(valid_mols, sparse=sparse)
+            except Exception:
+                continue  # computed one FP at a time below, so a bad Mol only invalidates its own row
+            fp_arrays[radius2_name] = place_rows(radius2_fps, morgan)
+            fp_arrays[radius3_name] = place_rows(radius3_fps, morgan)
+
+    for fp_name, fp_class in fps_dict.items():
+        if fp_name in fp_arrays:
+            continue
+        if valid_mols:
+            fps, ok = _generate_fps_for_mols(fp_class, valid_mols, backend, sparse=sparse, num_threads=num_threads)
+            valid[valid_rows[~ok]] = False
+        elif sparse:
+            fps = sp.csr_matrix((0, fp_class._dimension), dtype=fp_class.fp_dtype())
+        else:
+            fps = np.zeros((0, fp_class._dimension), dtype=fp_class.fp_dtype())
+        fp_arrays[fp_name] = place_rows(fps, fp_class)
+    fp_arrays = {fp_name: fp_arrays[fp_name] for fp_name in fps_dict}
+
+    # a Mol one fingerprint failed on is invalid for all of them
+    for fp_name, fp_array in fp_arrays.items():
+        if sparse:
+            fp_arrays[fp_name] = _clear_sparse_rows(fp_array, valid)
+        else:
+            fp_array[~valid] = 0
+
+    molecular_props = []
+    if compute_properties:
+        for mol in mols:
+            mw, alogp = compute_molecular_properties(mol)
+            molecular_props.append({"MW": mw, "ALOGP": alogp})
+    molecular_props_df = pd.DataFrame(molecular_props)
+
+    return fp_arrays, molecular_props_df, valid
+
+def default_fingerprint_classes():
+    """
+    Returns the fingerprint classes written by the curation pipeline.
+    """
+    return {
         'ECFP4': HitGenECFP4(),
         'ECFP6': HitGenECFP6(),
         'FCFP4': HitGenFCFP4(),
@@ -72,21 +357,171 @@ def extract_fingerprints(df):
         'ATOMPAIR': HitGenAtomPair()
     }
 
-    # Compute fingerprints and molecular properties
-    fingerprint_data = []
-    molecular_props = []
+def featurize_unique(smiles_columns, fps_dict=None, n_jobs=1, cache=None, num_threads=1, executor=None):
+    """
+    Featurizes the unique SMILES of several DataFrames (e.g. all targets of a raw file) once.
 
-    for smiles in df["SMILES"]:
-        fps = generate_fingerprints(smiles, fingerprint_classes)
-        fingerprint_data.append(fps)
-        mw, alogp = compute_molecular_properties(smiles)
-        molecular_props.append({"MW": mw, "ALOGP": alogp})
+    Args:
+        smiles_columns (list): SMILES columns (pd.Series or lists) of the DataFrames to featurize.
+        fps_dict (dict or None): Dictionary of fingerprint classes. Defaults to default_fingerprint_classes().
+        n_jobs (int): Number of worker processes used for fingerprinting.
+        cache (FingerprintCache or None): Persistent fingerprint cache.
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use per process.
+        executor (ProcessPoolExecutor or None): Existing pool to featurize in (see featurize).
 
-    # Convert lists to DataFrames
-    fingerprint_df = pd.DataFrame(fingerprint_data)
-    molecular_props_df = pd.DataFrame(molecular_props)
+    Returns:
+        dict: Precomputed features to pass to extract_fingerprints(df, precomputed=...), holding the unique
+            SMILES ("index"), their fingerprint arrays ("fp_arrays"), MW/ALOGP ("molecular_props") and the
+            validity mask ("valid").
+    """
+    if fps_dict is None:
+        fps_dict = default_fingerprint_classes()
+
+    all_smiles = pd.unique(np.concatenate(
+        [np.empty(0, dtype=object)] + [np.asarray(col, dtype=object) for col in smiles_columns]
+    ))
+    unique_smiles = pd.Index([smi for smi in all_smiles if isinstance(smi, str)], dtype=object)
+    print(f"Featurizing {len(unique_smiles)} unique SMILES for {len(smiles_columns)} files")
+
+    if len(unique_smiles) == 0:
+        # nothing to featurize (e.g. empty targets, or only missing SMILES)
+        return {
+            "index": unique_smiles,
+            "fp_arrays": {
+                fp_name: np.zeros((0, fp_class._dimension), dtype=fp_class.fp_dtype())
+                for fp_name, fp_class in fps_dict.items()
+            },
+            "molecular_props": np.zeros((0, 2), dtype=float),
+            "valid": np.zeros(0, dtype=bool),
+        }
+
+    fp_arrays, molecular_props_df, valid = featurize(
+        unique_smiles, fps_dict, n_jobs=n_jobs, cache=cache, num_threads=num_threads, executor=executor
+    )
+    return {
+        "index": unique_smiles,
+        "fp_arrays": fp_arrays,
+        "molecular_props": molecular_props_df[["MW", "ALOGP"]].to_numpy(dtype=float),
+        "valid": valid,
+    }
+
+def subset_precomputed(precomputed, smiles):
+    """
+    Restricts featurize_unique output to the given SMILES (e.g. those of one target), so that only the features
+    a worker process needs are sent to it. Joining from the subset gives the same result as from the full output.
+    """
+    codes = precomputed["index"].get_indexer(pd.Index(pd.unique(np.asarray(smiles, dtype=object)), dtype=object))
+    codes = codes[codes >= 0]
+    return {
+        "index": precomputed["index"][codes],
+        "fp_arrays": {fp_name: fp_array[codes] for fp_name, fp_array in precomputed["fp_arrays"].items()},
+        "molecular_props": precomputed["molecular_props"][codes],
+        "valid": precomputed["valid"][codes],
+    }
+
+def _take_precomputed(precomputed, smiles):
+    """
+    Gathers the precomputed features of each SMILES, in row order.
+    SMILES missing from the precomputed index (e.g. NaN) are marked invalid, as featurize would mark them.
+    """
+    # -1 (not found) picks the invalid row appended at the end
+    codes = precomputed["index"].get_indexer(pd.Index(smiles, dtype=object))
+    fp_arrays = {
+        fp_name: np.vstack([fp_array, np.zeros((1, fp_array.shape[1]), dtype=fp_array.dtype)])[codes]
+        for fp_name, fp_array in precomputed["fp_arrays"].items()
+    }
+    props = np.vstack([precomputed["molecular_props"], np.full((1, 2), np.nan)])[codes]
+    molecular_props_df = pd.DataFrame(props, columns=["MW", "ALOGP"])
+    valid = np.append(precomputed["valid"], False)[codes]
+    return fp_arrays, molecular_props_df, valid
+
+def extract_fingerprints(df, n_jobs=1, fp_format="string", cache=None, precomputed=None, num_threads=1):
+    """
+    Extracts molecular fingerprints and molecular properties for a given DataFrame.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing a "SMILES" column.
+        n_jobs (int): Number of worker processes used for fingerprinting (1 runs serially).
+        fp_format (str): "string" stores each fingerprint as a comma-joined string (CSV friendly).
+            "array" stores one uint8 (binary) or uint16 (count) NumPy array per row, None for failed molecules;
+            write these with fingerprint_storage.write_parquet to get typed fixed-size list columns.
+        cache (FingerprintCache or None): Persistent fingerprint cache; only compounds missing from it are computed.
+        precomputed (dict or None): Output of featurize_unique covering the SMILES of df. When given, the features
+            are joined from it instead of being computed again.
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use per process.
+
+    Returns:
+        pd.DataFrame: Updated DataFrame with fingerprint features and molecular properties.
+    """
+
+    # Ensure the 'SMILES' column exists
+    if "SMILES" not in df.columns:
+        raise ValueError("Input DataFrame must contain a 'SMILES' column")
+
+    if fp_format not in ("string", "array"):
+        raise ValueError(f"fp_format must be 'string' or 'array', got '{fp_format}'")
+
+    # Define fingerprint classes
+    fingerprint_classes = default_fingerprint_classes()
+
+    # Compute fingerprints and molecular properties (each SMILES is parsed only once)
+    if precomputed is None:
+        fp_arrays, molecular_props_df, valid = featurize(
+            df["SMILES"], fingerprint_classes, n_jobs=n_jobs, cache=cache, num_threads=num_threads
+        )
+    else:
+        fp_arrays, molecular_props_df, valid = _take_precomputed(precomputed, df["SMILES"])
+
+    failed_rows = np.flatnonzero(~valid).tolist()
+    if failed_rows:
+        print(f"Warning: {len(failed_rows)} SMILES could not be parsed (rows {failed_rows}). Their fingerprints are set to NaN.")
+
+    # Convert fingerprint arrays to DataFrames
+    if fp_format == "string":
+        fingerprint_df = pd.DataFrame(
+            {
+                fp_name: [fingerprint_to_string(row, row_valid) for row, row_valid in zip(fp_array, valid)]
+                for fp_name, fp_array in fp_arrays.items()
+            }
+        )
+    else:
+        fingerprint_df = pd.DataFrame(
+            {fp_name: fingerprint_to_arrays(fp_array, valid) for fp_name, fp_array in fp_arrays.items()}
+        )
  
     # Concatenate the original DataFrame with fingerprints and molecular properties
     df = pd.concat([df, molecular_props_df, fingerprint_df], axis=1)
 
     return df
+
+def extract_sparse_fingerprints(df, n_jobs=1, num_threads=1):
+    """
+    Extracts molecular properties and sparse molecular fingerprints for a given DataFrame.
+
+    The fingerprints are kept as scipy.sparse CSR matrices (never densified) instead of DataFrame columns; write
+    them with fingerprint_storage.write_parquet(df, path, sparse_fps=..., valid=...).
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing a "SMILES" column.
+        n_jobs (int): Number of worker processes used for fingerprinting (1 runs serially).
+        num_threads (int): Number of threads RDKit's batch fingerprint generators use per process.
+
+    Returns:
+        tuple: (df, sparse_fps, valid)
+            df (pd.DataFrame): Input DataFrame with the MW and ALOGP columns added.
+            sparse_fps (dict): Fingerprint name -> CSR matrix of shape (N, d), rows aligned with df.
+            valid (np.ndarray): Boolean mask, False for SMILES that could not be parsed.
+    """
+    if "SMILES" not in df.columns:
+        raise ValueError("Input DataFrame must contain a 'SMILES' column")
+
+    sparse_fps, molecular_props_df, valid = featurize(
+        df["SMILES"], default_fingerprint_classes(), n_jobs=n_jobs, sparse=True, num_threads=num_threads
+    )
+
+    failed_rows = np.flatnonzero(~valid).tolist()
+    if failed_rows:
+        print(f"Warning: {len(failed_rows)} SMILES could not be parsed (rows {failed_rows}). Their fingerprints are left empty.")
+
+    df = pd.concat([df, molecular_props_df], axis=1)
+    return df, sparse_fps, valid
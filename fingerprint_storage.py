@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and writing fingerprint columns as typed fixed-size list columns in Parquet.
+
+Fingerprint columns produced by extract_fingerprints(df, fp_format="array") hold one NumPy array per row
+(uint8 for binary FPs, uint16 for count FPs) and None for molecules that failed.
+Sparse fingerprints (scipy.sparse CSR matrices from extract_sparse_fingerprints) are stored as map columns
+(bit index -> count) holding only the nonzero elements.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import sparse as sp
+
+from fingerprint_extraction import default_fingerprint_classes
+
+
+@lru_cache(maxsize=1)
+def default_fingerprint_types():
+    """
+    Returns the dimension and dtype of the fingerprints written by the curation pipeline.
+
+    Returns:
+        dict: Fingerprint name -> (dimension, np.dtype), from default_fingerprint_classes().
+    """
+    return {
+        fp_name: (fp_class._dimension, fp_class.fp_dtype())
+        for fp_name, fp_class in default_fingerprint_classes().items()
+    }
+
+
+def is_fingerprint_column(series):
+    """
+    Returns True if the column holds per-row fingerprint arrays (fp_format="array").
+    """
+    if series.dtype != object:
+        return False
+    non_null = series.dropna()
+    return not non_null.empty and isinstance(non_null.iloc[0], np.ndarray)
+
+
+def fingerprint_column_to_arrow(series, dimension=None, dtype=None):
+    """
+    Converts a column of per-row fingerprint arrays into an Arrow fixed-size list array.
+
+    Args:
+        series (pd.Series): Column holding one 1-d NumPy array per row, or None for failed molecules.
+        dimension (int or None): Fingerprint dimension d (e.g. fp_class._dimension). Defaults to the length of the
+            first fingerprint of the column.
+        dtype (np.dtype or None): Fingerprint dtype (e.g. fp_class.fp_dtype()). Defaults to the dtype of the first
+            fingerprint of the column.
+
+    Returns:
+        pa.FixedSizeListArray: One fixed-size list per row, null for failed molecules. A column without any
+            fingerprint is all null, which requires dimension and dtype.
+    """
+    non_null = series.dropna()
+    if non_null.empty and (dimension is None or dtype is None):
+        raise ValueError(f"Column {series.name} does not contain any fingerprint")
+    if dimension is None:
+        dimension = len(non_null.iloc[0])
+    if dtype is None:
+        dtype = non_null.iloc[0].dtype
+
+    valid = series.notna().to_numpy()
+    matrix = np.zeros((len(series), dimension), dtype=dtype)
+    if valid.any():
+        matrix[valid] = np.stack(series[valid].to_numpy())
+
+    values = pa.array(matrix.reshape(-1))
+    return pa.FixedSizeListArray.from_arrays(values, dimension, mask=pa.array(~valid))
+
+
+def sparse_fingerprint_to_arrow(fps, valid=None):
+    """
+    Converts a CSR fingerprint matrix into an Arrow map array (bit index -> count), without densifying it.
+
+    Args:
+        fps (sp.csr_matrix): Fingerprint matrix of shape (N, d) in a compact integer dtype.
+        valid (np.ndarray or None): Boolean mask of the rows holding a fingerprint; the others are written as null.
+
+    Returns:
+        pa.MapArray: One map per row with the nonzero elements of the fingerprint.
+    """
+    fps = sp.csr_matrix(fps)
+    index_type = pa.uint16() if fps.shape[1] <= np.iinfo(np.uint16).max + 1 else pa.uint32()
+    mask = None if valid is None else pa.array(~np.asarray(valid, dtype=bool))
+    return pa.MapArray.from_arrays(
+        pa.array(fps.indptr.astype(np.int32)),
+        pa.array(fps.indices, type=index_type),
+        pa.array(fps.data),
+        mask=mask,
+    )
+
+def dataframe_to_arrow(df, sparse_fps=None, valid=None, fingerprint_types=None):
+    """
+    Converts a DataFrame to an Arrow table, with fingerprint array columns as typed fixed-size list columns.
+
+    Args:
+        df (pd.DataFrame): DataFrame to convert. Other columns are converted as in DataFrame.to_parquet.
+        sparse_fps (dict or None): Fingerprint name -> CSR matrix with rows aligned with df, appended as map columns.
+        valid (np.ndarray or None): Boolean mask of the rows of sparse_fps holding a fingerprint.
+        fingerprint_types (dict or None): Fingerprint name -> (dimension, dtype) of the known fingerprint columns.
+            Defaults to default_fingerprint_types(). A known fingerprint column without any fingerprint (every
+            molecule failed, or no rows) is written as an all-null column of its fixed-size list type, so its
+            schema matches the files where some molecules succeeded.
+
+    Returns:
+        pa.Table: The converted table.
+    """
+    if fingerprint_types is None:
+        fingerprint_types = default_fingerprint_types()
+    fp_columns = [
+        col for col in df.columns
+        if is_fingerprint_column(df[col])
+        or (col in fingerprint_types and df[col].dtype == object and df[col].isna().all())
+    ]
+    table = pa.Table.from_pandas(df.drop(columns=fp_columns), preserve_index=False)
+
+    for col in fp_columns:
+        dimension, dtype = fingerprint_types.get(col, (None, None))
+        table = table.add_column(df.columns.get_loc(col), col, fingerprint_column_to_arrow(df[col], dimension, dtype))
+    for fp_name, fps in (sparse_fps or {}).items():
+        if fps.shape[0] != len(df):
+            raise ValueError(f"Sparse fingerprint {fp_name} has {fps.shape[0]} rows, expected {len(df)}")
+        table = table.append_column(fp_name, sparse_fingerprint_to_arrow(fps, valid))
+    return table
+
+def write_parquet(df, path, sparse_fps=None, valid=None, fingerprint_types=None):
+    """
+    Writes a DataFrame to Parquet, storing fingerprint array columns as typed fixed-size list columns.
+
+    Args:
+        df (pd.DataFrame): DataFrame to write. Other columns are converted as in DataFrame.to_parquet.
+        path (str): Output Parquet file.
+        sparse_fps (dict or None): Fingerprint name -> CSR matrix with rows aligned with df, appended as map columns.
+        valid (np.ndarray or None): Boolean mask of the rows of sparse_fps holding a fingerprint.
+        fingerprint_types (dict or None): Dimension and dtype of the known fingerprint columns, see
+            dataframe_to_arrow.
+    """
+    pq.write_table(dataframe_to_arrow(df, sparse_fps, valid, fingerprint_types), path)
+
+
+def _fixed_size_list_matrix(arrow_column):
+    """
+    Returns the (N, d) matrix (in the stored value type) and the validity mask of a fixed-size list column.
+    """
+    if isinstance(arrow_column, pa.ChunkedArray):
+        arrow_column = arrow_column.combine_chunks()
+    dimension = arrow_column.type.list_size
+    valid = arrow_column.is_valid().to_numpy(zero_copy_only=False)
+    values = arrow_column.values.slice(arrow_column.offset * dimension, len(arrow_column) * dimension)
+    if values.null_count:
+        # the slots of failed molecules come back as nulls after a Parquet round-trip
+        values = values.fill_null(0)
+    matrix = values.to_numpy(zero_copy_only=False).reshape(len(arrow_column), dimension)
+    if not valid.all():
+        matrix = matrix.copy()
+        matrix[~valid] = 0
+    return matrix, valid
+
+
+def arrow_to_dataframe(table, types_mapper=None):
+    """
+    Converts an Arrow table to a DataFrame, with fixed-size list columns as per-row fingerprint arrays.
+
+    This is the inverse of dataframe_to_arrow: fingerprint columns hold one array per row in the stored dtype
+    (uint8/uint16, as with fp_format="array") and None for failed molecules. Table.to_pandas would return float
+    arrays for a column with failed molecules, as their slots are read back as nulls.
+
+    Args:
+        table (pa.Table): The table to convert.
+        types_mapper (callable or None): Passed to Table.to_pandas for the other columns.
+
+    Returns:
+        pd.DataFrame: The converted DataFrame, with the columns in table order.
+    """
+    fp_columns = [field.name for field in table.schema if pa.types.is_fixed_size_list(field.type)]
+    df = table.drop_columns(fp_columns).to_pandas(types_mapper=types_mapper)
+    for col in fp_columns:
+        matrix, valid = _fixed_size_list_matrix(table.column(col))
+        rows = [row if row_valid else None for row, row_valid in zip(matrix, valid)]
+        df[col] = pd.Series(rows, index=df.index, dtype=object)
+    return df[table.column_names]
+
+
+def load_fingerprint_matrix(path, column, return_valid=False, sparse=False, dimension=None):
+    """
+    Loads one fingerprint column of a Parquet file as an (N, d) NumPy matrix.
+
+    Args:
+        path (str): Parquet file written by write_parquet.
+        column (str): Name of the fingerprint column (e.g. "ECFP4").
+        return_valid (bool): Also return a boolean mask of the rows that hold a fingerprint.
+        sparse (bool): Return a scipy.sparse CSR matrix. Sparse (map) columns are then loaded without densifying.
+        dimension (int or None): Fingerprint dimension d of a sparse (map) column. Defaults to the highest stored
+            bit index + 1, so pass it (e.g. fp_class._dimension) to get the full width.
+
+    Returns:
+        np.ndarray, sp.csr_matrix or tuple: The (N, d) matrix in its stored dtype; rows of failed molecules are all
+            zeros. With return_valid=True, a tuple (matrix, valid).
+
+    Notes:
+        Typed fixed-size list columns are read without any parsing. Files written before the typed format
+        (comma-joined strings) are still accepted and parsed, with failed ('nan') rows marked invalid.
+    """
+    arrow_column = pq.read_table(path, columns=[column]).column(column).combine_chunks()
+
+    if pa.types.is_map(arrow_column.type):
+        valid = arrow_column.is_valid().to_numpy(zero_copy_only=False)
+        offsets = arrow_column.offsets.to_numpy(zero_copy_only=False)
+        indptr = offsets - offsets[0]
+        indices = arrow_column.keys.slice(offsets[0], indptr[-1]).to_numpy(zero_copy_only=False)
+        counts = arrow_column.items.slice(offsets[0], indptr[-1]).to_numpy(zero_copy_only=False)
+        if dimension is None:
+            dimension = int(indices.max()) + 1 if indices.size else 0
+        matrix = sp.csr_matrix((counts, indices.astype(np.int32), indptr), shape=(len(arrow_column), dimension))
+        if not sparse:
+            matrix = matrix.toarray()
+        if return_valid:
+            return matrix, valid
+        return matrix
+
+    if pa.types.is_fixed_size_list(arrow_column.type):
+        matrix, valid = _fixed_size_list_matrix(arrow_column)
+    else:
+        # comma-joined string column from the CSV-style format
+        rows = [np.array(fp.split(","), dtype=float) if isinstance(fp, str) else None for fp in arrow_column.to_pylist()]
+        valid = np.array([row is not None and not np.isnan(row).any() for row in rows], dtype=bool)
+        dimension = next(len(row) for row in rows if row is not None)
+        matrix = np.zeros((len(rows), dimension), dtype=np.uint16)
+        if valid.any():
+            matrix[valid] = np.stack([row for row, ok in zip(rows, valid) if ok])
+
+    if sparse:
+        matrix = sp.csr_matrix(matrix)
+    if return_valid:
+        return matrix, valid
+    return matrix
+
+
+def fingerprints_to_strings(df):
+    """
+    Converts fingerprint array columns into the comma-joined string format, e.g. before writing a CSV.
+
+    Args:
+        df (pd.DataFrame): DataFrame with fingerprint array columns.
+
+    Returns:
+        pd.DataFrame: Copy of the DataFrame where every fingerprint column holds comma-joined strings
+            (a run of 'nan' values for failed molecules).
+    """
+    df = df.copy()
+    for col in df.columns:
+        if is_fingerprint_column(df[col]):
+            dimension = len(df[col].dropna().iloc[0])
+            failed = ','.join(['nan'] * dimension)
+            df[col] = [','.join(map(str, fp.tolist())) if isinstance(fp, np.ndarray) else failed for fp in df[col]]
+    return df
@@ -1,18 +1,23 @@
-from typing import Union, List, Callable, Optional
+from typing import Union, List, Callable, Optional, Tuple, Dict
 from functools import partial
 import inspect
 import abc
+import hashlib
+import json
+import sqlite3
 
 import numpy as np
 import numpy.typing as npt
+from scipy import sparse as sp
 from tqdm import tqdm
 
 from rdkit.Avalon import pyAvalonTools
-from rdkit.Chem import AllChem, rdMolDescriptors, RDKFingerprint
+from rdkit.Chem import AllChem, rdMolDescriptors, RDKFingerprint, rdFingerprintGenerator
 from rdkit.Chem.AtomPairs import Pairs
-from rdkit import Chem
+from rdkit import Chem, rdBase
 
 from utils import to_mol, catch_boost_argument_error
+from canonicalization import CANONICALIZER
 
 
 def _wrap_handle_none(fp_func: Callable, *args, fail_size: Optional[int] = None, **kwargs) -> List:
@@ -72,6 +77,34 @@ def _wrap_handle_none(fp_func: Callable, *args, fail_size: Optional[int] = None,
             raise
 
 
+def _dense_from_nonzero(nonzero_rows, n_rows: int, dimension: int, dtype: np.dtype) -> np.ndarray:
+    """
+    Writes `(row, indices, values)` tuples into a zero initialized (n_rows, dimension) array of `dtype`
+    """
+    fps = np.zeros((n_rows, dimension), dtype=dtype)
+    for i, indices, values in nonzero_rows:
+        fps[i, indices] = values
+    return fps
+
+
+def _csr_from_nonzero(nonzero_rows, n_rows: int, dimension: int, dtype: np.dtype) -> sp.csr_matrix:
+    """
+    Builds a (n_rows, dimension) CSR matrix of `dtype` with sorted column indices from `(row, indices, values)` tuples
+    """
+    row_nnz = np.zeros(n_rows, dtype=np.int64)
+    all_indices, all_values = [], []
+    for i, indices, values in nonzero_rows:
+        order = np.argsort(indices)
+        all_indices.append(indices[order])
+        all_values.append(values[order])
+        row_nnz[i] = len(indices)
+
+    indptr = np.concatenate([[0], np.cumsum(row_nnz)]).astype(np.int32)
+    indices = np.concatenate(all_indices).astype(np.int32) if all_indices else np.zeros(0, dtype=np.int32)
+    values = np.concatenate(all_values).astype(dtype) if all_values else np.zeros(0, dtype=dtype)
+    return sp.csr_matrix((values, indices, indptr), shape=(n_rows, dimension))
+
+
 class BaseFPFunc(abc.ABC):
     """
     Base class for all FP functions used in any AIRCHECK pipeline
@@ -89,11 +122,14 @@ class BaseFPFunc(abc.ABC):
         Whether the FP function returns binary fingerprints
     _dimension : int
         the dimensionality of the fingerprints that will be generated
+    _generator : rdkit FingerprintGenerator or None
+        an RDKit fingerprint generator producing the exact same FP as `_func`, used by the "native" backend.
+        None if no matching generator exists, in which case the "native" backend falls back to `_func`
 
     Notes
     -----
     When declaring a child of the `BaseFPFunc` class, the `_func`, `_dimension` and `_binary` attributes must be set
-    during instantiation of the child.
+    during instantiation of the child. `_generator` is optional, but must only be set if it is bit-identical to `_func`
     FP Funcs operate on rdkit.ROMol objects, not smiles and will fail if SMILES are passed
     """
     def __init__(self, **kwargs):
@@ -101,6 +137,7 @@ class BaseFPFunc(abc.ABC):
         self._func: Callable = lambda: None
         self._binary: bool = False
         self._dimension: int = -1
+        self._generator = None
 
     def __call__(self, smis, *args, use_tqdm: bool = False, **kwargs) -> npt.NDArray[np.int32]:
         return np.array(
@@ -123,7 +160,11 @@ class BaseFPFunc(abc.ABC):
         self,
         smis: Union[str, Chem.rdchem.Mol, List[Union[str, Chem.rdchem.Mol]]],
         use_tqdm: bool = False,
-    ) -> np.ndarray:
+        backend: str = "legacy",
+        num_threads: int = 1,
+        return_valid: bool = False,
+        sparse: bool = False,
+    ) -> Union[np.ndarray, sp.csr_matrix, Tuple[Union[np.ndarray, sp.csr_matrix], np.ndarray]]:
         """
         Generate Fingerprints for a set of smiles
         Parameters
@@ -132,21 +173,162 @@ class BaseFPFunc(abc.ABC):
             the SMILES or Mol objects (or multiple SMILES/Mol objects) you want to generate a fingerprint(s) for
         use_tqdm : bool, default: False
             have a tqdm task to track progress
+        backend : {"legacy", "native"}, default: "legacy"
+            "legacy" calls the RDKit FP function one Mol at a time and builds the array from python lists.
+            "native" writes the FPs straight into a preallocated array of dtype `fp_dtype()`, using the batched
+            (multithreaded) RDKit fingerprint generator API where available
+        num_threads : int, default: 1
+            number of threads RDKit uses for the "native" backend
+        return_valid : bool, default: False
+            parse all molecules once up front and return a boolean validity mask next to an integer array of dtype
+            `fp_dtype()` (rows of invalid molecules are all zeros) instead of marking them with `np.nan`
+        sparse : bool, default: False
+            return a `scipy.sparse.csr_matrix` of dtype `fp_dtype()` built directly from the nonzero elements of the
+            FPs, without ever materializing dense rows. Rows of invalid molecules are empty
 
         Returns
         -------
-        ndarray
-            an array of size (M, d), where M is number of Mols passes and d is the dimension of fingerprint
+        ndarray, csr_matrix or tuple
+            an array of size (M, d), where M is number of Mols passes and d is the dimension of fingerprint.
+            With `return_valid=True`, a tuple of that array and a boolean array of size M
 
         Notes
         -----
         The passed list can be a mix of SMILES and Mol objects.
         If the SMILES are invalid or the Mol object(s) are None, then that molecules row of the output fingerprint
          array will be `np.nan` (e.i., the fingerprint for that molecule will be 1-d array of `np.nan` of dimension d)
-        This function just wraps the __call__ method of the class
+        for the "legacy" backend. The "native" backend keeps an integer dtype, so those rows are left as all zeros.
+        For the "legacy" backend this function just wraps the __call__ method of the class, unless `return_valid` or
+        `sparse` is set, in which case the FP function is called directly on the valid molecules only
 
         """
-        return self.__call__(smis, use_tqdm)
+        if backend not in ("legacy", "native"):
+            raise ValueError(f"unknown backend '{backend}', must be 'legacy' or 'native'")
+        if return_valid or sparse:
+            mols = [to_mol(c) for c in np.atleast_1d(smis)]
+            generate = self._generate_sparse if sparse else self._generate_native
+            fps = generate(mols, num_threads=num_threads, use_generator=(backend == "native"))
+            if return_valid:
+                return fps, np.array([mol is not None for mol in mols], dtype=bool)
+            return fps
+        if backend == "legacy":
+            return self.__call__(smis, use_tqdm)
+        elif backend == "native":
+            return self._generate_native([to_mol(c) for c in np.atleast_1d(smis)], num_threads=num_threads)
+
+    def _generate_native(
+        self, mols: List[Optional[Chem.rdchem.Mol]], num_threads: int = 1, use_generator: bool = True
+    ) -> np.ndarray:
+        """
+        Writes the FPs of `mols` into a preallocated array of dtype `fp_dtype()`
+
+        Parameters
+        ----------
+        mols : list of rdkit Mol or None
+            the molecules to fingerprint, None entries are left as rows of zeros
+        num_threads : int, default: 1
+            number of threads passed to the batched RDKit generator API
+        use_generator : bool, default: True
+            use the RDKit fingerprint generator when the class has one, otherwise always call the FP function
+
+        Returns
+        -------
+        ndarray
+            an array of size (M, d) and dtype `fp_dtype()`
+
+        Raises
+        ------
+        OverflowError
+            if a count does not fit in `fp_dtype()`
+        """
+        return _dense_from_nonzero(
+            self._iter_nonzero(mols, num_threads, use_generator), len(mols), self._dimension, self.fp_dtype()
+        )
+
+    def _generate_sparse(
+        self, mols: List[Optional[Chem.rdchem.Mol]], num_threads: int = 1, use_generator: bool = True
+    ) -> sp.csr_matrix:
+        """
+        Builds a CSR matrix of dtype `fp_dtype()` straight from the nonzero elements of the FPs of `mols`
+
+        Parameters
+        ----------
+        mols : list of rdkit Mol or None
+            the molecules to fingerprint, None entries are left as empty rows
+        num_threads : int, default: 1
+            number of threads passed to the batched RDKit generator API
+        use_generator : bool, default: True
+            use the RDKit fingerprint generator when the class has one, otherwise always call the FP function
+
+        Returns
+        -------
+        csr_matrix
+            a sparse matrix of size (M, d) and dtype `fp_dtype()`, with sorted column indices
+
+        Raises
+        ------
+        OverflowError
+            if a count does not fit in `fp_dtype()`
+        """
+        return _csr_from_nonzero(
+            self._iter_nonzero(mols, num_threads, use_generator), len(mols), self._dimension, self.fp_dtype()
+        )
+
+    def _iter_nonzero(
+        self, mols: List[Optional[Chem.rdchem.Mol]], num_threads: int = 1, use_generator: bool = True
+    ):
+        """
+        Yields `(row, indices, values)` with the nonzero bits/counts of the FP of every Mol in `mols` that is not None
+
+        Raises
+        ------
+        OverflowError
+            if a count does not fit in `fp_dtype()`
+        """
+        rows = [i for i, mol in enumerate(mols) if mol is not None]
+        valid_mols = [mols[i] for i in rows]
+        dtype = self.fp_dtype()
+        max_value = np.iinfo(dtype).max
+
+        if self._generator is None or not use_generator:
+            for i, mol in zip(rows, valid_mols):
+                fp = np.asarray(list(self._func(mol)))
+                indices = np.flatnonzero(fp)
+                values = fp[indices].astype(np.int64)
+                if values.size and values.max() > max_value:
+                    raise OverflowError(f"{self.func_name()} count {values.max()} does not fit in {dtype}")
+                yield i, indices, values
+        elif self._binary:
+            if hasattr(self._generator, "GetFingerprints"):
+                fp_vects = self._generator.GetFingerprints(valid_mols, numThreads=num_threads)
+            else:  # older RDKit without the batch API
+                fp_vects = [self._generator.GetFingerprint(mol) for mol in valid_mols]
+            for i, fp in zip(rows, fp_vects):
+                indices = np.array(fp.GetOnBits(), dtype=np.int64)
+                yield i, indices, np.ones(len(indices), dtype=np.int64)
+        else:
+            if hasattr(self._generator, "GetCountFingerprints"):
+                fp_vects = self._generator.GetCountFingerprints(valid_mols, numThreads=num_threads)
+            else:  # older RDKit without the batch API
+                fp_vects = [self._generator.GetCountFingerprint(mol) for mol in valid_mols]
+            for i, fp in zip(rows, fp_vects):
+                elements = fp.GetNonzeroElements()
+                indices = np.fromiter(elements.keys(), dtype=np.int64, count=len(elements))
+                values = np.fromiter(elements.values(), dtype=np.int64, count=len(elements))
+                if values.size and values.max() > max_value:
+                    raise OverflowError(f"{self.func_name()} count {values.max()} does not fit in {dtype}")
+                yield i, indices, values
+
+    def fp_dtype(self) -> np.dtype:
+        """
+        Returns the compact dtype used by the "native" backend
+
+        Returns
+        -------
+        np.dtype
+            uint8 for binary FPs, uint16 for count FPs
+        """
+        return np.dtype(np.uint8) if self._binary else np.dtype(np.uint16)
 
     def to_dict(self) -> dict:
         """
@@ -158,12 +340,17 @@ class BaseFPFunc(abc.ABC):
             name and settings of FP function
 
         """
-        _signature = inspect.signature(self._func)
-        args = {
-            k: v.default
-            for k, v in _signature.parameters.items()
-            if v.default is not inspect.Parameter.empty
-        }
+        try:
+            _signature = inspect.signature(self._func)
+        except ValueError:
+            # Boost.Python functions from RDKit expose no signature, so fall back to the preset settings
+            args = dict(self._kwargs)
+        else:
+            args = {
+                k: v.default
+                for k, v in _signature.parameters.items()
+                if v.default is not inspect.Parameter.empty
+            }
         args['name'] = self.func_name()
         return args
 
@@ -214,6 +401,7 @@ class HitGenECFP4(BaseFPFunc):
         super().__init__(**{"radius": 2, "nBits": 2048, "useFeatures": False})
         self._func = partial(AllChem.GetHashedMorganFingerprint, **self._kwargs)
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(radius=2, fpSize=2048)
 
 
 class HitGenECFP6(BaseFPFunc):
@@ -229,6 +417,7 @@ class HitGenECFP6(BaseFPFunc):
         super().__init__(**{"radius": 3, "nBits": 2048, "useFeatures": False})
         self._func = partial(AllChem.GetHashedMorganFingerprint, **self._kwargs)
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(radius=3, fpSize=2048)
 
 
 class HitGenFCFP4(BaseFPFunc):
@@ -244,6 +433,9 @@ class HitGenFCFP4(BaseFPFunc):
         super().__init__(**{"radius": 2, "nBits": 2048, "useFeatures": True})
         self._func = partial(AllChem.GetHashedMorganFingerprint, **self._kwargs)
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(
+            radius=2, fpSize=2048, atomInvariantsGenerator=rdFingerprintGenerator.GetMorganFeatureAtomInvGen()
+        )
 
 
 class HitGenFCFP6(BaseFPFunc):
@@ -259,6 +451,9 @@ class HitGenFCFP6(BaseFPFunc):
         super().__init__(**{"radius": 3, "nBits": 2048, "useFeatures": True})
         self._func = partial(AllChem.GetHashedMorganFingerprint, **self._kwargs)
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(
+            radius=3, fpSize=2048, atomInvariantsGenerator=rdFingerprintGenerator.GetMorganFeatureAtomInvGen()
+        )
 
 
 class HitGenBinaryECFP4(BaseFPFunc):
@@ -276,6 +471,7 @@ class HitGenBinaryECFP4(BaseFPFunc):
         self._func = partial(AllChem.GetMorganFingerprintAsBitVect, **self._kwargs)
         self._binary = True
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(radius=2, fpSize=2048)
 
 
 class HitGenBinaryECFP6(BaseFPFunc):
@@ -293,6 +489,7 @@ class HitGenBinaryECFP6(BaseFPFunc):
         self._func = partial(AllChem.GetMorganFingerprintAsBitVect, **self._kwargs)
         self._binary = True
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(radius=3, fpSize=2048)
 
 
 class HitGenBinaryFCFP4(BaseFPFunc):
@@ -310,6 +507,9 @@ class HitGenBinaryFCFP4(BaseFPFunc):
         self._func = partial(AllChem.GetMorganFingerprintAsBitVect, **self._kwargs)
         self._binary = True
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(
+            radius=2, fpSize=2048, atomInvariantsGenerator=rdFingerprintGenerator.GetMorganFeatureAtomInvGen()
+        )
 
 
 class HitGenBinaryFCFP6(BaseFPFunc):
@@ -327,6 +527,164 @@ class HitGenBinaryFCFP6(BaseFPFunc):
         self._func = partial(AllChem.GetMorganFingerprintAsBitVect, **self._kwargs)
         self._binary = True
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetMorganGenerator(
+            radius=3, fpSize=2048, atomInvariantsGenerator=rdFingerprintGenerator.GetMorganFeatureAtomInvGen()
+        )
+
+
+class HitGenMultiRadiusMorgan:
+    """
+    Computes the radius 2 and radius 3 Morgan FPs (ECFP4 and ECFP6, or FCFP4 and FCFP6) from one environment
+    enumeration
+
+    Only the radius 3 environments are enumerated. Every environment of radius 2 or less is also part of that
+    enumeration, so the radius 2 FP is recovered by dropping the radius 3 environments (read from the bit info of
+    the enumeration) from the radius 3 counts. Outputs are bit-identical to the HitGen(Binary)ECFP/FCFP classes.
+
+    Parameters
+    ----------
+    use_features : bool, default: False
+        use feature atom invariants (FCFP) instead of connectivity atom invariants (ECFP)
+    binary : bool, default: False
+        return binary FPs (as the HitGenBinary classes) instead of counts
+
+    Notes
+    -----
+    `MULTI_RADIUS_MORGAN_PAIRS` lists the pairs of HitGen classes this can replace, see `multi_radius_morgan_pairs`
+    """
+    def __init__(self, use_features: bool = False, binary: bool = False):
+        self._use_features = use_features
+        self._binary = binary
+        self._dimension = 2048
+        if use_features:
+            self._generator = rdFingerprintGenerator.GetMorganGenerator(
+                radius=3, fpSize=2048, atomInvariantsGenerator=rdFingerprintGenerator.GetMorganFeatureAtomInvGen()
+            )
+        else:
+            self._generator = rdFingerprintGenerator.GetMorganGenerator(radius=3, fpSize=2048)
+
+    def fp_dtype(self) -> np.dtype:
+        """
+        Returns the compact dtype of the generated FPs, uint8 if binary else uint16
+        """
+        return np.dtype(np.uint8) if self._binary else np.dtype(np.uint16)
+
+    def generate_fps(
+        self,
+        smis: Union[str, Chem.rdchem.Mol, List[Union[str, Chem.rdchem.Mol]]],
+        return_valid: bool = False,
+        sparse: bool = False,
+    ) -> Tuple:
+        """
+        Generate the radius 2 and radius 3 fingerprints for a set of smiles
+
+        Parameters
+        ----------
+        smis : str, rdkit Mol or list of rdkit Mol or str
+            the SMILES or Mol objects (or multiple SMILES/Mol objects) you want to generate fingerprints for
+        return_valid : bool, default: False
+            also return a boolean validity mask of the molecules
+        sparse : bool, default: False
+            return `scipy.sparse.csr_matrix` objects instead of dense arrays
+
+        Returns
+        -------
+        tuple
+            `(fps_radius2, fps_radius3)`, each of size (M, 2048) and dtype `fp_dtype()`; rows of invalid molecules are
+            all zeros. With `return_valid=True`, `(fps_radius2, fps_radius3, valid)`
+
+        Raises
+        ------
+        OverflowError
+            if a count does not fit in `fp_dtype()`
+        """
+        mols = [to_mol(c) for c in np.atleast_1d(smis)]
+        rows_radius2, rows_radius3 = [], []
+        for i, mol in enumerate(mols):
+            if mol is None:
+                continue
+            radius2, radius3 = self._nonzero_pair(mol)
+            rows_radius2.append((i,) + radius2)
+            rows_radius3.append((i,) + radius3)
+
+        build = _csr_from_nonzero if sparse else _dense_from_nonzero
+        fps = (
+            build(rows_radius2, len(mols), self._dimension, self.fp_dtype()),
+            build(rows_radius3, len(mols), self._dimension, self.fp_dtype()),
+        )
+        if return_valid:
+            return fps + (np.array([mol is not None for mol in mols], dtype=bool),)
+        return fps
+
+    def _nonzero_pair(self, mol: Chem.rdchem.Mol) -> Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the `(indices, values)` of the nonzero elements of the radius 2 and the radius 3 FP of `mol`
+        """
+        additional_output = rdFingerprintGenerator.AdditionalOutput()
+        additional_output.AllocateBitInfoMap()
+        counts_radius3 = self._generator.GetCountFingerprint(mol, additionalOutput=additional_output).GetNonzeroElements()
+
+        counts_radius2 = dict(counts_radius3)
+        for bit, environments in additional_output.GetBitInfoMap().items():
+            for _, radius in environments:
+                if radius == 3:
+                    counts_radius2[bit] -= 1
+
+        max_value = np.iinfo(self.fp_dtype()).max
+        nonzero = []
+        for counts in (counts_radius2, counts_radius3):
+            counts = {bit: count for bit, count in counts.items() if count}
+            indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+            if self._binary:
+                values = np.ones(len(values), dtype=np.int64)
+            elif values.size and values.max() > max_value:
+                raise OverflowError(f"Morgan count {values.max()} does not fit in {self.fp_dtype()}")
+            nonzero.append((indices, values))
+        return nonzero[0], nonzero[1]
+
+
+# (radius 2 class, radius 3 class) -> settings of the HitGenMultiRadiusMorgan computing both
+MULTI_RADIUS_MORGAN_PAIRS = {
+    (HitGenECFP4, HitGenECFP6): {"use_features": False, "binary": False},
+    (HitGenFCFP4, HitGenFCFP6): {"use_features": True, "binary": False},
+    (HitGenBinaryECFP4, HitGenBinaryECFP6): {"use_features": False, "binary": True},
+    (HitGenBinaryFCFP4, HitGenBinaryFCFP6): {"use_features": True, "binary": True},
+}
+
+# Pairs for which the combined enumeration is slower than two separate ones: with cheap connectivity invariants,
+# reading the bit info back costs more than a second count enumeration
+SLOWER_MULTI_RADIUS_MORGAN_PAIRS = {(HitGenECFP4, HitGenECFP6)}
+
+
+def multi_radius_morgan_pairs(
+    fps_dict: Dict[str, BaseFPFunc], include_slower: bool = False
+) -> List[Tuple[str, str, HitGenMultiRadiusMorgan]]:
+    """
+    Finds the radius 2/radius 3 Morgan FPs of `fps_dict` that can be computed together
+
+    Parameters
+    ----------
+    fps_dict : dict
+        FP name -> FP object
+    include_slower : bool, default: False
+        also return the pairs listed in `SLOWER_MULTI_RADIUS_MORGAN_PAIRS` (ECFP4/ECFP6 counts), which are faster to
+        compute separately
+
+    Returns
+    -------
+    list of tuple
+        `(radius 2 FP name, radius 3 FP name, HitGenMultiRadiusMorgan)` for each pair, every FP name used at most once
+    """
+    pairs = []
+    for (radius2_type, radius3_type), settings in MULTI_RADIUS_MORGAN_PAIRS.items():
+        if not include_slower and (radius2_type, radius3_type) in SLOWER_MULTI_RADIUS_MORGAN_PAIRS:
+            continue
+        radius2_names = [name for name, fp in fps_dict.items() if type(fp) is radius2_type]
+        radius3_names = [name for name, fp in fps_dict.items() if type(fp) is radius3_type]
+        for radius2_name, radius3_name in zip(radius2_names, radius3_names):
+            pairs.append((radius2_name, radius3_name, HitGenMultiRadiusMorgan(**settings)))
+    return pairs
 
 
 class HitGenMACCS(BaseFPFunc):
@@ -361,6 +719,7 @@ class HitGenRDK(BaseFPFunc):
         self._func = partial(RDKFingerprint, **self._kwargs)
         self._binary = True
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetRDKitFPGenerator(fpSize=2048)
 
 
 class HitGenAvalon(BaseFPFunc):
@@ -408,6 +767,7 @@ class HitGenAtomPair(BaseFPFunc):
         super().__init__(**{"nBits": 2048})
         self._func = partial(rdMolDescriptors.GetHashedAtomPairFingerprint, **self._kwargs)
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetAtomPairGenerator(fpSize=2048)
 
 
 class HitGenBinaryAtomPair(BaseFPFunc):
@@ -440,6 +800,7 @@ class HitGenTopTor(BaseFPFunc):
         super().__init__(**{"nBits": 2048})
         self._func = partial(AllChem.GetHashedTopologicalTorsionFingerprint, **self._kwargs)
         self._dimension = 2048
+        self._generator = rdFingerprintGenerator.GetTopologicalTorsionGenerator(fpSize=2048)
 
 
 class HitGenBinaryTopTor(BaseFPFunc):
@@ -457,3 +818,187 @@ class HitGenBinaryTopTor(BaseFPFunc):
         self._func = partial(AllChem.GetHashedTopologicalTorsionFingerprintAsBitVect, **self._kwargs)
         self._binary = True
         self._dimension = 2048
+
+
+class FingerprintCache:
+    """
+    Persistent on-disk store of fingerprints keyed by canonical SMILES and FP settings
+
+    Parameters
+    ----------
+    path : str
+        path of the SQLite file holding the cache, created if it does not exist
+
+    Notes
+    -----
+    Values are stored per (settings key, canonical SMILES), where the settings key hashes the FP settings returned by
+    `BaseFPFunc.to_dict()` (see `fp_settings_key`), so the same compound is shared across files, targets and runs.
+    Raw SMILES are mapped to their canonical form in a separate alias table, so warm lookups never parse a SMILES;
+    SMILES missing from the table are first looked up in the process-wide canonicalization.CANONICALIZER.
+    The whole cache is dropped when the RDKit version changes, as both FPs and canonical SMILES can change with it.
+    The file is opened in WAL mode, so any number of processes can read while one of them writes
+    """
+    _BATCH_SIZE = 500  # stays below SQLite's default limit on bound parameters
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS smiles_alias (smiles TEXT PRIMARY KEY, canonical TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "settings TEXT, canonical TEXT, value BLOB, PRIMARY KEY (settings, canonical)) WITHOUT ROWID"
+            )
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'rdkit_version'").fetchone()
+            if row is None or row[0] != rdBase.rdkitVersion:
+                self._conn.execute("DELETE FROM smiles_alias")
+                self._conn.execute("DELETE FROM fingerprints")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('rdkit_version', ?)", (rdBase.rdkitVersion,)
+                )
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def fp_settings_key(fp_func: Union["BaseFPFunc", dict]) -> str:
+        """
+        Returns the key identifying a FP configuration in the cache
+
+        Parameters
+        ----------
+        fp_func : BaseFPFunc or dict
+            the FP function, or a dict of settings for values that are not produced by a `BaseFPFunc`
+
+        Returns
+        -------
+        str
+            hash of the FP settings (and of the dtype the values are stored in for a `BaseFPFunc`)
+        """
+        if isinstance(fp_func, BaseFPFunc):
+            settings = dict(fp_func.to_dict(), dimension=fp_func._dimension, dtype=str(fp_func.fp_dtype()))
+        else:
+            settings = fp_func
+        return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _select_in(self, query: str, keys: List[str], *params) -> List[tuple]:
+        rows = []
+        for start in range(0, len(keys), self._BATCH_SIZE):
+            batch = keys[start:start + self._BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(self._conn.execute(query.format(placeholders), (*params, *batch)).fetchall())
+        return rows
+
+    def canonicalize(
+        self, smis: List[str]
+    ) -> Tuple[List[Optional[str]], Dict[int, Chem.rdchem.Mol]]:
+        """
+        Maps SMILES to their canonical SMILES, parsing only SMILES never seen by the cache before
+
+        Parameters
+        ----------
+        smis : list of str
+            the SMILES to canonicalize
+
+        Returns
+        -------
+        canonical : list of str or None
+            the canonical SMILES of each input, None if it cannot be parsed
+        mols : dict
+            position -> Mol for the SMILES that had to be parsed, so callers can reuse them instead of parsing again
+        """
+        unique_smis = list({smi for smi in smis if isinstance(smi, str)})
+        known = dict(self._select_in("SELECT smiles, canonical FROM smiles_alias WHERE smiles IN ({})", unique_smis))
+        # SMILES canonicalized earlier in this process (e.g. by another stage) are not parsed again
+        shared = CANONICALIZER.cached([smi for smi in unique_smis if smi not in known])
+
+        parsed = {}
+        new_aliases = {}
+        mols = {}
+        canonical = []
+        for i, smi in enumerate(smis):
+            if not isinstance(smi, str):
+                canonical.append(None)
+                continue
+            if smi not in known:
+                if smi in shared:
+                    known[smi] = shared[smi]
+                else:
+                    mol = to_mol(smi)
+                    known[smi] = Chem.MolToSmiles(mol) if mol is not None else None
+                    if mol is not None:
+                        parsed[smi] = mol
+                new_aliases[smi] = known[smi]
+            if smi in parsed:
+                mols[i] = parsed[smi]
+            canonical.append(known[smi])
+        CANONICALIZER.remember({smi: known[smi] for smi in unique_smis})
+
+        if new_aliases:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO smiles_alias (smiles, canonical) VALUES (?, ?)", new_aliases.items()
+                )
+        return canonical, mols
+
+    def get_many(
+        self, settings_key: str, canonical_smis: List[str], dtype: npt.DTypeLike, dimension: int
+    ) -> Tuple[np.ndarray, npt.NDArray[np.bool_]]:
+        """
+        Bulk lookup of cached values
+
+        Parameters
+        ----------
+        settings_key : str
+            key of the FP configuration, from `fp_settings_key`
+        canonical_smis : list of str
+            canonical SMILES to look up
+        dtype : dtype
+            dtype the values were stored in
+        dimension : int
+            length of each stored value
+
+        Returns
+        -------
+        values : ndarray
+            array of size (M, dimension), rows that were not found are zeros
+        found : ndarray of bool
+            True for the rows found in the cache
+        """
+        values = np.zeros((len(canonical_smis), dimension), dtype=dtype)
+        found = np.zeros(len(canonical_smis), dtype=bool)
+        stored = dict(
+            self._select_in(
+                "SELECT canonical, value FROM fingerprints WHERE settings = ? AND canonical IN ({})",
+                list(set(canonical_smis)),
+                settings_key,
+            )
+        )
+        for i, smi in enumerate(canonical_smis):
+            blob = stored.get(smi)
+            if blob is not None:
+                values[i] = np.frombuffer(blob, dtype=dtype)
+                found[i] = True
+        return values, found
+
+    def put_many(self, settings_key: str, canonical_smis: List[str], values: np.ndarray):
+        """
+        Bulk insert of computed values
+
+        Parameters
+        ----------
+        settings_key : str
+            key of the FP configuration, from `fp_settings_key`
+        canonical_smis : list of str
+            canonical SMILES of each row of `values`
+        values : ndarray
+            array of size (M, d), already in the dtype it should be stored in
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (settings, canonical, value) VALUES (?, ?, ?)",
+                ((settings_key, smi, row.tobytes()) for smi, row in zip(canonical_smis, values)),
+            )
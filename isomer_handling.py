@@ -6,6 +6,7 @@ Created on Fri Feb 28 12:14:55 2025
 """
 
 import os
+import numpy as np
 import pandas as pd
 
 def handle_isomers(df, sep_file_name):
@@ -26,45 +27,48 @@ def handle_isomers(df, sep_file_name):
         raise ValueError(f"Missing required columns: {required_columns - set(df.columns)}")
 
     # Identify rows with isomers (rows where SMILES contains ";")
-    isomer_rows = df[df["SMILES"].str.contains(";", na=False)].copy()
-
-    # Storage for new expanded rows
-    expanded_rows = []
+    has_isomers = df["SMILES"].str.contains(";", na=False).to_numpy(dtype=bool)
+    isomer_rows = df[has_isomers]
     log_rows = []
 
-    # Process each row with isomers
-    for _, row in isomer_rows.iterrows():
-        # Split isomer-related columns into lists
-        compound_ids = row["COMPOUND_ID"].split(";")
-        compound_formulas = row["COMPOUND_FORMULA"].split(";")
-        smiles_list = row["SMILES"].split(";")
-
-        # Ensure lists have the same length
-        if not (len(compound_ids) == len(compound_formulas) == len(smiles_list)):
-            raise ValueError(f"Inconsistent isomer data in row: {row}")
-
-        # Create new rows for each isomer
-        for i, (comp_id, comp_formula, smile) in enumerate(zip(compound_ids, compound_formulas, smiles_list)):
-            new_row = row.copy()  # Copy original row
-            new_row["COMPOUND_ID"] = comp_id
-            new_row["COMPOUND_FORMULA"] = comp_formula
-            new_row["SMILES"] = smile
-            new_row["ISOMERS"] = ";".join([x for j, x in enumerate(compound_ids) if j != i])  # Store other isomers
-
-            '''# Add to log if ENRICHMENT > 5
-            if new_row["EASMS_ENRICHMENT"] > 5 and new_row["PVALUE"] < 0.05:
-                #log_rows.append(new_row[["COMPOUND_ID", "COMPOUND_FORMULA", "SMILES", "ENRICHMENT", "ISOMERS"]])
-                log_rows.append(new_row)'''
-
-            expanded_rows.append(new_row)
-
-    # Convert expanded rows into a DataFrame
-    expanded_df = pd.DataFrame(expanded_rows)
-
-    # Remove original isomer-containing rows and append the new ones
-    df = df[~df["SMILES"].str.contains(";", na=False)]
-    df = pd.concat([df, expanded_df], ignore_index=True)
-    
+    # Split isomer-related columns into lists
+    split_columns = {
+        column: [value.split(";") if isinstance(value, str) else None for value in isomer_rows[column]]
+        for column in ("COMPOUND_ID", "COMPOUND_FORMULA", "SMILES")
+    }
+    compound_ids = split_columns["COMPOUND_ID"]
+
+    # Ensure lists have the same length
+    lengths = np.array(
+        [[len(parts) if parts is not None else -1 for parts in split_columns[column]] for column in split_columns],
+        dtype=np.int64,
+    ).reshape(3, len(isomer_rows))
+    inconsistent = np.flatnonzero((lengths < 0).any(axis=0) | (lengths != lengths[0]).any(axis=0))
+    if len(inconsistent):
+        row = isomer_rows.iloc[inconsistent[0]]
+        raise ValueError(f"Inconsistent isomer data in row: {row}")
+
+    if len(isomer_rows):
+        # Explode the split columns in lockstep, one row per isomer in the original order
+        counts = lengths[0]
+        positions = np.repeat(np.arange(len(isomer_rows)), counts)
+        expanded = {column: isomer_rows[column].to_numpy(dtype=object)[positions] for column in df.columns}
+        for column, parts in split_columns.items():
+            expanded[column] = np.concatenate([np.asarray(values, dtype=object) for values in parts])
+
+        # Store the other members of each isomer group
+        expanded["ISOMERS"] = [
+            ";".join(ids[:i] + ids[i + 1:]) for ids in compound_ids for i in range(len(ids))
+        ]
+
+        # Build from plain lists so column dtypes are inferred exactly as for per-row Series
+        expanded_df = pd.DataFrame({column: list(values) for column, values in expanded.items()})
+
+        # Remove original isomer-containing rows and append the new ones
+        df = pd.concat([df[~has_isomers], expanded_df], ignore_index=True)
+    else:
+        df = df.reset_index(drop=True)
+
     # Ensure ISOMERS column exists and is filled
     if "ISOMERS" not in df.columns:
         df["ISOMERS"] = ""
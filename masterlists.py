@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Load-once access to the master-list workbooks (MasterList_Information.xlsx and the compound libraries).
+
+MasterListRegistry parses each workbook at most once per process and keeps a Parquet copy next to it
+(<workbook>.parquet), so later runs read columnar data instead of parsing Excel again. The copy records the size,
+modification time and SHA-1 of the workbook it was made from and is rebuilt when the workbook changes.
+
+For canonical matching of negatives, the registry also keeps, per master list, the canonical key (RDKit canonical
+SMILES) of every row (<workbook>.keys.parquet, rebuilt when the workbook or the RDKit version changes), so membership
+tests against the library do not depend on how a SMILES is spelled (see canonicalization.canonical_keys).
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rdkit import rdBase
+
+from canonicalization import canonical_keys
+
+_SOURCE_KEY = b"masterlist_source"
+KEY_COLUMN = "CANONICAL_KEY"
+
+
+def _file_sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MasterListRegistry:
+    """
+    In-memory cache of master-list workbooks, backed by Parquet copies stored next to them.
+
+    The returned DataFrames are shared between callers and must not be modified in place.
+
+    Args:
+        parquet (bool): Read and write the Parquet copies. With False, workbooks are only cached in memory.
+    """
+
+    def __init__(self, parquet=True):
+        self.parquet = parquet
+        self._frames = {}
+        self._keys = {}
+
+    @staticmethod
+    def parquet_path(path):
+        """
+        Returns the path of the Parquet copy of a workbook.
+        """
+        return f"{path}.parquet"
+
+    @staticmethod
+    def keys_path(path):
+        """
+        Returns the path of the canonical-key index of a workbook.
+        """
+        return f"{path}.keys.parquet"
+
+    def read(self, path):
+        """
+        Returns the first sheet of a workbook, parsing it only if neither the in-memory nor the Parquet copy is
+        up to date.
+
+        Args:
+            path (str): Path to the Excel workbook.
+
+        Returns:
+            pd.DataFrame: The sheet, as returned by pd.read_excel.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        cached = self._frames.get(key)
+        if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+            return cached[1]
+
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        df = self._load_copy(self.parquet_path(key), key, source) if self.parquet else None
+        if df is None:
+            df = pd.read_excel(key)
+            if self.parquet:
+                source["sha1"] = _file_sha1(key)
+                self._save_copy(self.parquet_path(key), key, df, source)
+
+        self._frames[key] = ((stat.st_size, stat.st_mtime_ns), df)
+        return df
+
+    def canonical_index(self, path):
+        """
+        Returns the canonical key of every row of a master list, computing it only if neither the in-memory nor the
+        persisted index is up to date.
+
+        Args:
+            path (str): Path to the Excel workbook, with a 'SMILES' column.
+
+        Returns:
+            pd.Series: Canonical key per row (see canonical_keys), aligned with the index of read(path).
+        """
+        key = os.path.abspath(path)
+        master_df = self.read(key)
+        stat = os.stat(key)
+        cached = self._keys.get(key)
+        if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+            return cached[1]
+
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "rdkit_version": rdBase.rdkitVersion}
+        index = self._load_copy(self.keys_path(key), key, source) if self.parquet else None
+        if index is None or len(index) != len(master_df):
+            index = pd.DataFrame({KEY_COLUMN: canonical_keys(master_df["SMILES"])}, dtype=object)
+            if self.parquet:
+                source["sha1"] = _file_sha1(key)
+                self._save_copy(self.keys_path(key), key, index, source, check=False)
+
+        keys = index[KEY_COLUMN].to_numpy(dtype=object, copy=True)
+        keys[pd.isna(keys)] = None
+        keys = pd.Series(keys, index=master_df.index, name=KEY_COLUMN)
+        self._keys[key] = ((stat.st_size, stat.st_mtime_ns), keys)
+        return keys
+
+    def preload(self, masterlist_path, MasterList_Information, canonical=False):
+        """
+        Reads MasterList_Information.xlsx and every master list it refers to, e.g. before starting worker processes.
+
+        Args:
+            masterlist_path (str): The directory containing master list files.
+            MasterList_Information (str): The path to the Excel file mapping file names to master lists.
+            canonical (bool): Also build the canonical-key index of every master list (for canonical matching of
+                negatives).
+        """
+        if not os.path.exists(MasterList_Information):
+            return
+        masterlist_info = self.read(MasterList_Information)
+        if "MaterListName" not in masterlist_info.columns:
+            return
+        for masterlist_name in masterlist_info["MaterListName"].dropna().unique():
+            masterlist_file = os.path.join(masterlist_path, f"{masterlist_name}.xlsx")
+            if not os.path.exists(masterlist_file):
+                continue
+            master_df = self.read(masterlist_file)
+            if canonical and "SMILES" in master_df.columns:
+                self.canonical_index(masterlist_file)
+
+    def _load_copy(self, copy_path, path, source):
+        """
+        Returns a Parquet file derived from a workbook, or None if it is missing or was made from a different file
+        (or, if source records an RDKit version, with a different one).
+        """
+        if not os.path.exists(copy_path):
+            return None
+        try:
+            table = pq.read_table(copy_path)
+            recorded = json.loads((table.schema.metadata or {}).get(_SOURCE_KEY, b"{}"))
+        except (pa.ArrowException, OSError, ValueError) as e:
+            print(f"Warning: Could not read {copy_path} ({e}). Rebuilding it from {path}.")
+            return None
+
+        if recorded.get("size") != source["size"] or recorded.get("rdkit_version") != source.get("rdkit_version"):
+            return None
+        if recorded.get("mtime_ns") != source["mtime_ns"]:
+            # Touched or copied, but possibly unchanged: compare the contents
+            source["sha1"] = _file_sha1(path)
+            if recorded.get("sha1") != source["sha1"]:
+                return None
+            df = table.to_pandas()
+            self._save_copy(copy_path, path, df, source, check=False)
+            return df
+        return table.to_pandas()
+
+    def _save_copy(self, copy_path, path, df, source, check=True):
+        """
+        Saves a Parquet file derived from a workbook, keeping it only if it reads back identical to df.
+        """
+        temp_path = f"{copy_path}.{os.getpid()}.tmp"
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[_SOURCE_KEY] = json.dumps(source).encode()
+            pq.write_table(table.replace_schema_metadata(metadata), temp_path)
+            if check and not pq.read_table(temp_path).to_pandas().equals(df):
+                raise ValueError("the Parquet copy does not read back identical to the workbook")
+            os.replace(temp_path, copy_path)
+        except (pa.ArrowException, OSError, ValueError) as e:
+            print(f"Warning: Could not save {copy_path} ({e}). It will be rebuilt from {path} in the next run.")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# Registry shared by the pipeline steps of a process
+MASTER_LISTS = MasterListRegistry()
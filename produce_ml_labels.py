@@ -1,6 +1,19 @@
 import pandas as pd
 import numpy as np
 
+# Ordered label rules: each row gets the label of the first rule whose condition holds, DEFAULT_LABEL if none does.
+# Conditions take the EASMS_ENRICHMENT and PVALUE arrays (NaN where missing) and a boolean array that is True where
+# ISOMERS is not empty; comparisons with NaN are False, so a missing PVALUE falls through to the later rules.
+LABEL_RULES = [
+    (-2, lambda enrichment, pvalue, has_isomers: np.isnan(enrichment)),
+    (3, lambda enrichment, pvalue, has_isomers: (enrichment >= 5) & (pvalue <= 0.05) & has_isomers),
+    (2, lambda enrichment, pvalue, has_isomers: (5 <= enrichment) & (enrichment < 10) & (pvalue <= 0.05)),
+    (1, lambda enrichment, pvalue, has_isomers: (enrichment >= 10) & (pvalue <= 0.05)),
+    (0, lambda enrichment, pvalue, has_isomers: ((0 <= enrichment) & (enrichment <= 1)) | (pvalue > 0.05)),
+    (-1, lambda enrichment, pvalue, has_isomers: (1 < enrichment) & (enrichment < 5) & (pvalue <= 0.05)),
+]
+DEFAULT_LABEL = -2
+
 def generate_ml_labels(df):
     """
     Assigns AIRCHECK_LABEL based on EASMS_ENRICHMENT, PVALUE, ISOMERS, and HAD_DUPLICATE_INTENSITY:
@@ -12,6 +25,9 @@ def generate_ml_labels(df):
     - AIRCHECK_LABEL = -1: if 1 < EASMS_ENRICHMENT < 5 and PVALUE ≤ 0.05
     - AIRCHECK_LABEL = -2: if EASMS_ENRICHMENT is missing
     - AIRCHECK_LABEL = 4: if HAD_DUPLICATE_INTENSITY == "Y" and ENRICHMENT > 5
+
+    Labels -2 to 3 are assigned by the first matching rule of LABEL_RULES (missing enrichment first);
+    label 4 overrides them.
     """
 
     required_columns = {"EASMS_ENRICHMENT", "PVALUE", "ISOMERS"}
@@ -19,35 +35,21 @@ def generate_ml_labels(df):
         raise ValueError(f"Missing required columns: {required_columns - set(df.columns)}")
 
     # Clean up values
-    df["EASMS_ENRICHMENT"].replace("", np.nan, inplace=True)
-    df["PVALUE"].replace("", np.nan, inplace=True)
+    df["EASMS_ENRICHMENT"] = df["EASMS_ENRICHMENT"].replace("", np.nan)
+    df["PVALUE"] = df["PVALUE"].replace("", np.nan)
 
     # Convert to numeric
     df["EASMS_ENRICHMENT"] = pd.to_numeric(df["EASMS_ENRICHMENT"], errors="coerce")
     df["PVALUE"] = pd.to_numeric(df["PVALUE"], errors="coerce")
 
-    def assign_label(row):
-        enrichment = row["EASMS_ENRICHMENT"]
-        pvalue = row["PVALUE"]
-        isomer = str(row["ISOMERS"]).strip()
-
-        if pd.isna(enrichment):
-            return -2
-        elif enrichment >= 5 and pvalue <= 0.05 and isomer != 'nan' and isomer != "":
-            return 3
-        elif 5 <= enrichment < 10 and pvalue <= 0.05:
-            return 2
-        elif enrichment >= 10 and pvalue <= 0.05:
-            return 1
-        elif 0 <= enrichment <= 1 or pvalue > 0.05:
-            return 0
-        elif 1 < enrichment < 5 and pvalue <= 0.05:
-            return -1
-        else:
-            return -2  # fallback
-
-    # Assign labels
-    df["AIRCHECK_LABEL"] = df.apply(assign_label, axis=1).astype("int8")
+    # Assign labels (LABEL_RULES), evaluated on whole columns
+    enrichment = df["EASMS_ENRICHMENT"].to_numpy(dtype=float, na_value=np.nan)
+    pvalue = df["PVALUE"].to_numpy(dtype=float, na_value=np.nan)
+    isomers = df["ISOMERS"].map(str).str.strip()
+    has_isomers = ((isomers != "nan") & (isomers != "")).to_numpy(dtype=bool)
+    conditions = [condition(enrichment, pvalue, has_isomers) for _, condition in LABEL_RULES]
+    labels = np.select(conditions, [label for label, _ in LABEL_RULES], default=DEFAULT_LABEL)
+    df["AIRCHECK_LABEL"] = pd.Series(labels, index=df.index).astype("int8")
 
     # Apply the NA rule for high enrichment and duplicate intensity
     if "HAD_DUPLICATE_INTENSITY" in df.columns:
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Compound x target sufficient statistics of the replicate intensities.
+
+compute_and_add_scores scores every target against all other targets. Instead of concatenating the frames of the
+other targets for each target, TargetStatistics keeps per compound and target the sums, counts and extremes the
+scores are built from, and derives the values for "all targets except this one" by subtracting the target's own
+statistics from the totals (sums, counts) or by taking the runner-up (max/min).
+
+The statistics of a batch can be saved as a Parquet store and updated one target at a time (TargetStatistics.update,
+TargetStatistics.remove), which reports the compounds whose statistics changed.
+"""
+
+import numpy as np
+import pandas as pd
+
+REPLICATE_COLUMNS = ["POS_INT_REP1", "POS_INT_REP2", "POS_INT_REP3"]
+
+
+def replicate_values(df):
+    """
+    Returns the replicate intensities of a DataFrame as an (N, 3) float array, NaN where missing or not numeric.
+    """
+    return df[REPLICATE_COLUMNS].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+
+def _top_two(values, largest=True):
+    """
+    Largest (or smallest) and runner-up value of every row of an (N, F) array, ignoring NaN.
+
+    Returns:
+        tuple: (first, first_column, second) where first/second are NaN if a row has fewer non-NaN values.
+    """
+    fill = -np.inf if largest else np.inf
+    filled = np.where(np.isnan(values), fill, values)
+    order = np.argsort(-filled if largest else filled, axis=1, kind="stable")
+    rows = np.arange(len(values))
+    first_column = order[:, 0]
+    first = filled[rows, first_column]
+    second = filled[rows, order[:, 1]] if values.shape[1] > 1 else np.full(len(values), fill)
+    first[first == fill] = np.nan
+    second[second == fill] = np.nan
+    return first, first_column, second
+
+
+class TargetStatistics:
+    """
+    Sufficient statistics of the replicate intensities per compound and target.
+
+    Every statistic is an (n_compounds, n_targets) array:
+        rows: number of rows of the compound in the target's file.
+        row_mean_sum / row_mean_count: sum and count of the non-NaN per-row replicate means.
+        value_count / value_sum / value_sumsq: count, sum and sum of squares of the non-NaN replicates, with the
+            sums taken around a per-compound shift (the compound's first replicate value) to limit cancellation.
+        value_max / value_min: extremes of the replicates.
+        target_value_max / target_value_min: extremes of TARGET_VALUE.
+
+    Args:
+        compounds (pd.Index): Compound IDs, one per row of the statistics.
+        targets (list): Target keys (e.g. file paths), one per column of the statistics.
+        shift (np.ndarray): Per-compound shift of value_sum and value_sumsq.
+        stats (dict): Statistic name -> (n_compounds, n_targets) array.
+    """
+
+    SUMMED = ["rows", "row_mean_sum", "row_mean_count", "value_count", "value_sum", "value_sumsq"]
+    EXTREMES = {"value_max": True, "value_min": False, "target_value_max": True, "target_value_min": False}
+
+    def __init__(self, compounds, targets, shift, stats):
+        self.compounds = pd.Index(compounds)
+        self.targets = list(targets)
+        self.shift = shift
+        self.stats = stats
+        self._summarize()
+
+    def _summarize(self, compounds=None):
+        """
+        Precomputes the totals over all targets and the top two extremes of every compound, or only of the given
+        compounds (boolean mask) when the others are unchanged.
+        """
+        if compounds is None:
+            self._totals = {name: self.stats[name].sum(axis=1) for name in self.SUMMED}
+            self._top_two = {name: _top_two(self.stats[name], largest) for name, largest in self.EXTREMES.items()}
+            return
+        for name in self.SUMMED:
+            self._totals[name][compounds] = self.stats[name][compounds].sum(axis=1)
+        for name, largest in self.EXTREMES.items():
+            for summary, update in zip(self._top_two[name], _top_two(self.stats[name][compounds], largest)):
+                summary[compounds] = update
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Collects the statistics of a set of targets.
+
+        Args:
+            frames (dict): Target key -> DataFrame with COMPOUND_ID, the replicate columns and TARGET_VALUE.
+
+        Returns:
+            TargetStatistics: Statistics of all compounds found in any of the frames.
+        """
+        targets = list(frames)
+        codes_per_target, compounds = cls._factorize_compounds(frames)
+        n_compounds, n_targets = len(compounds), len(targets)
+
+        stats = {name: np.zeros((n_compounds, n_targets)) for name in cls.SUMMED}
+        stats.update({name: np.full((n_compounds, n_targets), np.nan) for name in cls.EXTREMES})
+
+        # the first replicate value of each compound (in target and row order) is its shift
+        first_values = np.concatenate([np.zeros(0)] + [cls._first_values(df) for df in frames.values()])
+        all_codes = np.concatenate([np.zeros(0, dtype=np.intp)] + codes_per_target)
+        shift = pd.Series(first_values).groupby(all_codes).first().reindex(range(n_compounds)).fillna(0).to_numpy()
+
+        for target, (codes, df) in enumerate(zip(codes_per_target, frames.values())):
+            for name, column in cls._target_columns(codes, df, shift).items():
+                stats[name][:, target] = column
+
+        return cls(compounds, targets, shift, stats)
+
+    @classmethod
+    def _target_columns(cls, codes, df, shift):
+        """
+        Statistics of one target's frame, one value per compound.
+
+        Args:
+            codes (np.ndarray): Compound code of each row of df (-1 for rows to ignore).
+            df (pd.DataFrame): The target's rows, with the replicate columns and TARGET_VALUE.
+            shift (np.ndarray): Per-compound shift of value_sum and value_sumsq.
+
+        Returns:
+            dict: Statistic name -> (n_compounds,) array.
+        """
+        n_compounds = len(shift)
+        known = codes >= 0
+        codes = codes[known]
+        values = replicate_values(df)[known]
+        row_means = pd.DataFrame(values).mean(axis=1, skipna=True).to_numpy(dtype=float)
+        target_values = pd.to_numeric(df["TARGET_VALUE"], errors="coerce").to_numpy(dtype=float)[known]
+
+        columns = {"rows": np.bincount(codes, minlength=n_compounds).astype(float)}
+        has_mean = ~np.isnan(row_means)
+        columns["row_mean_sum"] = np.bincount(codes[has_mean], row_means[has_mean], n_compounds)
+        columns["row_mean_count"] = np.bincount(codes[has_mean], minlength=n_compounds).astype(float)
+
+        value_codes = np.repeat(codes, values.shape[1])
+        values = values.ravel()
+        observed = ~np.isnan(values)
+        value_codes, values = value_codes[observed], values[observed]
+        deviations = values - shift[value_codes]
+        columns["value_count"] = np.bincount(value_codes, minlength=n_compounds).astype(float)
+        columns["value_sum"] = np.bincount(value_codes, deviations, n_compounds)
+        columns["value_sumsq"] = np.bincount(value_codes, deviations * deviations, n_compounds)
+
+        for name, source_codes, source in (
+            ("value_max", value_codes, values), ("value_min", value_codes, values),
+            ("target_value_max", codes, target_values), ("target_value_min", codes, target_values),
+        ):
+            column = np.full(n_compounds, np.nan)
+            (np.fmax if cls.EXTREMES[name] else np.fmin).at(column, source_codes, source)
+            columns[name] = column
+        return columns
+
+    @staticmethod
+    def _first_values(df):
+        """
+        First non-NaN replicate value of every row of df (NaN if the row has none).
+        """
+        return pd.DataFrame(replicate_values(df)).bfill(axis=1).iloc[:, 0].to_numpy(dtype=float)
+
+    @staticmethod
+    def _factorize_compounds(frames):
+        """
+        Gives every compound ID found in the frames a code (NaN IDs get -1), consistently across the frames.
+        """
+        ids = [df["COMPOUND_ID"] for df in frames.values()]
+        all_codes, compounds = pd.factorize(pd.concat(ids, ignore_index=True) if ids else pd.Series(dtype=object))
+        bounds = np.cumsum([0] + [len(col) for col in ids])
+        return [all_codes[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])], pd.Index(compounds)
+
+    def leave_one_out(self, target, compound_ids):
+        """
+        Statistics of the given compounds over all targets except one.
+
+        Args:
+            target: Target key to leave out.
+            compound_ids (pd.Series or array-like): Compound IDs to look up (e.g. the COMPOUND_ID column of the
+                target's own frame).
+
+        Returns:
+            dict: Arrays aligned with compound_ids:
+                rows: Number of rows of the compound in the other targets (0 if absent).
+                selective_value / ntc_value: Max / min TARGET_VALUE in the other targets.
+                mean_nontarget: Mean of the per-row replicate means in the other targets.
+                value_count / value_mean / value_var: Count, mean and variance (ddof=0) of the replicates in the
+                    other targets.
+        """
+        column = self.targets.index(target)
+        # -1 (unknown or NaN compound ID) picks the empty compound appended at the end
+        codes = self.compounds.get_indexer(pd.Index(compound_ids))
+
+        def others(name):
+            total = np.append(self._totals[name] - self.stats[name][:, column], 0)
+            return total[codes]
+
+        def others_extreme(name):
+            first, first_column, second = self._top_two[name]
+            value = np.where(first_column == column, second, first)
+            return np.append(value, np.nan)[codes]
+
+        rows = others("rows")
+        row_mean_count = others("row_mean_count")
+        value_count = others("value_count")
+        value_sum = others("value_sum")
+        value_sumsq = others("value_sumsq")
+        shift = np.append(self.shift, 0)[codes]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_nontarget = np.where(row_mean_count > 0, others("row_mean_sum") / row_mean_count, np.nan)
+            shifted_mean = value_sum / value_count
+            value_mean = shift + shifted_mean
+            value_var = np.maximum(value_sumsq / value_count - shifted_mean * shifted_mean, 0)
+        # an exactly constant sample has exactly zero variance, whatever the rounding of the sums
+        value_var[others_extreme("value_max") == others_extreme("value_min")] = 0
+
+        return {
+            "rows": rows,
+            "selective_value": others_extreme("target_value_max"),
+            "ntc_value": others_extreme("target_value_min"),
+            "mean_nontarget": mean_nontarget,
+            "value_count": value_count,
+            "value_mean": value_mean,
+            "value_var": value_var,
+        }
+
+    def update(self, target, df):
+        """
+        Replaces the statistics of one target (or adds a new target) with those of its new frame.
+
+        Compounds not seen before are added, with their first replicate value in df as shift; the shift of known
+        compounds is kept, so the result can differ from TargetStatistics.from_frames in the last bits.
+
+        Args:
+            target: Target key.
+            df (pd.DataFrame): The target's rows, with COMPOUND_ID, the replicate columns and TARGET_VALUE.
+
+        Returns:
+            dict: Statistic name -> boolean mask of the compounds whose statistic changed.
+        """
+        ids = df["COMPOUND_ID"]
+        codes = self.compounds.get_indexer(pd.Index(ids))
+        unseen = (codes < 0) & ids.notna().to_numpy()
+        if unseen.any():
+            new_shift = pd.Series(self._first_values(df)[unseen])\
+                .groupby(ids[unseen].to_numpy(), sort=False).first().fillna(0)
+            self._add_compounds(new_shift.index, new_shift.to_numpy())
+            codes = self.compounds.get_indexer(pd.Index(ids))
+        if target not in self.targets:
+            self._add_target(target)
+
+        column = self.targets.index(target)
+        return self._replace_column(column, self._target_columns(codes, df, self.shift))
+
+    def remove(self, target):
+        """
+        Drops the statistics of one target.
+
+        Returns:
+            dict: Statistic name -> boolean mask of the compounds whose statistic changed.
+        """
+        column = self.targets.index(target)
+        changed = {
+            name: (values[:, column] != 0) if name in self.SUMMED else ~np.isnan(values[:, column])
+            for name, values in self.stats.items()
+        }
+        del self.targets[column]
+        self.stats = {name: np.delete(values, column, axis=1) for name, values in self.stats.items()}
+        self._summarize()
+        return changed
+
+    def _replace_column(self, column, new_columns):
+        changed = {}
+        for name, new_column in new_columns.items():
+            old_column = self.stats[name][:, column]
+            changed[name] = ~((old_column == new_column) | (np.isnan(old_column) & np.isnan(new_column)))
+            self.stats[name][:, column] = new_column
+        self._summarize(np.logical_or.reduce(list(changed.values())))
+        return changed
+
+    def _add_compounds(self, compounds, shift):
+        self.compounds = self.compounds.append(compounds)
+        self.shift = np.concatenate([self.shift, shift])
+        for name, values in self.stats.items():
+            fill = np.nan if name in self.EXTREMES else 0.
+            self.stats[name] = np.vstack([values, np.full((len(compounds), values.shape[1]), fill)])
+        self._summarize()
+
+    def _add_target(self, target):
+        self.targets.append(target)
+        for name, values in self.stats.items():
+            fill = np.nan if name in self.EXTREMES else 0.
+            self.stats[name] = np.hstack([values, np.full((len(values), 1), fill)])
+        self._summarize()
+
+    def to_frame(self):
+        """
+        The statistics as a long DataFrame, one row per compound and target the compound occurs in.
+        """
+        frames = []
+        for column, target in enumerate(self.targets):
+            present = self.stats["rows"][:, column] > 0
+            frame = pd.DataFrame({"COMPOUND_ID": self.compounds[present], "TARGET": str(target),
+                                  "SHIFT": self.shift[present]})
+            for name in self.SUMMED + list(self.EXTREMES):
+                frame[name] = self.stats[name][present, column]
+            frames.append(frame)
+        columns = ["COMPOUND_ID", "TARGET", "SHIFT"] + self.SUMMED + list(self.EXTREMES)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+    def save(self, path):
+        """
+        Saves the statistics as a Parquet store (see to_frame).
+        """
+        self.to_frame().to_parquet(path, index=False)
+        print(f"Saved score statistics: {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads statistics saved with TargetStatistics.save.
+        """
+        frame = pd.read_parquet(path)
+        compound_codes, compounds = pd.factorize(frame["COMPOUND_ID"])
+        target_codes, targets = pd.factorize(frame["TARGET"])
+        shift = np.zeros(len(compounds))
+        shift[compound_codes] = frame["SHIFT"].to_numpy(dtype=float)
+
+        stats = {}
+        for name in cls.SUMMED + list(cls.EXTREMES):
+            values = np.full((len(compounds), len(targets)), np.nan if name in cls.EXTREMES else 0.)
+            values[compound_codes, target_codes] = frame[name].to_numpy(dtype=float)
+            stats[name] = values
+        return cls(compounds, list(targets), shift, stats)
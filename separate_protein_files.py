@@ -8,16 +8,16 @@ Created on Fri Feb 28 10:10:24 2025
 import os
 import pandas as pd
 
-def split_protein_data(file_path, subfolder):
+def split_protein_frames(file_path):
     """
-    Splits a CSV file based on the 'PROTEIN_NUMBER' column and saves each part separately.
-    
+    Splits a CSV file based on the 'TARGET_ID' column, keeping the parts in memory.
+
     Args:
         file_path (str): Path to the input CSV file.
-        subfolder (str): Path to the folder where separated files should be stored.
-        
+
     Returns:
-        list: List of file paths for the separated CSV files.
+        dict: Base name of each part ("<TARGET_ID>_AsmBatchNumber<ASMS_BATCH_NUM>") -> DataFrame of its rows,
+            in the order split_protein_data writes them.
     """
     # Load the CSV file
     print(file_path)
@@ -29,8 +29,7 @@ def split_protein_data(file_path, subfolder):
     if not required_columns.issubset(df.columns):
         raise ValueError(f"Missing required columns: {required_columns - set(df.columns)}")
 
-    # Dictionary to store output file paths
-    separated_files = []
+    separated_frames = {}
 
     # Group by PROTEIN_NUMBER and process each group
     for protein_number, group_df in df.groupby("TARGET_ID"):
@@ -38,11 +37,27 @@ def split_protein_data(file_path, subfolder):
         batch_number = group_df["ASMS_BATCH_NUM"].iloc[0]  # Take the first batch number
         protein_name = group_df["TARGET_ID"].iloc[0]  # Take the first protein name
 
-        # Construct the filename
-        file_name = f"{protein_name}_AsmBatchNumber{batch_number}.csv"
+        separated_frames[f"{protein_name}_AsmBatchNumber{batch_number}"] = group_df.reset_index(drop=True)
 
+    return separated_frames
+
+def split_protein_data(file_path, subfolder):
+    """
+    Splits a CSV file based on the 'PROTEIN_NUMBER' column and saves each part separately.
+    
+    Args:
+        file_path (str): Path to the input CSV file.
+        subfolder (str): Path to the folder where separated files should be stored.
+        
+    Returns:
+        list: List of file paths for the separated CSV files.
+    """
+    # Dictionary to store output file paths
+    separated_files = []
+
+    for base_name, group_df in split_protein_frames(file_path).items():
         # Define the file path
-        output_path = os.path.join(subfolder, file_name)
+        output_path = os.path.join(subfolder, f"{base_name}.csv")
 
         # Save the separated file
         group_df.to_csv(output_path, index=False) 
@@ -51,3 +66,22 @@ def split_protein_data(file_path, subfolder):
         print(f"  Saved separated file: {output_path}")
 
     return separated_files
+
+def save_separated_frames(separated_frames, subfolder):
+    """
+    Saves in-memory separated (and scored) frames as Parquet files.
+
+    Args:
+        separated_frames (dict): Base name -> DataFrame, as returned by split_protein_frames.
+        subfolder (str): Path to the folder where separated files should be stored.
+
+    Returns:
+        list: List of file paths for the separated Parquet files.
+    """
+    separated_files = []
+    for base_name, df in separated_frames.items():
+        output_path = os.path.join(subfolder, f"{base_name}.parquet")
+        df.to_parquet(output_path, index=False)
+        separated_files.append(output_path)
+        print(f"  Saved separated file: {output_path}")
+    return separated_files
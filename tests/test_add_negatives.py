@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from add_negatives import add_negative_samples_from_masterlist
+from masterlists import MasterListRegistry
+
+
+@pytest.fixture
+def master_lists(tmp_path):
+    masterlist_info = tmp_path / "MasterList_Information.xlsx"
+    pd.DataFrame({"FileName": ["raw.csv"], "MaterListName": ["Library"]}).to_excel(masterlist_info, index=False)
+    pd.DataFrame({
+        "SMILES": ["OCC", "c1ccccc1", "CCN"],
+        "SGC ID for Component": ["L1", "L2", "L3"],
+        "SGC ID for Pool": ["P1", "P1", "P2"],
+        "formula": ["C2H6O", "C6H6", "C2H7N"],
+    }).to_excel(tmp_path / "Library.xlsx", index=False)
+    return str(tmp_path), str(masterlist_info)
+
+
+def _target():
+    return pd.DataFrame({
+        "COMPOUND_ID": ["C1", "C2"],
+        "SMILES": ["CCO", "CCN"],
+        "TARGET_ID": ["T0", "T0"],
+        "BINARY_LABEL": ["P", "P"],
+    })
+
+
+def _negatives(master_lists, **kwargs):
+    masterlist_path, masterlist_info = master_lists
+    df = add_negative_samples_from_masterlist(
+        _target(), "raw.csv", masterlist_path, masterlist_info, registry=MasterListRegistry(parquet=False), **kwargs
+    )
+    return df.loc[df["BINARY_LABEL"] == "N", "COMPOUND_ID"].tolist()
+
+
+def test_raw_smiles_matching_by_default(master_lists):
+    # 'OCC' is ethanol, as 'CCO' in the target, but written differently
+    assert _negatives(master_lists) == ["L1", "L2"]
+
+
+def test_canonical_matching(master_lists):
+    assert _negatives(master_lists, canonical=True) == ["L2"]
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from add_scores import add_scores_to_frames, compute_pvalues, update_scores, welch_pvalue_reference
+from score_statistics import REPLICATE_COLUMNS, TargetStatistics, replicate_values
+
+SCORE_COLUMNS = [
+    "TARGET_VALUE", "SELECTIVE_VALUE", "NTC_VALUE", "ENRICHMENT", "SELECTIVE_ENRICHMENT", "EASMS_ENRICHMENT",
+    "MEAN_NONTARGET_VALUES", "PVALUE",
+]
+
+
+def _frame(compound_ids, values):
+    df = pd.DataFrame(np.asarray(values, dtype=float), columns=REPLICATE_COLUMNS)
+    df.insert(0, "COMPOUND_ID", compound_ids)
+    return df
+
+
+def _reference_pvalues(df, merged_other):
+    """
+    P-values of the per-compound scipy path, NaN where it gives none.
+    """
+    interest_values = replicate_values(df)
+    other_values = replicate_values(merged_other)
+    pvalues = []
+    for i, compound_id in enumerate(df["COMPOUND_ID"]):
+        reference = None
+        if not pd.isna(compound_id):
+            other = other_values[(merged_other["COMPOUND_ID"] == compound_id).to_numpy()].ravel()
+            interest = interest_values[i]
+            reference = welch_pvalue_reference(interest[~np.isnan(interest)], other[~np.isnan(other)])
+        pvalues.append(np.nan if reference is None else reference)
+    return np.array(pvalues, dtype=float)
+
+
+def _assert_parity(df, merged_other):
+    np.testing.assert_allclose(compute_pvalues(df, merged_other), _reference_pvalues(df, merged_other), rtol=1e-12)
+
+
+def test_fewer_than_three_other_values():
+    df = _frame(["A", "B"], [[1, 2, 3], [4, 5, 6]])
+    merged_other = _frame(["A", "B", "B"], [[1, np.nan, np.nan], [7, np.nan, np.nan], [8, np.nan, np.nan]])
+
+    pvalues = compute_pvalues(df, merged_other)
+
+    assert np.isnan(pvalues).all()
+    _assert_parity(df, merged_other)
+
+
+def test_missing_target_values():
+    df = _frame(["A"], [[np.nan, np.nan, np.nan]])
+    merged_other = _frame(["A"], [[1, 2, 3]])
+
+    assert np.isnan(compute_pvalues(df, merged_other)).all()
+    _assert_parity(df, merged_other)
+
+
+def test_constant_samples():
+    df = _frame(["A", "B"], [[5, 5, 5], [1, 2, 3]])
+    merged_other = _frame(["A", "B"], [[1, 2, 3], [4, 4, 4]])
+
+    np.testing.assert_array_equal(compute_pvalues(df, merged_other), [1.0, 1.0])
+    _assert_parity(df, merged_other)
+
+
+def test_nan_compound_id():
+    df = _frame([np.nan, "A"], [[1, 2, 3], [1, 2, 4]])
+    merged_other = _frame([np.nan, "A", "A"], [[4, 5, 6], [2, 3, 5], [7, 8, 9]])
+
+    pvalues = compute_pvalues(df, merged_other)
+
+    assert np.isnan(pvalues[0]) and not np.isnan(pvalues[1])
+    _assert_parity(df, merged_other)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_data(seed):
+    rng = np.random.default_rng(seed)
+    compounds = [f"C{i}" for i in range(40)]
+
+    def random_frame(n_rows):
+        values = rng.lognormal(10, 1, size=(n_rows, len(REPLICATE_COLUMNS)))
+        values[rng.random(values.shape) < 0.2] = np.nan
+        return _frame(rng.choice(compounds, n_rows), values)
+
+    _assert_parity(random_frame(60), random_frame(300))
+
+
+def test_statistics_method_matches_reference():
+    rng = np.random.default_rng(0)
+    compounds = [f"C{i}" for i in range(30)]
+    frames = {}
+    for target in ("T0", "T1", "T2", "T3"):
+        values = rng.lognormal(10, 1, size=(50, len(REPLICATE_COLUMNS)))
+        values[rng.random(values.shape) < 0.2] = np.nan
+        frames[target] = _frame(rng.choice(compounds, 50), values)
+
+    add_scores_to_frames(frames, method="statistics")
+
+    for target, df in frames.items():
+        merged_other = pd.concat([d for t, d in frames.items() if t != target], ignore_index=True)
+        np.testing.assert_allclose(df["PVALUE"], _reference_pvalues(df, merged_other), rtol=1e-9)
+
+
+def _random_frames(seed, targets=("T0", "T1", "T2", "T3"), n_rows=50):
+    rng = np.random.default_rng(seed)
+    # "Z" has zero intensities everywhere (EASMS_ENRICHMENT is empty), "U<target>" only occurs in one target
+    compounds = [f"C{i}" for i in range(30)] + ["Z"]
+    frames = {}
+    for target in targets:
+        values = rng.lognormal(10, 1, size=(n_rows, len(REPLICATE_COLUMNS)))
+        values[rng.random(values.shape) < 0.2] = np.nan
+        compound_ids = list(rng.choice(compounds, n_rows))
+        compound_ids[:3] = ["Z", f"U{target}", np.nan]
+        values[0] = 0
+        frames[target] = _frame(compound_ids, values)
+    return frames
+
+
+def _legacy_scores(frames):
+    """
+    Score columns of every frame, computed as compute_and_add_scores did before it was vectorized: one row at a
+    time against the concatenated other frames.
+    """
+    frames = {target: df.copy() for target, df in frames.items()}
+    for df in frames.values():
+        df["TARGET_VALUE"] = pd.to_numeric(df[REPLICATE_COLUMNS].mean(axis=1, skipna=True), errors="coerce")
+
+    for target, df in frames.items():
+        merged_other = pd.concat([d for t, d in frames.items() if t != target], ignore_index=True)
+        df["SELECTIVE_VALUE"] = df["COMPOUND_ID"].map(merged_other.groupby("COMPOUND_ID")["TARGET_VALUE"].max())
+        df["NTC_VALUE"] = df["COMPOUND_ID"].map(merged_other.groupby("COMPOUND_ID")["TARGET_VALUE"].min())
+        df["ENRICHMENT"] = df["TARGET_VALUE"] / df["NTC_VALUE"]
+        df["SELECTIVE_ENRICHMENT"] = df["TARGET_VALUE"] / df["SELECTIVE_VALUE"]
+
+        def compute_easms_enrichment(row):
+            other = merged_other[merged_other["COMPOUND_ID"] == row["COMPOUND_ID"]]
+            if other.empty:
+                return pd.Series([None, None])
+            other_mean = other[REPLICATE_COLUMNS].apply(pd.to_numeric, errors="coerce").mean(axis=1, skipna=True).mean()
+            if pd.isna(other_mean) or other_mean == 0:
+                return pd.Series([None, other_mean])
+            return pd.Series([row["TARGET_VALUE"] / other_mean, other_mean])
+
+        df[["EASMS_ENRICHMENT", "MEAN_NONTARGET_VALUES"]] = df.apply(compute_easms_enrichment, axis=1)
+        df["PVALUE"] = _reference_pvalues(df, merged_other)
+    return {target: df[SCORE_COLUMNS].apply(pd.to_numeric) for target, df in frames.items()}
+
+
+def _assert_scores_equal(frames, expected, rtol):
+    for target, df in frames.items():
+        for column in SCORE_COLUMNS:
+            np.testing.assert_allclose(
+                df[column].to_numpy(dtype=float), expected[target][column].to_numpy(dtype=float), rtol=rtol,
+                err_msg=f"{target} {column}"
+            )
+
+
+def test_merged_method_matches_legacy():
+    frames = _random_frames(1)
+    expected = _legacy_scores(frames)
+
+    add_scores_to_frames(frames, method="merged")
+
+    _assert_scores_equal(frames, expected, rtol=1e-9)
+    # per-compound aggregates are summed in the same order as the legacy loop
+    for target, df in frames.items():
+        for column in ["SELECTIVE_VALUE", "NTC_VALUE", "EASMS_ENRICHMENT", "MEAN_NONTARGET_VALUES"]:
+            np.testing.assert_array_equal(df[column].to_numpy(dtype=float), expected[target][column].to_numpy(dtype=float))
+
+
+def test_statistics_method_matches_legacy():
+    frames = _random_frames(1)
+    expected = _legacy_scores(frames)
+
+    add_scores_to_frames(frames, method="statistics")
+
+    _assert_scores_equal(frames, expected, rtol=1e-9)
+
+
+def test_update_scores_matches_full_recompute(tmp_path):
+    frames = _random_frames(2)
+    statistics_path = str(tmp_path / "ScoreStatistics.parquet")
+    add_scores_to_frames(frames, statistics_path=statistics_path)
+
+    # T1 is corrected, T4 is new and T2 is removed
+    new_frames = _random_frames(3, targets=("T1", "T4"))
+    del frames["T2"]
+    frames.update(new_frames)
+    updated = update_scores(
+        frames, TargetStatistics.load(statistics_path), changed_targets=["T1", "T4"], removed_targets=["T2"]
+    )
+
+    expected = {target: df[REPLICATE_COLUMNS + ["COMPOUND_ID"]].copy() for target, df in frames.items()}
+    add_scores_to_frames(expected)
+    assert set(updated) == set(frames)
+    _assert_scores_equal(frames, expected, rtol=1e-9)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly_selection import DEDUP_KEY, check_dedup_key, drop_duplicate_keys, filter_anomalous_data
+
+
+def _frame():
+    # 'CCO' and 'OCC' are two spellings of ethanol, with opposite enrichments
+    return pd.DataFrame({
+        "COMPOUND_ID": ["C1", "C2", "C3", "C3"],
+        "SMILES": ["CCO", "OCC", "c1ccccc1", "c1ccccc1"],
+        "ENRICHMENT": [0.5, 20.0, 2.0, 3.0],
+        "EASMS_ENRICHMENT": [0.5, 20.0, 2.0, 3.0],
+    })
+
+
+def test_groups_on_smiles_strings_by_default():
+    df = filter_anomalous_data(_frame(), "T0.csv")
+
+    assert df["COMPOUND_ID"].tolist() == ["C1", "C2", "C3"]
+    np.testing.assert_array_equal(df["EASMS_ENRICHMENT"], [0.5, 20.0, 3.0])
+    assert df["HAD_DUPLICATE_INTENSITY"].tolist() == ["N", "N", "Y"]
+
+
+def test_canonical_grouping():
+    df = filter_anomalous_data(_frame(), "T0.csv", canonical=True)
+
+    # the ethanol rows form one group with mixed enrichments, which is removed
+    assert df["COMPOUND_ID"].tolist() == ["C3"]
+    np.testing.assert_array_equal(df["EASMS_ENRICHMENT"], [3.0])
+
+
+def _random_frame(seed, n_rows=300):
+    rng = np.random.default_rng(seed)
+    smiles = np.array(["C" * i + "O" for i in range(1, 61)])
+    df = pd.DataFrame({
+        "COMPOUND_ID": [f"C{i}" for i in rng.integers(0, 60, n_rows)],
+        "SMILES": rng.choice(smiles, n_rows),
+        "POS_INT_REP1": rng.integers(0, 4, n_rows).astype(float),
+        "POS_INT_REP2": rng.lognormal(10, 1, n_rows),
+        "POS_INT_REP3": rng.lognormal(10, 1, n_rows),
+    })
+    # per SMILES, enrichments all <= 1, all > 1 or mixed, with ties and missing values
+    regime = dict(zip(smiles, rng.integers(0, 3, len(smiles))))
+    choices = {0: [0.2, 0.5, 1.0], 1: [1.5, 4.0, 20.0], 2: [0.2, 1.0, 4.0]}
+    df["EASMS_ENRICHMENT"] = [rng.choice(choices[regime[smi]]) for smi in df["SMILES"]]
+    df.loc[rng.random(n_rows) < 0.03, "EASMS_ENRICHMENT"] = np.nan
+    df["ENRICHMENT"] = df["EASMS_ENRICHMENT"] * 2
+    # full duplicates
+    return pd.concat([df, df.sample(40, random_state=seed)], ignore_index=True)
+
+
+def _legacy_filter(df):
+    # filter_anomalous_data before conflicts were resolved group-wise: one subset per conflicting SMILES
+    df_cleaned = df.drop_duplicates()
+    enrichment_groups = df_cleaned.groupby("SMILES")["ENRICHMENT"].nunique()
+    conflicting_smiles = enrichment_groups[enrichment_groups > 1].index.tolist()
+    rows_to_keep_df = pd.DataFrame(columns=df_cleaned.columns)
+    for smiles in conflicting_smiles:
+        subset = df_cleaned[df_cleaned["SMILES"] == smiles]
+        if subset["EASMS_ENRICHMENT"].max() <= 1:
+            rows_to_keep_df = pd.concat([rows_to_keep_df, subset.loc[[subset["EASMS_ENRICHMENT"].idxmin()]]], ignore_index=True)
+        elif subset["EASMS_ENRICHMENT"].min() > 1:
+            rows_to_keep_df = pd.concat([rows_to_keep_df, subset.loc[[subset["EASMS_ENRICHMENT"].idxmax()]]], ignore_index=True)
+    df_cleaned.loc[~df_cleaned["SMILES"].isin(conflicting_smiles), "HAD_DUPLICATE_INTENSITY"] = "N"
+    rows_to_keep_df["HAD_DUPLICATE_INTENSITY"] = "Y"
+    return pd.concat([df_cleaned[~df_cleaned["SMILES"].isin(conflicting_smiles)], rows_to_keep_df], ignore_index=True)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_grouped_resolution_matches_legacy(seed):
+    df = _random_frame(seed)
+    pd.testing.assert_frame_equal(filter_anomalous_data(df, "T0.csv"), _legacy_filter(df))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_dedup_key_matches_full_rows(seed):
+    df = _random_frame(seed)
+
+    assert check_dedup_key(df, DEDUP_KEY)
+    pd.testing.assert_frame_equal(filter_anomalous_data(df, "T0.csv", dedup_key=DEDUP_KEY), filter_anomalous_data(df, "T0.csv"))
+
+
+def test_drop_duplicate_keys_matches_drop_duplicates():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "COMPOUND_ID": rng.choice(["C1", "C2", "C3", None], 500),
+        "SMILES": rng.choice(["CCO", "CCN", "OCC"], 500),
+        "POS_INT_REP1": rng.choice([1.0, 2.0, np.nan], 500),
+        "LABEL": rng.integers(0, 2, 500),
+    })
+    key = ["COMPOUND_ID", "SMILES", "POS_INT_REP1"]
+
+    pd.testing.assert_frame_equal(drop_duplicate_keys(df, key), df.drop_duplicates(subset=key))
+    # rows repeating a key with a different LABEL are dropped by key only
+    assert not check_dedup_key(df, key)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_output import export_csv, finalize_dataset, read_dataset, write_target
+from fingerprint_extraction import extract_fingerprints
+from fingerprint_storage import fingerprints_to_strings
+
+
+def _target(target_id, smiles):
+    df = pd.DataFrame({
+        # ints and NaN in an object column, as after negatives are added
+        "ASMS_BATCH_NUM": pd.Series([1] * (len(smiles) - 1) + [np.nan], dtype=object),
+        "COMPOUND_ID": [f"{target_id}-{i}" for i in range(len(smiles))],
+        "SMILES": smiles,
+        "TARGET_ID": target_id,
+    })
+    df = extract_fingerprints(df, fp_format="array")
+    df["LABEL"] = np.arange(len(df)) % 2
+    return df
+
+
+@pytest.fixture
+def targets():
+    return {
+        "T0_AsmBatchNumber1": _target("T0", ["CCO", "not_a_smiles", "c1ccccc1O"]),
+        "T1_AsmBatchNumber1": _target("T1", ["CCN", "CC(=O)O"]),
+    }
+
+
+@pytest.fixture
+def dataset(targets, tmp_path):
+    root = str(tmp_path / "Dataset")
+    for base_name, df in targets.items():
+        write_target(df, root, base_name)
+    finalize_dataset(root)
+    return root
+
+
+def test_export_csv_matches_file_layout(targets, dataset, tmp_path):
+    export_dir = tmp_path / "exported"
+    export_csv(dataset, str(export_dir), "MLReadyPlusFPs_")
+
+    for base_name, df in targets.items():
+        expected = tmp_path / f"expected_{base_name}.csv"
+        fingerprints_to_strings(df).to_csv(expected, index=False)
+        assert (export_dir / f"MLReadyPlusFPs_{base_name}.csv").read_bytes() == expected.read_bytes()
+
+
+def test_read_dataset_restores_dtypes(targets, dataset):
+    df = read_dataset(dataset, filters=[("TARGET_ID", "=", "T0")])
+    expected = targets["T0_AsmBatchNumber1"]
+
+    assert df.columns[:len(expected.columns)].tolist() == expected.columns.tolist()
+    assert df["TARGET_ID"].dtype == expected["TARGET_ID"].dtype
+    assert df["TARGET_ID"].tolist() == ["T0"] * 3
+    for fp_name in ("ECFP4", "MACCS"):
+        assert df[fp_name][1] is None
+        for row, expected_row in zip(df[fp_name][[0, 2]], expected[fp_name][[0, 2]]):
+            assert row.dtype == expected_row.dtype
+            np.testing.assert_array_equal(row, expected_row)
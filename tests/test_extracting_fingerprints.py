@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import ExtractingFingerprints
+from ExtractingFingerprints import process_file_streaming
+from fingerprint_storage import load_fingerprint_matrix
+from fingerprints import HitGenECFP4, HitGenMACCS
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    # with chunksize=2, the last chunk holds only SMILES that do not parse
+    path = tmp_path / "input.csv"
+    pd.DataFrame({"id": range(6), "smiles": ["CCO", "c1ccccc1O", "CCN", "CC(=O)O", "not_a_smiles", "C1CC"]}).to_csv(
+        path, index=False
+    )
+    return str(path)
+
+
+def _fingerprints():
+    return {"ECFP4": HitGenECFP4(), "MACCS": HitGenMACCS()}
+
+
+def test_parquet_chunk_without_parseable_smiles(input_file, tmp_path):
+    output_file = str(tmp_path / "output.parquet")
+    process_file_streaming(input_file, output_file, _fingerprints(), chunksize=2)
+
+    assert not os.path.exists(output_file + ".checkpoint.json")
+    assert pq.read_metadata(output_file).num_row_groups == 3
+    matrix, valid = load_fingerprint_matrix(output_file, "ECFP4", return_valid=True)
+    assert matrix.shape == (6, HitGenECFP4()._dimension)
+    assert matrix.dtype == HitGenECFP4().fp_dtype()
+    np.testing.assert_array_equal(valid, [True, True, True, True, False, False])
+    assert not matrix[~valid].any()
+
+
+def test_parquet_resumes_at_chunk_without_parseable_smiles(input_file, tmp_path, monkeypatch):
+    expected_file = str(tmp_path / "expected.parquet")
+    process_file_streaming(input_file, expected_file, _fingerprints(), chunksize=2)
+
+    # interrupt the run just before the last chunk is written
+    output_file = str(tmp_path / "output.parquet")
+    add_fingerprint_columns = ExtractingFingerprints.add_fingerprint_columns
+
+    def interrupted(df, *args, row_offset=0, **kwargs):
+        if row_offset == 4:
+            raise KeyboardInterrupt
+        return add_fingerprint_columns(df, *args, row_offset=row_offset, **kwargs)
+
+    monkeypatch.setattr(ExtractingFingerprints, "add_fingerprint_columns", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        process_file_streaming(input_file, output_file, _fingerprints(), chunksize=2)
+    assert os.path.exists(output_file + ".checkpoint.json")
+
+    monkeypatch.setattr(ExtractingFingerprints, "add_fingerprint_columns", add_fingerprint_columns)
+    process_file_streaming(input_file, output_file, _fingerprints(), chunksize=2)
+
+    assert not os.path.exists(output_file + ".checkpoint.json")
+    assert pq.read_table(output_file).equals(pq.read_table(expected_file))
@@ -0,0 +1,128 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit import Chem
+from rdkit.Chem import Descriptors
+
+from fingerprint_extraction import default_fingerprint_classes, extract_fingerprints, featurize, featurize_unique
+from fingerprints import FingerprintCache, MULTI_RADIUS_MORGAN_PAIRS
+from test_fingerprints import FP_CLASSES
+
+SMILES = [
+    "CCO",
+    "not_a_smiles",
+    "c1ccccc1O",
+    "C[N+](C)(C)CC(=O)[O-]",
+    "C1CC",
+    "C[C@H](N)C(=O)O",
+    "CCO",
+    "[Na+].[Cl-]",
+    "OCC",
+    "O=C(O)c1ccc2c(c1)c1ccccc1n2Cc1ccc(-c2ccccc2)cc1",
+]
+
+
+def _legacy_extract(df):
+    # extract_fingerprints before SMILES were parsed once per row: one SMILES and one FP function at a time
+    fingerprint_data, molecular_props = [], []
+    for smiles in df["SMILES"]:
+        fps = {}
+        for fp_name, fp_class in default_fingerprint_classes().items():
+            try:
+                fps[fp_name] = ','.join(map(str, fp_class.generate_fps(smis=[smiles]).flatten()))
+            except Exception:
+                fps[fp_name] = ','.join(['nan'] * fp_class._dimension)
+        fingerprint_data.append(fps)
+        mol = Chem.MolFromSmiles(smiles)
+        molecular_props.append({
+            "MW": Descriptors.MolWt(mol) if mol else np.nan,
+            "ALOGP": Descriptors.MolLogP(mol) if mol else np.nan,
+        })
+    return pd.concat([df, pd.DataFrame(molecular_props), pd.DataFrame(fingerprint_data)], axis=1)
+
+
+def _legacy_fps(fp_class, smiles):
+    # as _legacy_extract, an FP function that raises gives a row of NaN
+    rows = []
+    for smi in smiles:
+        try:
+            rows.append(fp_class.generate_fps(smis=[smi]).flatten())
+        except Exception:
+            rows.append(np.full(fp_class._dimension, np.nan))
+    legacy = np.vstack(rows)
+    return legacy, ~np.isnan(legacy).any(axis=1)
+
+
+@pytest.fixture(scope="module")
+def legacy_output():
+    df = pd.DataFrame({"COMPOUND_ID": [f"C{i}" for i in range(len(SMILES))], "SMILES": SMILES})
+    return df, _legacy_extract(df)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_extract_fingerprints_matches_legacy(legacy_output, n_jobs):
+    df, expected = legacy_output
+    pd.testing.assert_frame_equal(extract_fingerprints(df, n_jobs=n_jobs), expected)
+
+
+def test_extract_fingerprints_with_cache_matches_legacy(legacy_output, tmp_path):
+    df, expected = legacy_output
+    cache = FingerprintCache(str(tmp_path / "fingerprints.sqlite"))
+    try:
+        for _ in ("cold", "warm"):
+            pd.testing.assert_frame_equal(extract_fingerprints(df, cache=cache), expected)
+    finally:
+        cache.close()
+
+
+@pytest.mark.parametrize("fp_type", FP_CLASSES, ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("options", [
+    {"backend": "legacy"},
+    {"backend": "native"},
+    {"backend": "native", "sparse": True},
+    {"backend": "native", "num_threads": 2},
+    {"backend": "native", "n_jobs": 2},
+], ids=lambda options: "-".join(f"{key}={value}" for key, value in options.items()))
+def test_featurize_matches_legacy(fp_type, options):
+    fp_class = fp_type()
+    legacy, expected_valid = _legacy_fps(fp_class, SMILES)
+
+    fp_arrays, _, valid = featurize(SMILES, {"FP": fp_class}, compute_properties=False, **options)
+
+    fps = fp_arrays["FP"].toarray() if options.get("sparse") else fp_arrays["FP"]
+    np.testing.assert_array_equal(valid, expected_valid)
+    assert fps.dtype == fp_class.fp_dtype()
+    np.testing.assert_array_equal(fps[valid], legacy[valid])
+    assert not fps[~valid].any()
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_featurize_multi_radius_pairs_match_legacy(sparse):
+    fps_dict = {}
+    for radius2_type, radius3_type in MULTI_RADIUS_MORGAN_PAIRS:
+        fps_dict[radius2_type.__name__] = radius2_type()
+        fps_dict[radius3_type.__name__] = radius3_type()
+
+    fp_arrays, _, valid = featurize(SMILES, fps_dict, compute_properties=False, sparse=sparse)
+
+    for fp_name, fp_class in fps_dict.items():
+        legacy, expected_valid = _legacy_fps(fp_class, SMILES)
+        fps = fp_arrays[fp_name].toarray() if sparse else fp_arrays[fp_name]
+        np.testing.assert_array_equal(valid, expected_valid)
+        np.testing.assert_array_equal(fps[valid], legacy[valid])
+        assert not fps[~valid].any()
+
+
+def test_featurize_unique_in_existing_pool():
+    expected = featurize_unique([SMILES])
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        actual = featurize_unique([SMILES], n_jobs=2, executor=pool)
+
+    assert actual["index"].equals(expected["index"])
+    np.testing.assert_array_equal(actual["valid"], expected["valid"])
+    np.testing.assert_array_equal(actual["molecular_props"], expected["molecular_props"])
+    for fp_name in default_fingerprint_classes():
+        assert actual["fp_arrays"][fp_name].dtype == expected["fp_arrays"][fp_name].dtype
+        np.testing.assert_array_equal(actual["fp_arrays"][fp_name], expected["fp_arrays"][fp_name])
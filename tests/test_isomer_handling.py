@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from isomer_handling import handle_isomers
+
+
+def _legacy_handle_isomers(df):
+    # handle_isomers before the explode was vectorized: one copied row per isomer
+    isomer_rows = df[df["SMILES"].str.contains(";", na=False)]
+    expanded_rows = []
+    for _, row in isomer_rows.iterrows():
+        compound_ids = row["COMPOUND_ID"].split(";")
+        compound_formulas = row["COMPOUND_FORMULA"].split(";")
+        smiles_list = row["SMILES"].split(";")
+        if not (len(compound_ids) == len(compound_formulas) == len(smiles_list)):
+            raise ValueError(f"Inconsistent isomer data in row: {row}")
+        for i, (comp_id, comp_formula, smile) in enumerate(zip(compound_ids, compound_formulas, smiles_list)):
+            new_row = row.copy()
+            new_row["COMPOUND_ID"] = comp_id
+            new_row["COMPOUND_FORMULA"] = comp_formula
+            new_row["SMILES"] = smile
+            new_row["ISOMERS"] = ";".join([x for j, x in enumerate(compound_ids) if j != i])
+            expanded_rows.append(new_row)
+
+    df = pd.concat([df[~df["SMILES"].str.contains(";", na=False)], pd.DataFrame(expanded_rows)], ignore_index=True)
+    if "ISOMERS" not in df.columns:
+        df["ISOMERS"] = ""
+    else:
+        df["ISOMERS"] = df["ISOMERS"].fillna("")
+    return df
+
+
+def _random_frame(seed, n_rows=200):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_rows):
+        n_isomers = rng.choice([1, 1, 2, 3])
+        ids = [f"C{i}_{j}" for j in range(n_isomers)]
+        rows.append({
+            "ASMS_BATCH_NUM": int(rng.integers(1, 3)),
+            "COMPOUND_ID": ";".join(ids),
+            "COMPOUND_FORMULA": ";".join(f"F{i}_{j}" for j in range(n_isomers)),
+            "SMILES": ";".join("C" * (j + 1) + "O" for j in range(n_isomers)),
+            "TARGET_ID": "T0",
+            "ENRICHMENT": rng.lognormal(0, 1),
+            "PVALUE": np.nan if rng.random() < 0.1 else rng.random(),
+        })
+    df = pd.DataFrame(rows)
+    df.loc[rng.random(n_rows) < 0.05, "SMILES"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_explode_matches_legacy(seed):
+    df = _random_frame(seed)
+    pd.testing.assert_frame_equal(handle_isomers(df, "T0.csv"), _legacy_handle_isomers(df))
+
+
+def test_without_isomers():
+    df = _random_frame(0)
+    df = df[~df["SMILES"].str.contains(";", na=False)]
+
+    result = handle_isomers(df, "T0.csv")
+
+    pd.testing.assert_frame_equal(result, _legacy_handle_isomers(df))
+    assert (result["ISOMERS"] == "").all()
+
+
+def test_inconsistent_isomers():
+    df = _random_frame(0)
+    row = df["SMILES"].str.contains(";", na=False).idxmax()
+    df.loc[row, "COMPOUND_FORMULA"] = "F"
+
+    with pytest.raises(ValueError, match="Inconsistent isomer data"):
+        _legacy_handle_isomers(df)
+    with pytest.raises(ValueError, match="Inconsistent isomer data"):
+        handle_isomers(df, "T0.csv")
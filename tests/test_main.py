@@ -0,0 +1,146 @@
+import contextlib
+import functools
+import io
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Main
+from canonicalization import CANONICALIZER
+from masterlists import MASTER_LISTS
+
+
+def test_estimate_raw_file_memory_counts_rows(tmp_path):
+    path = tmp_path / "batch.csv"
+    path.write_text("SMILES,TARGET_ID\n" + "".join(f"C{'C' * i}O,T0\n" for i in range(5)))
+
+    assert Main.estimate_raw_file_memory(str(path)) == 5 * Main.RAW_FILE_ROW_MEMORY
+
+
+def test_nested_worker_pools_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="cannot both be greater than 1"):
+        Main.process_csv_files(
+            str(tmp_path), str(tmp_path), str(tmp_path), str(tmp_path), str(tmp_path), str(tmp_path),
+            str(tmp_path / "MasterList_Information.xlsx"), [], [], curation_workers=2, raw_file_workers=2
+        )
+
+
+def _worker_state(library):
+    # loaded master lists, and SMILES canonicalized in the worker go to the attached store
+    CANONICALIZER.canonicalize_many(["OC(C)C"])
+    return os.path.abspath(library) in MASTER_LISTS._frames
+
+
+def test_spawned_workers_are_set_up(tmp_path):
+    masterlist_info = tmp_path / "MasterList_Information.xlsx"
+    library = tmp_path / "Library.xlsx"
+    store = tmp_path / "CanonicalSmiles.sqlite"
+    pd.DataFrame({"FileName": ["raw.csv"], "MaterListName": ["Library"]}).to_excel(masterlist_info, index=False)
+    pd.DataFrame({"SMILES": ["OCC", "c1ccccc1"], "SGC ID for Component": ["L1", "L2"]}).to_excel(library, index=False)
+
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=Main._init_pipeline_worker,
+        initargs=(str(tmp_path), str(masterlist_info), str(store), True)
+    ) as pool:
+        assert pool.submit(_worker_state, str(library)).result()
+
+    with sqlite3.connect(store) as conn:
+        assert conn.execute("SELECT canonical FROM smiles_alias WHERE smiles = 'OC(C)C'").fetchone() == ("CC(C)O",)
+
+
+LIBRARY_SMILES = ["CCO", "c1ccccc1O", "CCN", "CC(=O)O", "CCOC", "c1ccncc1", "CC(C)O", "OCCO", "CCCl", "C1CCCCC1", "not_a_smiles"]
+DESIRED_COLUMNS = [
+    "ASMS_BATCH_NUM", "COMPOUND_ID", "COMPOUND_FORMULA", "SMILES", "POOL_NAME", "TARGET_ID", "POS_INT_REP1",
+    "POS_INT_REP2", "POS_INT_REP3", "TARGET_INTENSITY_VALUE", "SELECTIVE_VALUE", "NTC_VALUE", "ENRICHMENT", "PVALUE",
+    "BINARY_LABEL", "HAD_DUPLICATE_INTENSITY", "ISOMERS", "EASMS_ENRICHMENT", "NONTARGET_INTENSITY_VALUE", "LABEL",
+    "AIRCHECK_LABEL", "MW", "ALOGP", "ECFP4", "MACCS", "ATOMPAIR",
+]
+DESIRED_COLUMNS2 = ["COMPOUND_ID", "SMILES", "TARGET_ID", "EASMS_ENRICHMENT", "PVALUE", "LABEL", "MW", "ECFP4"]
+
+
+@pytest.fixture(scope="module")
+def pipeline_input(tmp_path_factory):
+    """Two raw files of three targets each, with isomer rows, full duplicates and a SMILES RDKit cannot parse."""
+    root = tmp_path_factory.mktemp("input")
+    os.makedirs(root / "RawData")
+    os.makedirs(root / "MasterLists")
+    n = len(LIBRARY_SMILES)
+    pd.DataFrame({
+        "SGC ID for Component": [f"C{i}" for i in range(n)], "SMILES": LIBRARY_SMILES,
+        "formula": [f"F{i}" for i in range(n)], "SGC ID for Pool": [f"P{i % 3}" for i in range(n)],
+    }).to_excel(root / "MasterLists" / "Library.xlsx", index=False)
+    pd.DataFrame({"FileName": ["batch1.csv", "batch2.csv"], "MaterListName": ["Library", "Library"]}).to_excel(
+        root / "MasterLists" / "MasterList_Information.xlsx", index=False
+    )
+
+    rng = np.random.default_rng(0)
+    for batch in (1, 2):
+        rows = []
+        for target in range(3):
+            for i in rng.choice(n, 7, replace=False):
+                reps = rng.lognormal(10, 1) * (8 if rng.random() < 0.3 else 1) * rng.lognormal(0, 0.3, 3)
+                rows.append(dict(
+                    ASMS_BATCH_NUM=batch, COMPOUND_ID=f"C{i}", COMPOUND_FORMULA=f"F{i}", SMILES=LIBRARY_SMILES[i],
+                    POOL_NAME=f"P{i % 3}", PROTEIN_NUMBER=target, TARGET_ID=f"T{target}",
+                    POS_INT_REP1=reps[0], POS_INT_REP2=reps[1], POS_INT_REP3=reps[2],
+                ))
+            rows.append(dict(rows[-1], COMPOUND_ID="C0;C1", COMPOUND_FORMULA="F0;F1", SMILES="CCO;c1ccccc1O"))
+            rows.append(dict(rows[-1]))
+        pd.DataFrame(rows).to_csv(root / "RawData" / f"batch{batch}.csv", index=False)
+    return root
+
+
+def _run_pipeline(pipeline_input, output_root, round_trip=False, **options):
+    """Runs process_csv_files and returns the bytes of every output file, by path relative to output_root.
+
+    With round_trip, CSV files are parsed with float_precision="round_trip" (in this process only).
+    """
+    dirs = [str(output_root / name) for name in ("Separated_Files", "MLReady", "MLReady_Plus_FPs", "MLReady_Plus_FPs_2")]
+    for directory in dirs:
+        os.makedirs(directory)
+    read_csv = functools.partial(pd.read_csv, float_precision="round_trip") if round_trip else pd.read_csv
+    with contextlib.redirect_stdout(io.StringIO()), mock.patch.object(pd, "read_csv", read_csv):
+        Main.process_csv_files(
+            str(pipeline_input / "RawData"), str(pipeline_input / "MasterLists"), *dirs,
+            str(pipeline_input / "MasterLists" / "MasterList_Information.xlsx"), DESIRED_COLUMNS, DESIRED_COLUMNS2,
+            **options
+        )
+    outputs = {}
+    for directory in dirs[1:]:
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), "rb") as f:
+                outputs[os.path.join(os.path.basename(directory), name)] = f.read()
+    return outputs
+
+
+@pytest.fixture(scope="module")
+def serial_output(pipeline_input, tmp_path_factory):
+    return _run_pipeline(pipeline_input, tmp_path_factory.mktemp("serial"))
+
+
+@pytest.mark.parametrize("separated_format", ["parquet", None])
+def test_in_memory_separation_writes_the_same_files(pipeline_input, tmp_path, separated_format):
+    # the CSV round-trip of the separated files is exact only with the round_trip float parser
+    expected = _run_pipeline(pipeline_input, tmp_path / "csv", round_trip=True)
+    outputs = _run_pipeline(pipeline_input, tmp_path / "memory", round_trip=True, separated_format=separated_format)
+
+    assert len(expected) == 36
+    assert outputs == expected
+
+
+@pytest.mark.parametrize("options", [
+    {"curation_workers": 2},
+    {"curation_workers": 2, "fingerprint_scope": "run"},
+    {"raw_file_workers": 2},
+], ids=lambda options: "-".join(f"{key}={value}" for key, value in options.items()))
+def test_parallel_curation_writes_the_same_files(pipeline_input, serial_output, tmp_path, options):
+    outputs = _run_pipeline(pipeline_input, tmp_path, **options)
+
+    assert len(serial_output) == 36
+    assert outputs == serial_output
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from produce_ml_labels import generate_ml_labels
+
+
+def _legacy_labels(df):
+    # generate_ml_labels before the rule table: assign_label applied row by row
+    df["EASMS_ENRICHMENT"] = pd.to_numeric(df["EASMS_ENRICHMENT"].replace("", np.nan), errors="coerce")
+    df["PVALUE"] = pd.to_numeric(df["PVALUE"].replace("", np.nan), errors="coerce")
+
+    def assign_label(row):
+        enrichment = row["EASMS_ENRICHMENT"]
+        pvalue = row["PVALUE"]
+        isomer = str(row["ISOMERS"]).strip()
+
+        if pd.isna(enrichment):
+            return -2
+        elif enrichment >= 5 and pvalue <= 0.05 and isomer != 'nan' and isomer != "":
+            return 3
+        elif 5 <= enrichment < 10 and pvalue <= 0.05:
+            return 2
+        elif enrichment >= 10 and pvalue <= 0.05:
+            return 1
+        elif 0 <= enrichment <= 1 or pvalue > 0.05:
+            return 0
+        elif 1 < enrichment < 5 and pvalue <= 0.05:
+            return -1
+        else:
+            return -2
+
+    df["AIRCHECK_LABEL"] = df.apply(assign_label, axis=1).astype("int8")
+    if "HAD_DUPLICATE_INTENSITY" in df.columns:
+        mask = (df["HAD_DUPLICATE_INTENSITY"] == "Y") & (df["EASMS_ENRICHMENT"] > 5)
+        df.loc[mask, "AIRCHECK_LABEL"] = 4
+    return df
+
+
+def _random_frame(seed, n_rows=500, object_columns=False):
+    rng = np.random.default_rng(seed)
+    # values on and around every rule boundary, negative enrichments and missing values
+    enrichment = rng.choice([-1.0, 0.0, 0.5, 1.0, 1.01, 3.0, 5.0, 7.5, 10.0, 25.0, np.nan], n_rows)
+    pvalue = rng.choice([0.0, 0.01, 0.05, 0.0501, 0.5, np.nan], n_rows)
+    df = pd.DataFrame({
+        "EASMS_ENRICHMENT": enrichment,
+        "PVALUE": pvalue,
+        "ISOMERS": rng.choice(["", " ", "C7", "C7;C8", None], n_rows),
+        "HAD_DUPLICATE_INTENSITY": rng.choice(["Y", "N"], n_rows),
+    })
+    if object_columns:
+        # as read back from files with empty cells
+        for column in ("EASMS_ENRICHMENT", "PVALUE"):
+            values = df[column].astype(object)
+            values[rng.random(n_rows) < 0.1] = ""
+            df[column] = values
+    return df
+
+
+@pytest.mark.parametrize("object_columns", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_labels_match_legacy(seed, object_columns):
+    df = _random_frame(seed, object_columns=object_columns)
+    expected = _legacy_labels(df.copy())
+
+    result = generate_ml_labels(df.copy())
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert set(result["AIRCHECK_LABEL"]) == {-2, -1, 0, 1, 2, 3, 4}
+
+
+def test_without_duplicate_column():
+    df = _random_frame(0).drop(columns="HAD_DUPLICATE_INTENSITY")
+    pd.testing.assert_frame_equal(generate_ml_labels(df.copy()), _legacy_labels(df.copy()))
@@ -1,5 +1,5 @@
 import numpy as np
-from rdkit.Chem import MolFromSmiles
+from rdkit.Chem import MolFromSmiles, MolToSmiles
 from rdkit.Chem.rdchem import Mol
 
 
@@ -14,6 +14,16 @@ def to_mol(smi):
         return MolFromSmiles(smi)
 
 
+def canonical_smiles(smi):
+    """
+    Returns the RDKit canonical SMILES of a SMILES or Mol, or None if it cannot be parsed
+    """
+    mol = to_mol(smi)
+    if mol is None:
+        return None
+    return MolToSmiles(mol)
+
+
 def catch_boost_argument_error(e) -> bool:
     """
     This ugly code is to try and catch the Boost.Python.ArgumentError that rdkit throws when you pass an argument of